@@ -0,0 +1,87 @@
+"""Message mirror upsert
+
+Revision ID: 3d8f6b2a9c17
+Revises: a7c3e5f19d42
+Create Date: 2026-10-19 17:41:26.502871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d8f6b2a9c17'
+down_revision: Union[str, None] = 'a7c3e5f19d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# An update mirrored as DELETE then INSERT raised a unique violation when services.cli.partition_messages had
+# copied the row in a transaction still open: the DELETE did not see the row, the INSERT then waited for it
+MIRROR_UPSERT_FUNCTION = """
+        CREATE OR REPLACE FUNCTION mirror_message_to_partitioned()
+        RETURNS TRIGGER AS $$
+        BEGIN
+          IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (OLD.chat_id, OLD.id) <> (NEW.chat_id, NEW.id)) THEN
+            DELETE FROM message_partitioned WHERE chat_id = OLD.chat_id AND id = OLD.id;
+          END IF;
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO message_partitioned (id, chat_id, user_id, content, timestamp, seq, client_msg_id)
+            VALUES (NEW.id, NEW.chat_id, NEW.user_id, NEW.content, NEW.timestamp, NEW.seq, NEW.client_msg_id)
+            ON CONFLICT (chat_id, id) DO UPDATE SET
+              user_id = EXCLUDED.user_id,
+              content = EXCLUDED.content,
+              timestamp = EXCLUDED.timestamp,
+              seq = EXCLUDED.seq,
+              client_msg_id = EXCLUDED.client_msg_id;
+          END IF;
+          RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+"""
+MIRROR_FUNCTION = """
+        CREATE OR REPLACE FUNCTION mirror_message_to_partitioned()
+        RETURNS TRIGGER AS $$
+        BEGIN
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM message_partitioned WHERE chat_id = OLD.chat_id AND id = OLD.id;
+          END IF;
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO message_partitioned (id, chat_id, user_id, content, timestamp, seq, client_msg_id)
+            VALUES (NEW.id, NEW.chat_id, NEW.user_id, NEW.content, NEW.timestamp, NEW.seq, NEW.client_msg_id);
+          END IF;
+          RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    The mirror only exists until services.cli.partition_messages swapped the tables.
+    """
+    op.execute(f"""
+        DO $migration$
+        BEGIN
+          IF to_regclass('message_partitioned') IS NOT NULL THEN
+            EXECUTE $mirror${MIRROR_UPSERT_FUNCTION}$mirror$;
+          END IF;
+        END;
+        $migration$;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(f"""
+        DO $migration$
+        BEGIN
+          IF to_regclass('message_partitioned') IS NOT NULL THEN
+            EXECUTE $mirror${MIRROR_FUNCTION}$mirror$;
+          END IF;
+        END;
+        $migration$;
+    """)
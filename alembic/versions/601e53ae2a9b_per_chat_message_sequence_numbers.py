@@ -0,0 +1,99 @@
+"""Per-chat message sequence numbers
+
+Revision ID: 601e53ae2a9b
+Revises: d57e484dbb45
+Create Date: 2026-10-19 12:18:48.845855
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '601e53ae2a9b'
+down_revision: Union[str, None] = 'd57e484dbb45'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat', sa.Column('last_seq', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('message', sa.Column('seq', sa.Integer(), nullable=True))
+    op.add_column('read_progress', sa.Column('last_read_seq', sa.Integer(), server_default=sa.text('0'),
+                                             nullable=False))
+    op.execute("""
+        UPDATE message
+        SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_id ORDER BY id) AS seq FROM message
+        ) AS numbered
+        WHERE message.id = numbered.id;
+    """)
+    op.execute("""
+        UPDATE chat
+        SET last_seq = coalesce((SELECT max(seq) FROM message WHERE message.chat_id = chat.id), 0);
+    """)
+    op.execute("""
+        UPDATE read_progress
+        SET last_read_seq = (
+            SELECT count(*) FROM message
+            WHERE message.chat_id = read_progress.chat_id AND message.id <= read_progress.last_read_message_id
+        );
+    """)
+    op.alter_column('message', 'seq', nullable=False)
+    op.create_unique_constraint('uq_message_chat_id_seq', 'message', ['chat_id', 'seq'])
+    op.execute("""
+        CREATE OR REPLACE FUNCTION assign_message_seq()
+        RETURNS TRIGGER AS $$
+        BEGIN
+          IF NEW.seq IS NULL THEN
+            UPDATE chat SET last_seq = last_seq + 1 WHERE id = NEW.chat_id RETURNING last_seq INTO NEW.seq;
+          ELSE
+            -- Messages inserted with their seq (imports) only touch the chat row when they move last_seq
+            UPDATE chat SET last_seq = NEW.seq WHERE id = NEW.chat_id AND last_seq < NEW.seq;
+          END IF;
+          RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER assign_message_seq
+        BEFORE INSERT ON message
+        FOR EACH ROW
+        EXECUTE FUNCTION assign_message_seq();
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION assign_read_progress_seq()
+        RETURNS TRIGGER AS $$
+        DECLARE
+          read_seq INTEGER;
+        BEGIN
+          SELECT seq INTO read_seq FROM message WHERE id = NEW.last_read_message_id AND chat_id = NEW.chat_id;
+          IF read_seq IS NOT NULL THEN
+            NEW.last_read_seq := read_seq;
+          END IF;
+          RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER assign_read_progress_seq
+        BEFORE INSERT OR UPDATE OF last_read_message_id ON read_progress
+        FOR EACH ROW
+        EXECUTE FUNCTION assign_read_progress_seq();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER assign_read_progress_seq ON read_progress')
+    op.execute('DROP FUNCTION assign_read_progress_seq()')
+    op.execute('DROP TRIGGER assign_message_seq ON message')
+    op.execute('DROP FUNCTION assign_message_seq()')
+    op.drop_constraint('uq_message_chat_id_seq', 'message', type_='unique')
+    op.drop_column('read_progress', 'last_read_seq')
+    op.drop_column('message', 'seq')
+    op.drop_column('chat', 'last_seq')
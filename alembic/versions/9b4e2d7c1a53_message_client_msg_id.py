@@ -0,0 +1,74 @@
+"""Message client_msg_id
+
+Revision ID: 9b4e2d7c1a53
+Revises: f3a9c1d27b64
+Create Date: 2026-10-19 16:05:42.118903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4e2d7c1a53'
+down_revision: Union[str, None] = 'f3a9c1d27b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MIRROR_FUNCTION = """
+        CREATE OR REPLACE FUNCTION mirror_message_to_partitioned()
+        RETURNS TRIGGER AS $$
+        BEGIN
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM message_partitioned WHERE chat_id = OLD.chat_id AND id = OLD.id;
+          END IF;
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO message_partitioned (id, chat_id, user_id, content, timestamp, seq{columns})
+            VALUES (NEW.id, NEW.chat_id, NEW.user_id, NEW.content, NEW.timestamp, NEW.seq{values});
+          END IF;
+          RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    The key is unique per chat and author. A unique constraint of the partitioned table has to include
+    the partition key, and NULL keys of messages sent without one never conflict.
+    """
+    op.add_column('message', sa.Column('client_msg_id', sa.String(), nullable=True))
+    op.create_unique_constraint('uq_message_chat_id_user_id_client_msg_id', 'message',
+                                ['chat_id', 'user_id', 'client_msg_id'])
+    # Until services.cli.partition_messages swapped the tables the partitioned copy needs the column as well
+    op.execute(f"""
+        DO $migration$
+        BEGIN
+          IF to_regclass('message_partitioned') IS NOT NULL THEN
+            ALTER TABLE message_partitioned ADD COLUMN client_msg_id VARCHAR;
+            ALTER TABLE message_partitioned ADD CONSTRAINT uq_message_partitioned_chat_id_user_id_client_msg_id
+            UNIQUE (chat_id, user_id, client_msg_id);
+            EXECUTE $mirror${MIRROR_FUNCTION.format(columns=', client_msg_id', values=', NEW.client_msg_id')}$mirror$;
+          END IF;
+        END;
+        $migration$;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(f"""
+        DO $migration$
+        BEGIN
+          IF to_regclass('message_partitioned') IS NOT NULL THEN
+            EXECUTE $mirror${MIRROR_FUNCTION.format(columns='', values='')}$mirror$;
+            ALTER TABLE message_partitioned DROP COLUMN client_msg_id;
+          END IF;
+        END;
+        $migration$;
+    """)
+    op.drop_constraint('uq_message_chat_id_user_id_client_msg_id', 'message', type_='unique')
+    op.drop_column('message', 'client_msg_id')
@@ -0,0 +1,87 @@
+"""Message archive seq lookup
+
+Revision ID: a7c3e5f19d42
+Revises: 9b4e2d7c1a53
+Create Date: 2026-10-19 17:04:52.118730
+
+"""
+import json
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e5f19d42'
+down_revision: Union[str, None] = '9b4e2d7c1a53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Progress pointing at an archived message got no seq from the trigger, which only looked in the hot table,
+# so last_read_seq stayed behind and unread counts were overstated
+TRIGGER_FUNCTION = """
+        CREATE OR REPLACE FUNCTION assign_read_progress_seq()
+        RETURNS TRIGGER AS $$
+        DECLARE
+          read_seq INTEGER;
+        BEGIN
+          SELECT seq INTO read_seq FROM message WHERE id = NEW.last_read_message_id AND chat_id = NEW.chat_id;
+          {archive}
+          IF read_seq IS NOT NULL THEN
+            NEW.last_read_seq := read_seq;
+          END IF;
+          RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+"""
+ARCHIVE_LOOKUP = """IF read_seq IS NULL THEN
+            SELECT message_seqs[array_position(message_ids, NEW.last_read_message_id)] INTO read_seq
+            FROM message_archive
+            WHERE chat_id = NEW.chat_id AND first_message_id <= NEW.last_read_message_id
+            ORDER BY first_message_id DESC
+            LIMIT 1;
+          END IF;"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('message_archive', sa.Column('message_ids', postgresql.ARRAY(sa.Integer()), nullable=True))
+    op.add_column('message_archive', sa.Column('message_seqs', postgresql.ARRAY(sa.Integer()), nullable=True))
+    conn = op.get_bind()
+    blocks = conn.execute(sa.text('SELECT chat_id, first_message_id, payload FROM message_archive'))
+    for block in blocks.all():
+        rows = json.loads(zlib.decompress(block.payload))
+        conn.execute(
+            sa.text(
+                'UPDATE message_archive SET message_ids = :ids, message_seqs = :seqs '
+                'WHERE chat_id = :chat_id AND first_message_id = :first_message_id'
+            ),
+            {
+                'ids': [row[0] for row in rows],
+                'seqs': [row[1] for row in rows],
+                'chat_id': block.chat_id,
+                'first_message_id': block.first_message_id
+            }
+        )
+    op.alter_column('message_archive', 'message_ids', nullable=False)
+    op.alter_column('message_archive', 'message_seqs', nullable=False)
+    op.execute(TRIGGER_FUNCTION.replace('{archive}', ARCHIVE_LOOKUP))
+    op.execute("""
+        UPDATE read_progress progress
+        SET last_read_seq = archive.message_seqs[array_position(archive.message_ids, progress.last_read_message_id)]
+        FROM message_archive archive
+        WHERE archive.chat_id = progress.chat_id
+          AND progress.last_read_message_id BETWEEN archive.first_message_id AND archive.last_message_id
+          AND progress.last_read_message_id = ANY(archive.message_ids);
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(TRIGGER_FUNCTION.replace('{archive}', ''))
+    op.drop_column('message_archive', 'message_seqs')
+    op.drop_column('message_archive', 'message_ids')
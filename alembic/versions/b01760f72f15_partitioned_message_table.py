@@ -0,0 +1,89 @@
+"""Partitioned message table
+
+Revision ID: b01760f72f15
+Revises: 601e53ae2a9b
+Create Date: 2026-10-19 12:22:14.209263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b01760f72f15'
+down_revision: Union[str, None] = '601e53ae2a9b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MESSAGE_PARTITIONS = 16
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Creates message_partitioned, hash partitioned on chat_id, and a trigger mirroring every change
+    of message into it. The rows are then copied and the tables swapped online with
+    `python -m services.cli.partition_messages`.
+    """
+    # A foreign key cannot reference message.id alone once the table is partitioned
+    op.drop_constraint('read_progress_last_read_message_id_fkey', 'read_progress', type_='foreignkey')
+    op.execute("""
+        CREATE TABLE message_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('message_id_seq'),
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            content VARCHAR NOT NULL,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() at time zone 'utc'),
+            seq INTEGER NOT NULL,
+            CONSTRAINT message_partitioned_pkey PRIMARY KEY (chat_id, id),
+            CONSTRAINT uq_message_partitioned_chat_id_seq UNIQUE (chat_id, seq),
+            CONSTRAINT message_partitioned_chat_id_fkey FOREIGN KEY (chat_id) REFERENCES chat (id),
+            CONSTRAINT message_partitioned_user_id_fkey FOREIGN KEY (user_id) REFERENCES "user" (id)
+        ) PARTITION BY HASH (chat_id);
+    """)
+    for remainder in range(MESSAGE_PARTITIONS):
+        op.execute(f"""
+            CREATE TABLE message_p{remainder:02d} PARTITION OF message_partitioned
+            FOR VALUES WITH (MODULUS {MESSAGE_PARTITIONS}, REMAINDER {remainder});
+        """)
+    op.execute("""
+        CREATE TRIGGER assign_message_seq
+        BEFORE INSERT ON message_partitioned
+        FOR EACH ROW
+        EXECUTE FUNCTION assign_message_seq();
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION mirror_message_to_partitioned()
+        RETURNS TRIGGER AS $$
+        BEGIN
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM message_partitioned WHERE chat_id = OLD.chat_id AND id = OLD.id;
+          END IF;
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO message_partitioned (id, chat_id, user_id, content, timestamp, seq)
+            VALUES (NEW.id, NEW.chat_id, NEW.user_id, NEW.content, NEW.timestamp, NEW.seq);
+          END IF;
+          RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER mirror_message_to_partitioned
+        AFTER INSERT OR UPDATE OR DELETE ON message
+        FOR EACH ROW
+        EXECUTE FUNCTION mirror_message_to_partitioned();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Only possible before the swap, while message is still the plain table.
+    """
+    op.execute('DROP TRIGGER mirror_message_to_partitioned ON message')
+    op.execute('DROP FUNCTION mirror_message_to_partitioned()')
+    op.execute('DROP TABLE message_partitioned')
+    op.create_foreign_key('read_progress_last_read_message_id_fkey', 'read_progress', 'message',
+                          ['last_read_message_id'], ['id'])
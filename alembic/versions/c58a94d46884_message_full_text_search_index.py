@@ -0,0 +1,40 @@
+"""Message full text search index
+
+Revision ID: c58a94d46884
+Revises: c908f2cbf59d
+Create Date: 2026-10-19 12:27:17.530057
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c58a94d46884'
+down_revision: Union[str, None] = 'c908f2cbf59d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE INDEX ix_message_content_tsv ON message USING gin (to_tsvector('simple', content))")
+    # Until services.cli.partition_messages swapped the tables the partitioned copy needs its own index
+    op.execute("""
+        DO $$
+        BEGIN
+          IF to_regclass('message_partitioned') IS NOT NULL THEN
+            CREATE INDEX ix_message_partitioned_content_tsv ON message_partitioned
+            USING gin (to_tsvector('simple', content));
+          END IF;
+        END;
+        $$;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP INDEX IF EXISTS ix_message_partitioned_content_tsv')
+    op.execute('DROP INDEX ix_message_content_tsv')
@@ -0,0 +1,40 @@
+"""Message archive
+
+Revision ID: c908f2cbf59d
+Revises: b01760f72f15
+Create Date: 2026-10-19 12:26:04.849145
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c908f2cbf59d'
+down_revision: Union[str, None] = 'b01760f72f15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('message_archive',
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('first_message_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=False),
+    sa.Column('first_seq', sa.Integer(), nullable=False),
+    sa.Column('last_seq', sa.Integer(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('user_counts', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('payload', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ),
+    sa.PrimaryKeyConstraint('chat_id', 'first_message_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('message_archive')
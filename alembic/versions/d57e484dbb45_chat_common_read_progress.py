@@ -0,0 +1,87 @@
+"""Chat common read progress
+
+Revision ID: d57e484dbb45
+Revises: b2b5ef6d7efd
+Create Date: 2026-10-19 12:17:46.677467
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd57e484dbb45'
+down_revision: Union[str, None] = 'b2b5ef6d7efd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat', sa.Column('common_read_message_id', sa.Integer(), nullable=True))
+    op.create_index('ix_read_progress_chat_id_last_read_message_id', 'read_progress',
+                    ['chat_id', 'last_read_message_id'], unique=False)
+    op.execute("""
+        UPDATE chat
+        SET common_read_message_id = (
+            SELECT min(last_read_message_id) FROM read_progress WHERE read_progress.chat_id = chat.id
+        );
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION update_chat_common_read_progress()
+        RETURNS TRIGGER AS $$
+        DECLARE
+          affected_chat_id INTEGER;
+          common_progress INTEGER;
+        BEGIN
+          IF TG_OP = 'DELETE' THEN
+            affected_chat_id := OLD.chat_id;
+          ELSE
+            affected_chat_id := NEW.chat_id;
+          END IF;
+
+          -- The row lock serializes concurrent progress changes of the same chat. NO KEY UPDATE does not
+          -- conflict with the KEY SHARE lock the read_progress foreign key check already holds on the chat row.
+          SELECT common_read_message_id INTO common_progress FROM chat WHERE id = affected_chat_id FOR NO KEY UPDATE;
+
+          IF TG_OP = 'INSERT' THEN
+            IF common_progress IS NULL OR NEW.last_read_message_id < common_progress THEN
+              UPDATE chat SET common_read_message_id = NEW.last_read_message_id WHERE id = affected_chat_id;
+            END IF;
+          ELSIF TG_OP = 'UPDATE' THEN
+            IF NEW.last_read_message_id < common_progress THEN
+              UPDATE chat SET common_read_message_id = NEW.last_read_message_id WHERE id = affected_chat_id;
+            ELSIF OLD.last_read_message_id = common_progress AND NEW.last_read_message_id > common_progress THEN
+              UPDATE chat
+              SET common_read_message_id = (
+                SELECT min(last_read_message_id) FROM read_progress WHERE chat_id = affected_chat_id
+              )
+              WHERE id = affected_chat_id;
+            END IF;
+          ELSIF OLD.last_read_message_id = common_progress THEN
+            UPDATE chat
+            SET common_read_message_id = (
+              SELECT min(last_read_message_id) FROM read_progress WHERE chat_id = affected_chat_id
+            )
+            WHERE id = affected_chat_id;
+          END IF;
+          RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER maintain_chat_common_read_progress
+        AFTER INSERT OR UPDATE OF last_read_message_id OR DELETE ON read_progress
+        FOR EACH ROW
+        EXECUTE FUNCTION update_chat_common_read_progress();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER maintain_chat_common_read_progress ON read_progress')
+    op.execute('DROP FUNCTION update_chat_common_read_progress()')
+    op.drop_index('ix_read_progress_chat_id_last_read_message_id', table_name='read_progress')
+    op.drop_column('chat', 'common_read_message_id')
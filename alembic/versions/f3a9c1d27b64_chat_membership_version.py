@@ -0,0 +1,57 @@
+"""Chat membership version
+
+Revision ID: f3a9c1d27b64
+Revises: c58a94d46884
+Create Date: 2026-10-19 15:21:37.590314
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9c1d27b64'
+down_revision: Union[str, None] = 'c58a94d46884'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat', sa.Column('membership_version', sa.Integer(), server_default=sa.text('0'),
+                                    nullable=False))
+    # Statement level, so a bulk load of participants bumps every chat once instead of once per row
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_chat_membership_version()
+        RETURNS TRIGGER AS $$
+        BEGIN
+          UPDATE chat SET membership_version = membership_version + 1
+          WHERE id IN (SELECT DISTINCT chat_id FROM changed_participants);
+          RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER bump_chat_membership_version_on_insert
+        AFTER INSERT ON chat_participant
+        REFERENCING NEW TABLE AS changed_participants
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION bump_chat_membership_version();
+    """)
+    op.execute("""
+        CREATE TRIGGER bump_chat_membership_version_on_delete
+        AFTER DELETE ON chat_participant
+        REFERENCING OLD TABLE AS changed_participants
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION bump_chat_membership_version();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER bump_chat_membership_version_on_delete ON chat_participant')
+    op.execute('DROP TRIGGER bump_chat_membership_version_on_insert ON chat_participant')
+    op.execute('DROP FUNCTION bump_chat_membership_version()')
+    op.drop_column('chat', 'membership_version')
@@ -0,0 +1,135 @@
+"""Chat history transfer: row-by-row `MessageModule.store_message` vs the COPY based BulkModule.
+
+Seeds (once) a chat with `--messages` messages, stores `--baseline` messages one by one into a scratch chat, then
+exports the big chat, deletes it, imports the export again and checks that nothing changed,
+e.g. `python -m benchmarks.bulk --messages 1000000`.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import select, text
+
+from services.backend.modules.bulk import BulkModule
+from services.backend.modules.message import MessageModule
+from services.db import get_db, Db
+from services.db.models import Chat
+
+BENCH_CHAT = 'bulk_bench'
+BASELINE_CHAT = 'bulk_bench_baseline'
+MEMBERS = 20
+
+CHECKSUM_QUERY = text(
+    'SELECT count(*), md5(string_agg(id || \':\' || seq || \':\' || user_id || \':\' || content || \':\' || timestamp, '
+    '\',\' ORDER BY id)) FROM message WHERE chat_id = :chat_id'
+)
+
+
+async def get_chat(db: Db, name: str) -> int:
+    async with db.session_scope() as sess:
+        chat_id = (await sess.execute(select(Chat.id).where(Chat.name == name))).scalar_one_or_none()
+        if chat_id is None:
+            chat_id = (await sess.execute(text(
+                "INSERT INTO chat (name, type) VALUES (:name, 'GROUP') RETURNING id"
+            ), {'name': name})).scalar_one()
+        user_ids = (await sess.execute(text(
+            'SELECT user_id FROM chat_participant WHERE chat_id = :chat_id ORDER BY user_id'
+        ), {'chat_id': chat_id})).scalars().all()
+        for i in range(len(user_ids), MEMBERS):
+            user_id = (await sess.execute(text(
+                "INSERT INTO \"user\" (name, email, password) VALUES (:name, :email, '-') "
+                "ON CONFLICT (email) DO UPDATE SET name = excluded.name RETURNING id"
+            ), {'name': f'bulk_bench_{i}', 'email': f'bulk-bench-{i}@example.com'})).scalar_one()
+            await sess.execute(text(
+                'INSERT INTO chat_participant (chat_id, user_id) VALUES (:chat_id, :user_id)'
+            ), {'chat_id': chat_id, 'user_id': user_id})
+            user_ids.append(user_id)
+    return chat_id
+
+
+async def seed(db: Db, chat_id: int, messages: int):
+    async with db.session_scope() as sess:
+        existing = (await sess.execute(text(
+            'SELECT last_seq FROM chat WHERE id = :chat_id'
+        ), {'chat_id': chat_id})).scalar_one()
+        if existing >= messages:
+            return
+        # Sequence numbers are given and last_seq is bumped upfront, so the insert trigger leaves the chat row alone
+        await sess.execute(text('UPDATE chat SET last_seq = :messages WHERE id = :chat_id'),
+                           {'chat_id': chat_id, 'messages': messages})
+        await sess.execute(text(
+            'INSERT INTO message (chat_id, seq, user_id, content) '
+            'SELECT :chat_id, n, (SELECT array_agg(user_id) FROM chat_participant WHERE chat_id = :chat_id)'
+            '       [1 + n % ' + str(MEMBERS) + '], '
+            '       \'bulk benchmark message \' || n || repeat(\' lorem ipsum\', n % 8) '
+            'FROM generate_series(CAST(:first AS int), CAST(:messages AS int)) n'
+        ), {'chat_id': chat_id, 'first': existing + 1, 'messages': messages})
+        await sess.execute(text(
+            'INSERT INTO read_progress (chat_id, user_id, last_read_message_id) '
+            'SELECT chat_id, user_id, (SELECT max(id) FROM message WHERE chat_id = :chat_id) '
+            'FROM chat_participant WHERE chat_id = :chat_id ON CONFLICT DO NOTHING'
+        ), {'chat_id': chat_id})
+
+
+async def delete_chat(db: Db, chat_id: int):
+    async with db.session_scope() as sess:
+        for table, key in (('read_progress', 'chat_id'), ('message_archive', 'chat_id'), ('message', 'chat_id'),
+                           ('chat_participant', 'chat_id'), ('chat', 'id')):
+            await sess.execute(text(f'DELETE FROM {table} WHERE {key} = :chat_id'), {'chat_id': chat_id})
+
+
+async def checksum(db: Db, chat_id: int):
+    async with db.session_scope() as sess:
+        return tuple((await sess.execute(CHECKSUM_QUERY, {'chat_id': chat_id})).one())
+
+
+async def run(messages: int, baseline: int):
+    db = get_db()
+    message_module = MessageModule(db=db)
+    bulk_module = BulkModule(db=db)
+
+    baseline_chat_id = await get_chat(db, BASELINE_CHAT)
+    async with db.session_scope() as sess:
+        user_id = (await sess.execute(text(
+            'SELECT min(user_id) FROM chat_participant WHERE chat_id = :chat_id'
+        ), {'chat_id': baseline_chat_id})).scalar_one()
+    started = time.perf_counter()
+    for i in range(baseline):
+        await message_module.store_message(chat_id=baseline_chat_id, user_id=user_id, content=f'baseline {i}')
+    elapsed = time.perf_counter() - started
+    print(f'{"store_message":>13}: {baseline} messages in {elapsed:.2f} s, {baseline / elapsed:.0f} messages/s')
+
+    chat_id = await get_chat(db, BENCH_CHAT)
+    await seed(db, chat_id, messages)
+    before = await checksum(db, chat_id)
+
+    fd, path = tempfile.mkstemp(suffix='.bulk')
+    os.close(fd)
+    try:
+        with open(path, 'wb') as output:
+            stats = await bulk_module.export_chats(chat_ids=[chat_id], output=output)
+        print(f'{"export":>13}: {stats.rows["message"]} messages in {stats.seconds:.2f} s, '
+              f'{stats.rows["message"] / stats.seconds:.0f} messages/s, '
+              f'{stats.bytes / 2 ** 20:.1f} MiB COPY data, {os.path.getsize(path) / 2 ** 20:.1f} MiB on disk')
+
+        await delete_chat(db, chat_id)
+        with open(path, 'rb') as source:
+            stats = await bulk_module.import_chats(source=source)
+        print(f'{"import":>13}: {stats.rows["message"]} messages in {stats.seconds:.2f} s, '
+              f'{stats.rows["message"] / stats.seconds:.0f} messages/s')
+    finally:
+        os.remove(path)
+
+    after = await checksum(db, chat_id)
+    print(f'{"round trip":>13}: {"identical" if after == before else f"MISMATCH {before} != {after}"}')
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--baseline', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(messages=args.messages, baseline=args.baseline))
@@ -0,0 +1,84 @@
+"""Chat list rendering for a user in many chats: per-chat calls vs ChatModule.get_user_inbox.
+
+Seeds (once) a dedicated user who is a member of `--chats` group chats, then times both ways of
+building the chat list, e.g. `python -m benchmarks.inbox --chats 500`.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from services.backend.modules.chat import ChatModule
+from services.backend.modules.progress import ProgressModule
+from services.db import get_db, Db
+from services.db.models import User
+
+BENCH_EMAIL = 'inbox-bench@example.com'
+
+
+async def seed(db: Db, chats: int) -> int:
+    async with db.session_scope() as sess:
+        user_id = (await sess.execute(select(User.id).where(User.email == BENCH_EMAIL))).scalar_one_or_none()
+        if user_id is None:
+            user_id = (await sess.execute(text(
+                "INSERT INTO \"user\" (name, email, password) VALUES ('inbox_bench', :email, '-') RETURNING id"
+            ), {'email': BENCH_EMAIL})).scalar_one()
+        existing = (await sess.execute(text(
+            'SELECT count(*) FROM chat_participant WHERE user_id = :user_id'
+        ), {'user_id': user_id})).scalar_one()
+        for i in range(existing, chats):
+            chat_id = (await sess.execute(text(
+                "INSERT INTO chat (name, type) VALUES (:name, 'GROUP') RETURNING id"
+            ), {'name': f'inbox_bench_{i}'})).scalar_one()
+            await sess.execute(text(
+                'INSERT INTO chat_participant (chat_id, user_id) VALUES (:chat_id, :user_id), (:chat_id, 1)'
+            ), {'chat_id': chat_id, 'user_id': user_id})
+            message_ids = (await sess.execute(text(
+                'INSERT INTO message (chat_id, user_id, content) '
+                'SELECT :chat_id, CASE WHEN n % 2 = 0 THEN :user_id ELSE 1 END, :content FROM generate_series(1, 20) n '
+                'RETURNING id'
+            ), {'chat_id': chat_id, 'user_id': user_id, 'content': 'inbox benchmark message'})).scalars().all()
+            await sess.execute(text(
+                'INSERT INTO read_progress (chat_id, user_id, last_read_message_id) '
+                'VALUES (:chat_id, :user_id, :first_id), (:chat_id, 1, :last_id)'
+            ), {'chat_id': chat_id, 'user_id': user_id, 'first_id': min(message_ids), 'last_id': max(message_ids)})
+    return user_id
+
+
+async def per_chat(chat_module: ChatModule, progress_module: ProgressModule, user_id: int):
+    chats = await chat_module.get_user_chats(user_id=user_id)
+    for chat in chats:
+        await chat_module.get_chat_users(chat_id=chat.id)
+        await progress_module.get_user_unread_in_chat(chat_id=chat.id, user_id=user_id)
+
+
+async def measure(name: str, load, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await load()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f'{name:>9}: mean {statistics.mean(timings):.2f} ms, p50 {timings[len(timings) // 2]:.2f} ms, '
+          f'max {timings[-1]:.2f} ms')
+
+
+async def run(chats: int, iterations: int):
+    db = get_db()
+    chat_module = ChatModule(db=db)
+    progress_module = ProgressModule(db=db)
+    user_id = await seed(db, chats)
+
+    await measure('per-chat', lambda: per_chat(chat_module, progress_module, user_id), iterations)
+    await measure('inbox', lambda: chat_module.get_user_inbox(user_id=user_id), iterations)
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(chats=args.chats, iterations=args.iterations))
@@ -0,0 +1,101 @@
+"""Event loop lag and websocket broadcast latency during a login burst: bcrypt on the loop vs the PasswordHasher pool.
+
+While `--logins` password checks at bcrypt cost `--rounds` run concurrently, a probe measures how late 1 ms sleeps
+wake up and a broadcaster fans a message out to `--connections` websockets of one chat every 10 ms,
+e.g. `python -m benchmarks.login_burst --logins 100`. Needs no database or Redis.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import bcrypt
+
+from services.app.exceptions import ServiceUnavailable
+from services.backend.modules.authentication.hashing import PasswordHasher
+from services.backend.modules.websocket import WebsocketModule
+
+BROADCAST_INTERVAL = 0.01
+PROBE_INTERVAL = 0.001
+
+
+class FakeWebSocket:
+    def __init__(self, latencies: list[float]):
+        self.latencies = latencies
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        self.latencies.append(time.perf_counter() - float(message))
+
+
+async def probe(lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def broadcaster(ws_module: WebsocketModule, stop: asyncio.Event):
+    scheduled = time.perf_counter()
+    while not stop.is_set():
+        scheduled += BROADCAST_INTERVAL
+        await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+        # The message carries the time it was due, so a late wake-up counts into the latency
+        await ws_module.broadcast_to_chat(chat_id=1, message=str(scheduled))
+
+
+def describe(values: list[float]) -> str:
+    values = sorted(values)
+    p99 = values[min(int(len(values) * 0.99), len(values) - 1)]
+    return (f'p50 {statistics.median(values) * 1000:7.2f} ms, p99 {p99 * 1000:7.2f} ms, '
+            f'max {values[-1] * 1000:7.2f} ms')
+
+
+async def measure(name: str, check, logins: int, connections: int):
+    lags: list[float] = []
+    latencies: list[float] = []
+    ws_module = WebsocketModule()
+    for user_id in range(connections):
+        ws_module.users[user_id] = {FakeWebSocket(latencies)}
+        ws_module.users_to_chats[user_id] = {1}
+    ws_module.chats_to_users[1] = set(range(connections))
+
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(probe(lags, stop)), asyncio.create_task(broadcaster(ws_module, stop))]
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(check() for _ in range(logins)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    rejected = sum(isinstance(result, ServiceUnavailable) for result in results)
+    print(f'{name}: {logins - rejected} logins in {elapsed:.2f} s, {rejected} rejected with 503')
+    print(f'{"loop lag":>20}: {describe(lags)}')
+    print(f'{"broadcast latency":>20}: {describe(latencies)}')
+
+
+async def run(logins: int, rounds: int, workers: int, queue_size: int, connections: int):
+    hashed_password = bcrypt.hashpw(b'password', bcrypt.gensalt(rounds=rounds)).decode()
+
+    async def inline_check():
+        return bcrypt.checkpw(b'password', hashed_password.encode())
+
+    await measure('bcrypt on the event loop', inline_check, logins, connections)
+    hasher = PasswordHasher(workers=workers, queue_size=queue_size)
+    await measure(f'pool of {workers} threads, queue of {queue_size}',
+                  lambda: hasher.check('password', hashed_password), logins, connections)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--connections', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(logins=args.logins, rounds=args.rounds, workers=args.workers, queue_size=args.queue_size,
+                    connections=args.connections))
@@ -0,0 +1,92 @@
+"""Login and token refresh throughput of the AuthenticationModule.
+
+Seeds a user whose password is hashed at bcrypt cost `--rounds` (cheap by default, so the token path is measured
+rather than bcrypt), then runs `--logins` logins and as many refreshes of the issued tokens, `--concurrency` at a time,
+e.g. `python -m benchmarks.login_throughput --logins 5000`. Needs the database and Redis.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import bcrypt
+from sqlalchemy import text
+
+from services.backend.modules.authentication import AuthenticationModule
+from services.backend.modules.authentication.revocation import TokenRevocations
+from services.backend.modules.redis import get_redis_module
+from services.db import get_db, Db
+
+BENCH_EMAIL = 'login-bench@example.com'
+PASSWORD = 'password'
+
+
+async def seed_user(db: Db, rounds: int):
+    hashed_password = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+    async with db.session_scope() as sess:
+        await sess.execute(text(
+            "INSERT INTO \"user\" (name, email, password) VALUES ('login_bench', :email, :password) "
+            "ON CONFLICT (email) DO UPDATE SET password = excluded.password"
+        ), {'email': BENCH_EMAIL, 'password': hashed_password})
+
+
+async def measure(name: str, operations: list, concurrency: int, revocations: TokenRevocations) -> list:
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(operation):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await operation()
+            latencies.append(time.perf_counter() - started)
+            return result
+
+    stats = revocations.stats.model_copy()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(timed(operation) for operation in operations))
+    elapsed = time.perf_counter() - started
+
+    checks = (revocations.stats.redis_checks + revocations.stats.filter_negatives
+              - stats.redis_checks - stats.filter_negatives)
+    latencies.sort()
+    print(f'{name:>8}: {len(operations) / elapsed:6.0f}/s, p50 {statistics.median(latencies) * 1000:6.2f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms, '
+          f'{checks / len(operations):.2f} revocation checks and '
+          f'{(revocations.stats.revoked - stats.revoked) / len(operations):.2f} revocations per call')
+    return results
+
+
+async def run(logins: int, concurrency: int, rounds: int):
+    db = get_db()
+    redis_client = get_redis_module().redis
+    revocations = TokenRevocations(redis_client=redis_client)
+    auth_module = AuthenticationModule(db=db, revocations=revocations)
+    await seed_user(db, rounds)
+
+    logged_in = await measure(
+        'login',
+        [lambda: auth_module.login(email=BENCH_EMAIL, password=PASSWORD) for _ in range(logins)],
+        concurrency,
+        revocations
+    )
+    await measure(
+        'refresh',
+        [lambda access_token=access_token, refresh_token=refresh_token: auth_module.refresh_access(
+            refresh_token=refresh_token.value, cur_access_token=access_token.value)
+         for _, access_token, refresh_token in logged_in],
+        concurrency,
+        revocations
+    )
+
+    await revocations.stop()
+    await redis_client.aclose()
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(logins=args.logins, concurrency=args.concurrency, rounds=args.rounds))
@@ -0,0 +1,130 @@
+"""Read progress updates in a busy chat: legacy serializable upsert per update vs the ReadProgressCoalescer.
+
+Seeds (once) a group chat with `--users` members and `--messages` messages, then every member marks the messages
+read one by one, all members concurrently, e.g. `python -m benchmarks.progress --users 50`.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, text, func
+from sqlalchemy.dialects.postgresql import insert
+
+from services.backend.modules.progress import ProgressModule
+from services.backend.modules.progress.coalescer import LEGACY_ROUND_TRIPS_PER_UPDATE
+from services.db import get_db, Db
+from services.db.models import Chat, ReadProgress
+
+BENCH_CHAT = 'progress_bench'
+
+
+async def seed(db: Db, users: int, messages: int) -> tuple[int, list[int], list[int]]:
+    async with db.session_scope() as sess:
+        chat_id = (await sess.execute(select(Chat.id).where(Chat.name == BENCH_CHAT))).scalar_one_or_none()
+        if chat_id is None:
+            chat_id = (await sess.execute(text(
+                "INSERT INTO chat (name, type) VALUES (:name, 'GROUP') RETURNING id"
+            ), {'name': BENCH_CHAT})).scalar_one()
+        user_ids = (await sess.execute(text(
+            'SELECT user_id FROM chat_participant WHERE chat_id = :chat_id ORDER BY user_id'
+        ), {'chat_id': chat_id})).scalars().all()
+        for i in range(len(user_ids), users):
+            user_id = (await sess.execute(text(
+                "INSERT INTO \"user\" (name, email, password) VALUES (:name, :email, '-') RETURNING id"
+            ), {'name': f'progress_bench_{i}', 'email': f'progress-bench-{i}@example.com'})).scalar_one()
+            await sess.execute(text(
+                'INSERT INTO chat_participant (chat_id, user_id) VALUES (:chat_id, :user_id)'
+            ), {'chat_id': chat_id, 'user_id': user_id})
+            user_ids.append(user_id)
+        message_ids = (await sess.execute(text(
+            'SELECT id FROM message WHERE chat_id = :chat_id ORDER BY id'
+        ), {'chat_id': chat_id})).scalars().all()
+        if len(message_ids) < messages:
+            message_ids += (await sess.execute(text(
+                'INSERT INTO message (chat_id, user_id, content) '
+                'SELECT :chat_id, :user_id, \'progress benchmark message\' FROM generate_series(1, :count) '
+                'RETURNING id'
+            ), {'chat_id': chat_id, 'user_id': user_ids[0], 'count': messages - len(message_ids)})).scalars().all()
+    return chat_id, user_ids[:users], sorted(message_ids)[-messages:]
+
+
+async def reset(db: Db, chat_id: int, first_message_id: int):
+    async with db.session_scope() as sess:
+        await sess.execute(text(
+            'INSERT INTO read_progress (chat_id, user_id, last_read_message_id) '
+            'SELECT chat_id, user_id, :first_id FROM chat_participant WHERE chat_id = :chat_id '
+            'ON CONFLICT (chat_id, user_id) DO UPDATE SET last_read_message_id = excluded.last_read_message_id'
+        ), {'chat_id': chat_id, 'first_id': first_message_id})
+
+
+async def store_progress_serializable(db: Db, chat_id: int, user_id: int, last_read_message_id: int):
+    # The update path before the coalescer: one serializable upsert per update
+    query = (
+        insert(ReadProgress)
+        .values(chat_id=chat_id, user_id=user_id, last_read_message_id=last_read_message_id)
+        .on_conflict_do_update(
+            index_elements=['chat_id', 'user_id'],
+            set_={'last_read_message_id': func.greatest(ReadProgress.last_read_message_id, last_read_message_id)})
+    )
+    async with db.serializable_session_scope() as sess:
+        await sess.execute(query)
+    await db.mark_written(('chat', chat_id), ('user', user_id))
+
+
+async def legacy(db: Db, progress_module: ProgressModule, chat_id: int, user_id: int, message_id: int):
+    await progress_module.get_chat_progress(chat_id=chat_id)
+    await store_progress_serializable(db, chat_id=chat_id, user_id=user_id, last_read_message_id=message_id)
+    await progress_module.get_chat_progress(chat_id=chat_id)
+
+
+async def measure(name: str, update, user_ids: list[int], message_ids: list[int]) -> float:
+    failures = 0
+
+    async def reader(user_id: int):
+        nonlocal failures
+        for message_id in message_ids:
+            try:
+                await update(user_id, message_id)
+            except Exception:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(reader(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    updates = len(user_ids) * len(message_ids)
+    print(f'{name:>9}: {updates} updates in {elapsed:.2f} s, {updates / elapsed:.0f} updates/s, {failures} failed')
+    return elapsed
+
+
+async def run(users: int, messages: int):
+    db = get_db()
+    progress_module = ProgressModule(db=db)
+    coalescer = progress_module.coalescer
+    chat_id, user_ids, message_ids = await seed(db, users, messages)
+
+    await reset(db, chat_id, message_ids[0])
+    await measure(
+        'legacy',
+        lambda user_id, message_id: legacy(db, progress_module, chat_id, user_id, message_id),
+        user_ids, message_ids
+    )
+    print(f'{"":>9}  {users * messages * LEGACY_ROUND_TRIPS_PER_UPDATE} round trips')
+
+    await reset(db, chat_id, message_ids[0])
+    await measure(
+        'coalesced',
+        lambda user_id, message_id: coalescer.store(chat_id=chat_id, user_id=user_id, last_read_message_id=message_id),
+        user_ids, message_ids
+    )
+    stats = coalescer.stats
+    print(f'{"":>9}  {stats.round_trips} round trips in {stats.flushes} flushes of {stats.rows} rows, '
+          f'{stats.round_trips_saved} saved')
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(users=args.users, messages=args.messages))
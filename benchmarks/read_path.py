@@ -0,0 +1,117 @@
+"""History page reads: ORM entities + selectinload + model_validate vs the precompiled column projections.
+
+Seeds (once) a chat with `--messages` messages from `--users` members, then reads pages of `--limit` messages and
+the member list both ways and reports rows per second, e.g. `python -m benchmarks.read_path --limit 100`.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import selectinload
+
+from services.backend.modules.chat import ChatModule
+from services.backend.modules.message import MessageModule
+from services.backend.modules.message.schemas import MessageFull
+from services.backend.modules.user.schemas import UserBase
+from services.db import get_db, Db
+from services.db.models import Chat, Message
+
+BENCH_CHAT = 'read_path_bench'
+
+
+async def seed(db: Db, messages: int, users: int) -> int:
+    async with db.session_scope() as sess:
+        chat_id = (await sess.execute(select(Chat.id).where(Chat.name == BENCH_CHAT))).scalar_one_or_none()
+        if chat_id is None:
+            chat_id = (await sess.execute(text(
+                "INSERT INTO chat (name, type) VALUES (:name, 'GROUP') RETURNING id"
+            ), {'name': BENCH_CHAT})).scalar_one()
+        user_ids = (await sess.execute(text(
+            'SELECT user_id FROM chat_participant WHERE chat_id = :chat_id'
+        ), {'chat_id': chat_id})).scalars().all()
+        for i in range(len(user_ids), users):
+            user_id = (await sess.execute(text(
+                "INSERT INTO \"user\" (name, email, password) VALUES (:name, :email, '-') RETURNING id"
+            ), {'name': f'read_path_bench_{i}', 'email': f'read-path-bench-{i}@example.com'})).scalar_one()
+            await sess.execute(text(
+                'INSERT INTO chat_participant (chat_id, user_id) VALUES (:chat_id, :user_id)'
+            ), {'chat_id': chat_id, 'user_id': user_id})
+            user_ids.append(user_id)
+        existing = (await sess.execute(text(
+            'SELECT last_seq FROM chat WHERE id = :chat_id'
+        ), {'chat_id': chat_id})).scalar_one()
+        if existing < messages:
+            await sess.execute(text(
+                'INSERT INTO message (chat_id, user_id, content) '
+                'SELECT :chat_id, (CAST(:user_ids AS int[]))[1 + n % cardinality(CAST(:user_ids AS int[]))], '
+                '       repeat(\'read path benchmark \', 1 + n % 5) '
+                'FROM generate_series(1, :count) n'
+            ), {'chat_id': chat_id, 'user_ids': user_ids, 'count': messages - existing})
+    return chat_id
+
+
+async def orm_messages(db: Db, chat_id: int, limit: int, offset: int):
+    query = (
+        select(Message)
+        .where(Message.chat_id == chat_id)
+        .order_by(Message.id.desc())
+        .limit(limit)
+        .offset(offset)
+        .options(selectinload(Message.user))
+    )
+    async with db.session_scope() as sess:
+        result = await sess.execute(query)
+        messages = [MessageFull.model_validate(message) for message in result.scalars().all()]
+        sess.expunge_all()
+    return messages
+
+
+async def orm_chat_users(db: Db, chat_id: int):
+    query = (
+        select(Chat)
+        .where(Chat.id == chat_id)
+        .options(selectinload(Chat.users))
+    )
+    async with db.session_scope() as sess:
+        chat = (await sess.execute(query)).scalar_one_or_none()
+        users = sorted(chat.users if chat else [], key=lambda x: x.id)
+        sess.expunge_all()
+    return [UserBase(id=user.id, name=user.name) for user in users]
+
+
+async def measure(name: str, load, iterations: int):
+    rows = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        rows += len(await load(i))
+    elapsed = time.perf_counter() - started
+    print(f'{name:>22}: {rows / elapsed:>9.0f} rows/s, {elapsed / iterations * 1000:.2f} ms per call')
+
+
+async def run(messages: int, users: int, limit: int, iterations: int):
+    db = get_db()
+    chat_module = ChatModule(db=db)
+    message_module = MessageModule(db=db)
+    chat_id = await seed(db, messages, users)
+    pages = max(messages // limit, 1)
+
+    for _ in range(2):
+        await measure('orm messages',
+                      lambda i: orm_messages(db, chat_id, limit, i % pages * limit), iterations)
+        await measure('projection messages',
+                      lambda i: message_module.get_messages(chat_id=chat_id, limit=limit, offset=i % pages * limit),
+                      iterations)
+        await measure('orm chat users', lambda i: orm_chat_users(db, chat_id), iterations)
+        await measure('projection chat users', lambda i: chat_module.get_chat_users(chat_id=chat_id), iterations)
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(run(messages=args.messages, users=args.users, limit=args.limit, iterations=args.iterations))
@@ -0,0 +1,102 @@
+"""Message search: unindexed regex scan vs MessageModule.search over the GIN full-text index.
+
+Seeds (once) a dedicated user in `--chats` chats holding `--messages` random-word messages, then times a few queries both ways,
+e.g. `python -m benchmarks.search --messages 2000000`.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from services.backend.modules.message import MessageModule
+from services.db import get_db, Db
+from services.db.models import User
+
+BENCH_EMAIL = 'search-bench@example.com'
+# Synthetic vocabulary w0..w19999 with a skewed distribution: low numbers are common, high ones rare
+VOCABULARY = 20_000
+QUERIES = ['w5 w7', '"w3 w11"', 'w1200 -w1', 'w15001', 'w9000 w9001']
+SEED_CHUNK = 200_000
+
+
+async def seed(db: Db, messages: int, chats: int) -> int:
+    async with db.session_scope() as sess:
+        user_id = (await sess.execute(select(User.id).where(User.email == BENCH_EMAIL))).scalar_one_or_none()
+        if user_id is None:
+            user_id = (await sess.execute(text(
+                "INSERT INTO \"user\" (name, email, password) VALUES ('search_bench', :email, '-') RETURNING id"
+            ), {'email': BENCH_EMAIL})).scalar_one()
+        chat_ids = (await sess.execute(text(
+            'SELECT chat_id FROM chat_participant WHERE user_id = :user_id ORDER BY chat_id'
+        ), {'user_id': user_id})).scalars().all()
+        for i in range(len(chat_ids), chats):
+            chat_id = (await sess.execute(text(
+                "INSERT INTO chat (name, type) VALUES (:name, 'GROUP') RETURNING id"
+            ), {'name': f'search_bench_{i}'})).scalar_one()
+            await sess.execute(text(
+                'INSERT INTO chat_participant (chat_id, user_id) VALUES (:chat_id, :user_id)'
+            ), {'chat_id': chat_id, 'user_id': user_id})
+            chat_ids.append(chat_id)
+        existing = (await sess.execute(text(
+            'SELECT sum(last_seq) FROM chat WHERE id = ANY(:chat_ids)'
+        ), {'chat_ids': chat_ids})).scalar_one()
+    # Eight random words per message, spread over the chats so the seq trigger does not serialize
+    # on a single chat row; committed in chunks to keep transactions reasonable
+    for start in range(existing, messages, SEED_CHUNK):
+        async with db.session_scope() as sess:
+            await sess.execute(text(
+                'INSERT INTO message (chat_id, user_id, content) '
+                'SELECT (CAST(:chat_ids AS int[]))[1 + n % cardinality(CAST(:chat_ids AS int[]))], :user_id, '
+                '       (SELECT string_agg(\'w\' || floor(power(random(), 3) * :vocabulary)::int, \' \') '
+                '          FROM generate_series(1, 8) WHERE n > 0) '
+                'FROM generate_series(1, :count) n'
+            ), {'chat_ids': chat_ids, 'user_id': user_id, 'vocabulary': VOCABULARY,
+                'count': min(SEED_CHUNK, messages - start)})
+    return user_id
+
+
+async def regex_scan(db: Db, user_id: int, query: str, limit: int):
+    # Whole-word regex match as the unindexed equivalent; negated terms are ignored
+    terms = [term.strip('"') for term in query.split() if not term.startswith('-')]
+    condition = ' AND '.join(f'm.content ~ :t{i}' for i in range(len(terms)))
+    async with db.session_scope() as sess:
+        await sess.execute(text(
+            'SELECT m.id, m.content FROM message m '
+            'JOIN chat_participant cp ON cp.chat_id = m.chat_id AND cp.user_id = :user_id '
+            f'WHERE {condition} ORDER BY m.id DESC LIMIT :limit'
+        ), {'user_id': user_id, 'limit': limit, **{f't{i}': f'\\m{term}\\M' for i, term in enumerate(terms)}})
+
+
+async def measure(name: str, load, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await load()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f'{name:>28}: mean {statistics.mean(timings):.2f} ms, p50 {timings[len(timings) // 2]:.2f} ms, '
+          f'max {timings[-1]:.2f} ms')
+
+
+async def run(messages: int, chats: int, iterations: int, limit: int):
+    db = get_db()
+    message_module = MessageModule(db=db)
+    user_id = await seed(db, messages, chats)
+
+    for query in QUERIES:
+        await measure(f'regex {query}', lambda: regex_scan(db, user_id, query, limit), iterations)
+        await measure(f'search {query}',
+                      lambda: message_module.search(user_id=user_id, text=query, limit=limit), iterations)
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(messages=args.messages, chats=args.chats, iterations=args.iterations, limit=args.limit))
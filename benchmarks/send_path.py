@@ -0,0 +1,65 @@
+"""Latency of the WebSocket send path: the legacy four-session sequence vs MessageModule.send_message.
+
+Run against a migrated database, e.g. `python -m benchmarks.send_path --chat-id 2 --user-id 1`.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.progress import store_progress_serializable
+from services.backend.modules.message import MessageModule
+from services.backend.modules.progress import ProgressModule
+from services.db import get_db, Db
+
+
+async def legacy_send(db: Db, message_module: MessageModule, progress_module: ProgressModule,
+                      chat_id: int, user_id: int, content: str):
+    await progress_module.get_chat_progress(chat_id=chat_id)
+    new_message = await message_module.store_message(chat_id=chat_id, user_id=user_id, content=content)
+    await store_progress_serializable(db, chat_id=chat_id, user_id=user_id, last_read_message_id=new_message.id)
+    await progress_module.get_chat_progress(chat_id=chat_id)
+
+
+async def combined_send(message_module: MessageModule, chat_id: int, user_id: int, content: str):
+    await message_module.send_message(chat_id=chat_id, user_id=user_id, content=content)
+
+
+async def measure(name: str, send, iterations: int):
+    timings = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        await send(f'{name} benchmark message {i}')
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f'{name:>8}: mean {statistics.mean(timings):.3f} ms, '
+          f'p50 {timings[len(timings) // 2]:.3f} ms, '
+          f'p95 {timings[int(len(timings) * 0.95)]:.3f} ms')
+
+
+async def run(chat_id: int, user_id: int, iterations: int):
+    db = get_db()
+    message_module = MessageModule(db=db)
+    progress_module = ProgressModule(db=db)
+
+    async def legacy(content: str):
+        await legacy_send(db, message_module, progress_module, chat_id, user_id, content)
+
+    async def combined(content: str):
+        await combined_send(message_module, chat_id, user_id, content)
+
+    # Warm up the pool and the statement caches of both paths.
+    await legacy('warmup')
+    await combined('warmup')
+    await measure('legacy', legacy, iterations)
+    await measure('combined', combined, iterations)
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chat-id', type=int, default=2)
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(chat_id=args.chat_id, user_id=args.user_id, iterations=args.iterations))
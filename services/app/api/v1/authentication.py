@@ -5,14 +5,14 @@ from typing import Annotated
 from services.app.schemas import UserData
 from services.backend import Backend, get_backend
 from services.backend.exceptions import BackendServiceException
-from services.db.models import User
+from services.backend.modules.user.schemas import UserBase
 
 router = APIRouter(tags=['login'])
 
 async def get_current_user(
         backend: Annotated[Backend, Depends(get_backend)],
         token: Annotated[str | None, Cookie(alias='access_token')] = None,
-) -> User | None:
+) -> UserBase:
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
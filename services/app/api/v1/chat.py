@@ -1,31 +1,43 @@
 from typing import Annotated, List
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response, Query, HTTPException, status
+from fastapi.responses import StreamingResponse
 
 from services.app.api.v1.authentication import get_current_user
+from services.app.api.v1.conditional import entity_tag, ids_entity_tag, is_not_modified, not_modified, \
+    set_entity_tag
 from services.app.exceptions import EntityAlreadyExistsError, EntityDoesNotExistError, Forbidden
 from services.app.schemas import WsMessageType, ServerNewUserMessage, \
-    ServerUserLeftMessage, ServerChatProgress, RedisChannelType
+    ServerUserLeftMessage, ServerChatProgress, RedisChannelType, ChatTypeEnum
 from services.backend import Backend, get_backend
-from services.backend.modules.chat.schemas import ChatFull, ChatBase
+from services.backend.modules.chat.schemas import ChatFull, ChatBase, ChatInbox, ChatDirectoryPage
 from services.backend.modules.user.schemas import UserBase
-from services.db.models import Chat, User
+from services.db.models import Chat
 
 router = APIRouter(prefix='/chat', tags=['chat'])
 
+GET_ALL_LIMIT = 1000
+
 
 @router.get('/progress',
             summary=' Get chat progress',
             response_model=int)
 async def progress(
         chat_id: int,
+        request: Request,
+        response: Response,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
     author_in_chat = await backend.chat_module.check_user_in_chat(chat_id=chat_id, user_id=user.id)
     if not author_in_chat:
         raise Forbidden(message='You are not in the chat')
-    return await backend.progress_module.get_chat_progress(chat_id=chat_id)
+    chat_progress = await backend.progress_module.get_chat_progress(chat_id=chat_id)
+    etag = entity_tag('progress', chat_progress)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_entity_tag(response, etag)
+    return chat_progress
 
 
 @router.get('/user_progress',
@@ -34,7 +46,7 @@ async def progress(
 async def user_progress(
         chat_id: int,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
     author_in_chat = await backend.chat_module.check_user_in_chat(chat_id=chat_id, user_id=user.id)
     if not author_in_chat:
@@ -52,7 +64,7 @@ async def user_progress(
 async def create_chat(
         new_chat: ChatBase,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
     chat: Chat = await backend.chat_module.create_chat(name=new_chat.name, type=new_chat.type)
     hello_message = await backend.chat_module.add_user_to_chat(chat_id=chat.id, user_id=user.id)
@@ -76,12 +88,12 @@ async def invite_to_chat(
         chat_id: int,
         user_id: int,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
-    chat: Chat = await backend.chat_module.get_chat(chat_id=chat_id)
+    chat: ChatFull | None = await backend.chat_module.get_chat(chat_id=chat_id)
     if chat is None:
         raise EntityDoesNotExistError(message='Chat does not exist')
-    invited_user: User = await backend.user_module.get_user(user_id=user_id)
+    invited_user: UserBase | None = await backend.user_module.get_user(user_id=user_id)
     if invited_user is None:
         raise EntityDoesNotExistError(message='Invited user does not exist')
     author_in_chat = await backend.chat_module.check_user_in_chat(chat_id=chat_id, user_id=user.id)
@@ -107,10 +119,10 @@ async def invite_to_chat(
 async def join_chat(
         chat_id: int,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
     user_id = user.id
-    chat: Chat = await backend.chat_module.get_chat(chat_id=chat_id)
+    chat: ChatFull | None = await backend.chat_module.get_chat(chat_id=chat_id)
     if chat is None:
         raise EntityDoesNotExistError(message='Chat does not exist')
     user_in_chat = await backend.chat_module.check_user_in_chat(chat_id=chat_id, user_id=user_id)
@@ -133,7 +145,7 @@ async def join_chat(
 async def leave_chat(
         chat_id: int,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
     user_in_chat = await backend.chat_module.check_user_in_chat(chat_id=chat_id, user_id=user.id)
     if not user_in_chat:
@@ -166,32 +178,100 @@ async def leave_chat(
             summary=' Get user chats',
             response_model=List[ChatFull])
 async def get_user_chats(
+        request: Request,
+        response: Response,
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    # Chats are never renamed, so the list only changes with the chats the user is in,
+    # which the membership cache usually knows without a query
+    chat_ids = await backend.chat_module.get_user_chat_ids(user_id=user.id)
+    etag = ids_entity_tag('chats', chat_ids)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    chats = await backend.chat_module.get_user_chats(user_id=user.id)
+    set_entity_tag(response, ids_entity_tag('chats', (chat.id for chat in chats)))
+    return chats
+
+
+@router.get('/inbox',
+            summary=' Get user chats with the latest message, read progress, unread count and members',
+            response_model=List[ChatInbox])
+async def inbox(
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
-    chats: List[Chat] = await backend.chat_module.get_user_chats(user_id=user.id)
-    return [ChatFull.model_validate(chat) for chat in chats]
+    return await backend.chat_module.get_user_inbox(user_id=user.id)
 
 
 @router.get('/get_chat_users',
             summary=' Get chat users',
             response_model=List[UserBase])
 async def get_chat_users(
+        request: Request,
+        response: Response,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)],
+        user: Annotated[UserBase, Depends(get_current_user)],
         chat_id: int
 ):
-    users: List[User] = await backend.chat_module.get_chat_users(chat_id=chat_id)
-    a = [UserBase(id=user.id, name=user.name) for user in users]
-    return a
+    members = await backend.chat_module.get_chat_members(chat_id=chat_id)
+    if members is None:
+        return []
+    etag = entity_tag('members', members.membership_version)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_entity_tag(response, etag)
+    return members.users
+
+
+@router.get('/directory',
+            summary='Page through all chats by ID, optionally filtered by name prefix and type. '
+                    'Pass next_cursor back as cursor for the next page.',
+            response_model=ChatDirectoryPage)
+async def directory(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)],
+        name: str | None = None,
+        type: ChatTypeEnum | None = None,
+        limit: Annotated[int, Query(ge=1, le=500)] = 100,
+        cursor: str | None = None
+):
+    after_id = None
+    if cursor:
+        try:
+            after_id = int(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Invalid cursor.'
+            )
+    return await backend.chat_module.get_chat_directory(limit=limit, after_id=after_id, name=name, type=type)
+
+
+@router.get('/directory/stream',
+            summary='All chats ordered by ID as newline delimited JSON, optionally filtered by name prefix and type',
+            response_class=StreamingResponse)
+async def directory_stream(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)],
+        name: str | None = None,
+        type: ChatTypeEnum | None = None
+):
+    async def lines():
+        async for chats in backend.chat_module.stream_chat_directory(name=name, type=type):
+            yield ''.join(chat.model_dump_json() + '\n' for chat in chats)
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
 
 
 @router.get('/get_all',
-            summary=' Get all chats. Just for testing, so no pagination or other fancy stuff.',
-            response_model=List[ChatFull])
+            summary='Deprecated, use /chat/directory. The first chats by ID, at most limit of them.',
+            response_model=List[ChatFull],
+            deprecated=True)
 async def get_all(
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)],
+        limit: Annotated[int, Query(ge=1, le=GET_ALL_LIMIT)] = GET_ALL_LIMIT
 ):
-    chats: List[Chat] = await backend.chat_module.get_all_chats()
-    return [ChatFull.model_validate(chat) for chat in chats]
+    page = await backend.chat_module.get_chat_directory(limit=limit)
+    return page.chats
@@ -0,0 +1,34 @@
+import hashlib
+from typing import Iterable
+
+from fastapi import Request, Response, status
+
+# Responses depend on the user of the cookie, so only the client may keep them, and it has to revalidate them
+CACHE_CONTROL = 'private, no-cache'
+
+
+def entity_tag(kind: str, validator: int | str | None) -> str:
+    return f'W/"{kind}-{validator}"'
+
+
+def ids_entity_tag(kind: str, ids: Iterable[int]) -> str:
+    digest = hashlib.sha256(','.join(str(i) for i in sorted(ids)).encode()).hexdigest()[:16]
+    return entity_tag(kind, digest)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    # Weak comparison, as If-None-Match requires
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Cache-Control': CACHE_CONTROL})
+
+
+def set_entity_tag(response: Response, etag: str):
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = CACHE_CONTROL
@@ -1,36 +1,68 @@
-from typing import Annotated
+import csv
+import io
+from typing import Annotated, List, Literal
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, HTTPException, status, Request, Response, Body
+from fastapi.responses import StreamingResponse
 
 from services.app.api.v1.authentication import get_current_user
+from services.app.api.v1.conditional import entity_tag, is_not_modified, not_modified, set_entity_tag
 from services.app.exceptions import EntityDoesNotExistError, Forbidden
+from services.app.schemas import RedisChannelType, ServerChatMessage, ServerChatProgress, ServerUserProgress, \
+    WsMessageType
 from services.backend import Backend, get_backend
-from services.backend.modules.message.schemas import MessagesPagination
-from services.db.models import User, Chat
+from services.backend.modules.chat.schemas import ChatFull
+from services.backend.modules.message.schemas import MessagesPagination, MessageSearchPage, OutgoingMessage, \
+    BatchSentMessage
+from services.backend.modules.progress.schemas import ChatUnread
+from services.backend.modules.user.schemas import UserBase
 
 router = APIRouter(prefix='/message', tags=['message'])
 
 
 @router.get('/get_chat_messages',
-            summary='Get DESC ordered chat messages, with optional filtering by user',
+            summary='Get DESC ordered chat messages, with optional filtering by user. '
+                    'Pass after_seq instead of offset to resume after the last seen message.',
             response_model=MessagesPagination)
 async def get_chat_messages(
+        request: Request,
+        response: Response,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)],
+        user: Annotated[UserBase, Depends(get_current_user)],
         chat_id: int,
         user_id: int | None = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        after_seq: int | None = None
 ):
-    chat: Chat = await backend.chat_module.get_chat(chat_id=chat_id)
+    if after_seq is not None and (user_id is not None or offset):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='after_seq cannot be combined with user_id or offset.'
+        )
+    chat: ChatFull | None = await backend.chat_module.get_chat(chat_id=chat_id)
     if chat is None:
         raise EntityDoesNotExistError(message='Chat does not exist')
     author_in_chat = await backend.chat_module.check_user_in_chat(chat_id=chat_id, user_id=user.id)
     if not author_in_chat:
         raise Forbidden(message='You are not a chat participant')
-    return await backend.message_module.get_messages_with_pagination_data(
-        chat_id=chat_id, user_id=user_id, limit=limit, offset=offset
+    # Messages are never changed or deleted, so a page only changes with the sequence number of the latest message.
+    # Pages filtered by user are always read from the database, so their validator is read from there before them.
+    if user_id is None:
+        last_seq = await backend.message_module.get_last_seq(chat_id=chat_id)
+    else:
+        last_seq = await backend.message_module.get_count(chat_id=chat_id)
+    etag = entity_tag('seq', last_seq)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    page = await backend.message_module.get_messages_with_pagination_data(
+        chat_id=chat_id, user_id=user_id, limit=limit, offset=offset, after_seq=after_seq
     )
+    if user_id is None:
+        # The total count is the latest sequence number the page was read at
+        etag = entity_tag('seq', page.total_count)
+    set_entity_tag(response, etag)
+    return page
 
 
 @router.get('/get_user_unread',
@@ -38,7 +70,7 @@ async def get_chat_messages(
             response_model=int)
 async def get_unread(
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)],
+        user: Annotated[UserBase, Depends(get_current_user)],
         chat_id: int,
         until_mess_id: int | None = None
 ):
@@ -47,3 +79,137 @@ async def get_unread(
         raise Forbidden(message='User is not in the chat')
     return await backend.progress_module.get_user_unread_in_chat(
         chat_id=chat_id, user_id=user.id, until_mess_id=until_mess_id)
+
+
+@router.get('/get_user_unread_all',
+            summary=' Get number of unread messages in all user chats, optionally only in the given chats.',
+            response_model=List[ChatUnread])
+async def get_unread_all(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)],
+        chat_ids: Annotated[List[int] | None, Query()] = None
+):
+    return await backend.progress_module.get_user_unread_in_chats(user_id=user.id, chat_ids=chat_ids)
+
+
+@router.get('/search',
+            summary='Full-text search in the user chats, ordered by rank. Pass next_cursor back as cursor for the next page.',
+            response_model=MessageSearchPage)
+async def search(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)],
+        query: Annotated[str, Query(min_length=1)],
+        chat_id: int | None = None,
+        limit: Annotated[int, Query(ge=1, le=100)] = 20,
+        cursor: str | None = None
+):
+    after = None
+    if cursor:
+        try:
+            rank, message_id = cursor.split(':')
+            after = (float(rank), int(message_id))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Invalid cursor.'
+            )
+    return await backend.message_module.search(
+        user_id=user.id, text=query, chat_id=chat_id, limit=limit, after=after)
+
+
+@router.post('/send_batch',
+             summary='Send messages to one or more chats of the user in one transaction. '
+                     'Messages whose client_msg_id was already sent to the chat are returned as stored, '
+                     'marked as duplicate, so a failed batch can be retried as is.',
+             response_model=List[BatchSentMessage])
+async def send_batch(
+        messages: Annotated[List[OutgoingMessage], Body(min_length=1, max_length=500)],
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    if len({(message.chat_id, message.client_msg_id) for message in messages}) < len(messages):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='client_msg_id must be unique per chat in a batch.'
+        )
+    sent = await backend.message_module.send_messages(user_id=user.id, messages=messages)
+
+    # Only new messages are published, the duplicates were published by the send that stored them
+    new_messages = [message for message in sent.messages if not message.duplicate]
+    publications = [
+        (RedisChannelType.CHAT, message.chat_id, ServerChatMessage(
+            type=WsMessageType.MESSAGE,
+            user_id=user.id,
+            chat_id=message.chat_id,
+            content=message.content,
+            message_id=message.id,
+            seq=message.seq,
+            timestamp=message.timestamp
+        ))
+        for message in new_messages
+    ]
+    last_message_ids = {}
+    for message in new_messages:
+        last_message_ids[message.chat_id] = max(message.id, last_message_ids.get(message.chat_id, message.id))
+    for chat_id, last_message_id in last_message_ids.items():
+        publications.append((RedisChannelType.USER, user.id, ServerUserProgress(
+            type=WsMessageType.USER_PROGRESS,
+            user_id=user.id,
+            chat_id=chat_id,
+            last_read_message_id=last_message_id
+        )))
+        chat_progress = sent.chat_progress[chat_id]
+        previous_chat_progress = sent.previous_chat_progress[chat_id]
+        if not previous_chat_progress or chat_progress > previous_chat_progress:
+            publications.append((RedisChannelType.CHAT, chat_id, ServerChatProgress(
+                type=WsMessageType.CHAT_PROGRESS,
+                chat_id=chat_id,
+                last_read_message_id=chat_progress
+            )))
+    if publications:
+        await backend.redis_module.publish_many(publications)
+    return sent.messages
+
+
+EXPORT_COLUMNS = ['id', 'chat_id', 'seq', 'user_id', 'content', 'timestamp']
+
+
+@router.get('/export',
+            summary='The whole chat history, oldest first, as newline delimited JSON or CSV',
+            response_class=StreamingResponse)
+async def export(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)],
+        chat_id: int,
+        format: Literal['ndjson', 'csv'] = 'ndjson'
+):
+    chat: ChatFull | None = await backend.chat_module.get_chat(chat_id=chat_id)
+    if chat is None:
+        raise EntityDoesNotExistError(message='Chat does not exist')
+    user_in_chat = await backend.chat_module.check_user_in_chat(chat_id=chat_id, user_id=user.id)
+    if not user_in_chat:
+        raise Forbidden(message='You are not a chat participant')
+
+    async def ndjson():
+        async for messages in backend.message_module.export_messages(chat_id=chat_id):
+            yield ''.join(message.model_dump_json() + '\n' for message in messages)
+
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+        async for messages in backend.message_module.export_messages(chat_id=chat_id):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                (message.id, message.chat_id, message.seq, message.user_id, message.content,
+                 message.timestamp.isoformat())
+                for message in messages
+            )
+            yield buffer.getvalue()
+
+    headers = {'Content-Disposition': f'attachment; filename="chat-{chat_id}.{format}"'}
+    if format == 'csv':
+        return StreamingResponse(csv_rows(), media_type='text/csv', headers=headers)
+    return StreamingResponse(ndjson(), media_type='application/x-ndjson', headers=headers)
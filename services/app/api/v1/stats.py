@@ -0,0 +1,95 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+
+from services.app.api.v1.authentication import get_current_user
+from services.backend import Backend, get_backend
+from services.backend.modules.authentication.schemas import TokenRevocationStats, PasswordHashStats, \
+    PrincipalCacheStats
+from services.backend.modules.chat.schemas import MembershipCacheStats
+from services.backend.modules.message.schemas import HistoryCacheStats
+from services.backend.modules.progress.schemas import ProgressCoalescerStats
+from services.backend.modules.schemas import DirectoryCacheStats, RateLimitStats
+from services.backend.modules.user.schemas import UserBase
+
+router = APIRouter(prefix='/stats', tags=['stats'])
+
+
+@router.get('/progress_coalescer',
+            summary='Read progress write-behind counters of this instance',
+            response_model=ProgressCoalescerStats)
+async def progress_coalescer(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.progress_module.coalescer.stats
+
+
+@router.get('/history_cache',
+            summary='Recent chat history cache counters of this instance',
+            response_model=HistoryCacheStats)
+async def history_cache(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.message_module.history_cache.get_stats()
+
+
+@router.get('/token_revocations',
+            summary='Revoked token Bloom filter counters of this instance',
+            response_model=TokenRevocationStats)
+async def token_revocations(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.auth_module.revocations.get_stats()
+
+
+@router.get('/password_hashing',
+            summary='Password hashing pool counters of this instance',
+            response_model=PasswordHashStats)
+async def password_hashing(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.auth_module.password_hasher.get_stats()
+
+
+@router.get('/principal_cache',
+            summary='Authenticated principal cache counters of this instance',
+            response_model=PrincipalCacheStats)
+async def principal_cache(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.auth_module.principal_cache.get_stats()
+
+
+@router.get('/membership_cache',
+            summary='Chat membership cache counters of this instance',
+            response_model=MembershipCacheStats)
+async def membership_cache(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.chat_module.membership_cache.get_stats()
+
+
+@router.get('/directory_cache',
+            summary='Chat and user directory cache counters of this instance',
+            response_model=DirectoryCacheStats)
+async def directory_cache(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.directory_cache.get_stats()
+
+
+@router.get('/rate_limiter',
+            summary='WebSocket frame rate limiter counters of this instance',
+            response_model=RateLimitStats)
+async def rate_limiter(
+        backend: Annotated[Backend, Depends(get_backend)],
+        user: Annotated[UserBase, Depends(get_current_user)]
+):
+    return backend.rate_limiter.get_stats()
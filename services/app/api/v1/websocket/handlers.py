@@ -4,32 +4,34 @@ from fastapi import WebSocket
 from pydantic import ValidationError
 
 from services.app.schemas import UserChatMessage, ServerChatMessage, WsMessageType, UserChatProgress, \
-    ServerChatProgress, ServerUserProgress, RedisChannelType
+    ServerChatProgress, ServerUserProgress, RedisChannelType, ServerMessageAck
 from services.backend.module import Backend
-from services.db.models import User, ReadProgress
+from services.backend.modules.message.schemas import OutgoingMessage, SentMessage, MessageFull
+from services.backend.modules.user.schemas import UserBase
 
 
 class WebSocketHandler(ABC):
     @abstractmethod
-    async def __call__(self, backend: Backend, user: User, websocket: WebSocket, message: dict):
+    async def __call__(self, backend: Backend, user: UserBase, websocket: WebSocket, message: dict):
         pass
 
 
 class NewMessageHandler(WebSocketHandler):
-    async def __call__(self, backend: Backend, user: User, websocket: WebSocket, message: dict):
+    async def __call__(self, backend: Backend, user: UserBase, websocket: WebSocket, message: dict):
         try:
             message = UserChatMessage(**message)
         except ValidationError:
             raise
-        cur_chat_progress = await backend.progress_module.get_chat_progress(chat_id=message.chat_id)
-        new_message = await backend.message_module.store_message(
-            chat_id=message.chat_id,
-            user_id=user.id,
-            content=message.content
-        )
-        await backend.chat_module.store_chat_user_read_progress(
-            chat_id=new_message.chat_id, user_id=user.id, last_read_message_id=new_message.id)
-        new_chat_progress = await backend.progress_module.get_chat_progress(chat_id=message.chat_id)
+        if message.client_msg_id is None:
+            sent = await backend.message_module.send_message(
+                chat_id=message.chat_id,
+                user_id=user.id,
+                content=message.content
+            )
+        else:
+            sent = await self._send_once(backend=backend, user=user, websocket=websocket, message=message)
+            if sent is None:
+                return
 
         await backend.redis_module.publish(
             type=RedisChannelType.CHAT,
@@ -39,7 +41,9 @@ class NewMessageHandler(WebSocketHandler):
                 user_id=user.id,
                 chat_id=message.chat_id,
                 content=message.content,
-                message_id=new_message.id
+                message_id=sent.message.id,
+                seq=sent.message.seq,
+                timestamp=sent.message.timestamp
             ))
         await backend.redis_module.publish(
             type=RedisChannelType.USER,
@@ -48,30 +52,66 @@ class NewMessageHandler(WebSocketHandler):
                 type=WsMessageType.USER_PROGRESS,
                 user_id=user.id,
                 chat_id=message.chat_id,
-                last_read_message_id=new_message.id
+                last_read_message_id=sent.message.id
             )
         )
-        if not cur_chat_progress or new_chat_progress > cur_chat_progress:
+        if not sent.previous_chat_progress or sent.chat_progress > sent.previous_chat_progress:
             await backend.redis_module.publish(
                 type=RedisChannelType.CHAT,
                 key=message.chat_id,
                 message=ServerChatProgress(
                     type=WsMessageType.CHAT_PROGRESS,
                     chat_id=message.chat_id,
-                    last_read_message_id=new_chat_progress
+                    last_read_message_id=sent.chat_progress
                 )
             )
 
+    @staticmethod
+    async def _send_once(backend: Backend,
+                         user: UserBase,
+                         websocket: WebSocket,
+                         message: UserChatMessage) -> SentMessage | None:
+        # Stored under the unique client_msg_id, a retransmit gets the ack of the stored message
+        # and is neither stored nor broadcast again. None for a retransmit.
+        batch = await backend.message_module.send_messages(
+            user_id=user.id,
+            messages=[OutgoingMessage(chat_id=message.chat_id, content=message.content,
+                                      client_msg_id=message.client_msg_id)]
+        )
+        stored = batch.messages[0]
+        await websocket.send_text(ServerMessageAck(
+            type=WsMessageType.MESSAGE_ACK,
+            chat_id=stored.chat_id,
+            client_msg_id=stored.client_msg_id,
+            message_id=stored.id,
+            seq=stored.seq,
+            timestamp=stored.timestamp,
+            duplicate=stored.duplicate
+        ).model_dump_json())
+        if stored.duplicate:
+            return None
+        return SentMessage(
+            message=MessageFull(
+                id=stored.id,
+                chat_id=stored.chat_id,
+                seq=stored.seq,
+                user_id=stored.user_id,
+                content=stored.content,
+                timestamp=stored.timestamp
+            ),
+            previous_chat_progress=batch.previous_chat_progress[stored.chat_id],
+            chat_progress=batch.chat_progress[stored.chat_id]
+        )
+
+
 class ProgressHandler(WebSocketHandler):
-    async def __call__(self, backend: Backend, user: User, websocket: WebSocket, message: dict):
+    async def __call__(self, backend: Backend, user: UserBase, websocket: WebSocket, message: dict):
         try:
             message = UserChatProgress(**message)
         except ValidationError:
             raise
-        cur_chat_progress = await backend.progress_module.get_chat_progress(chat_id=message.chat_id)
-        progress: ReadProgress = await backend.chat_module.store_chat_user_read_progress(
+        progress = await backend.progress_module.coalescer.store(
             chat_id=message.chat_id, user_id=user.id, last_read_message_id=message.last_read_message_id)
-        new_chat_progress = await backend.progress_module.get_chat_progress(chat_id=message.chat_id)
         await backend.redis_module.publish(
             type=RedisChannelType.USER,
             key=user.id,
@@ -82,14 +122,14 @@ class ProgressHandler(WebSocketHandler):
                 last_read_message_id=progress.last_read_message_id
             )
         )
-        if not cur_chat_progress or new_chat_progress > cur_chat_progress:
+        if progress.chat_progress > progress.previous_chat_progress:
             await backend.redis_module.publish(
                 type=RedisChannelType.CHAT,
                 key=message.chat_id,
                 message=ServerChatProgress(
                     type=WsMessageType.CHAT_PROGRESS,
                     chat_id=message.chat_id,
-                    last_read_message_id=new_chat_progress
+                    last_read_message_id=progress.chat_progress
                 )
             )
 
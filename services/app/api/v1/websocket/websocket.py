@@ -6,9 +6,9 @@ from pydantic import ValidationError
 
 from services.app.api.v1.authentication import get_current_user
 from services.app.api.v1.websocket.handlers import get_handler
-from services.app.schemas import WsMessageBase
+from services.app.schemas import WsMessageBase, ServerErrorMessage, WsMessageType
 from services.backend import Backend, get_backend
-from services.db.models import User
+from services.backend.modules.user.schemas import UserBase
 
 router = APIRouter(tags=['ws'])
 
@@ -16,7 +16,7 @@ router = APIRouter(tags=['ws'])
 async def websocket_endpoint(
         websocket: WebSocket,
         backend: Annotated[Backend, Depends(get_backend)],
-        user: Annotated[User, Depends(get_current_user)]
+        user: Annotated[UserBase, Depends(get_current_user)]
 ):
     await backend.ws_module.connect_user(user_id=user.id, websocket=websocket)
     chats = await backend.chat_module.get_user_chats(user_id=user.id)
@@ -32,6 +32,18 @@ async def websocket_endpoint(
                 continue
             handler = get_handler(message_type=preparsed_message.type)
             if handler:
+                retry_after = await backend.rate_limiter.acquire(user_id=user.id, action=preparsed_message.type)
+                if retry_after:
+                    client_msg_id = message.get('client_msg_id')
+                    await websocket.send_text(ServerErrorMessage(
+                        type=WsMessageType.ERROR,
+                        code='rate_limited',
+                        detail='Too many messages, retry later',
+                        action=preparsed_message.type,
+                        retry_after=retry_after,
+                        client_msg_id=client_msg_id if isinstance(client_msg_id, str) else None
+                    ).model_dump_json())
+                    continue
                 await handler(
                     backend=backend,
                     user=user,
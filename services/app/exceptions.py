@@ -36,6 +36,10 @@ class InvalidTokenError(ChatAppError):
     pass
 
 
+class ServiceUnavailable(ChatAppError):
+    pass
+
+
 def create_exception_handler(
     status_code: int, initial_detail: str
 ) -> Callable[[Request, ChatAppError], JSONResponse]:
@@ -103,3 +107,11 @@ def add_custom_exception_handlers(app: FastAPI):
             initial_detail='Forbidden'
         )
     )
+
+    app.add_exception_handler(
+        exc_class_or_status_code=ServiceUnavailable,
+        handler=create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail='Service is unavailable'
+        )
+    )
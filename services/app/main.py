@@ -182,48 +182,36 @@ async def main():
                 }};
 
                 function fetchAllChats() {{
-                    fetchWithErrorHandling(`{settings.MAIN_URL_HTTP}/api/v1/chat/get_all`)
+                    let allChats = document.getElementById("allChats");
+                    allChats.innerHTML = "";
+                    fetchChatDirectoryPage(allChats, null);
+                }};
+
+                function fetchChatDirectoryPage(allChats, cursor) {{
+                    let url = `{settings.MAIN_URL_HTTP}/api/v1/chat/directory?limit=500`;
+                    if (cursor) {{
+                        url += `&cursor=${{cursor}}`;
+                    }}
+                    fetchWithErrorHandling(url)
                         .then(response => response.json())
-                        .then(data => {{                        
-                            let allChats = document.getElementById("allChats");
-                            allChats.innerHTML = "";
-                            data.forEach(chat => {{
+                        .then(data => {{
+                            data.chats.forEach(chat => {{
                                 let item = document.createElement("li");
                                 item.textContent = chat.name + " (ID: " + chat.id + ")";
                                 allChats.appendChild(item);
                             }});
+                            if (data.next_cursor) {{
+                                fetchChatDirectoryPage(allChats, data.next_cursor);
+                            }}
                         }});
                 }};
 
                 function fetchUserChats() {{
-                    fetchWithErrorHandling(`{settings.MAIN_URL_HTTP}/api/v1/chat/get_user_chats`)
+                    fetchWithErrorHandling(`{settings.MAIN_URL_HTTP}/api/v1/chat/inbox`)
                         .then(response => response.json())
                         .then(data => {{
-                            data.forEach(chat => {{
-                                let chat_obj = {{ id: chat.id, unread: 0, users: [] }};
-                
-                                let unreadPromise = fetchWithErrorHandling(
-                                    `{settings.MAIN_URL_HTTP}/api/v1/message/get_user_unread?chat_id=${{chat.id}}&user_id=${{currentUserId()}}`
-                                )
-                                    .then(response => response.text())
-                                    .then(unread_num => {{
-                                        chat_obj.unread = parseInt(unread_num, 10);
-                                    }});
-                
-                                let usersPromise = fetchWithErrorHandling(
-                                    `{settings.MAIN_URL_HTTP}/api/v1/chat/get_chat_users?chat_id=${{chat.id}}`
-                                )
-                                    .then(response => response.json())
-                                    .then(users => {{
-                                        chat_obj.users = users.map(user => user.id);
-                                    }});
-                
-                                Promise.all([unreadPromise, usersPromise]).then(() => {{
-                                    userChatsArray.push(chat_obj);
-                                    userChatsArray.sort((a, b) => a.id - b.id);
-                                    renderChats();
-                                }});
-                            }});
+                            userChatsArray = data.map(chat => ({{ id: chat.id, unread: chat.unread, users: chat.users }}));
+                            renderChats();
                         }});
                 }};
 
@@ -1,4 +1,5 @@
 import enum
+from datetime import datetime
 from enum import Enum
 from typing import Literal
 
@@ -20,6 +21,8 @@ class WsMessageType(str, enum.Enum):
     USER_PROGRESS = 'user_progress'
     NEW_USER = 'new_user'
     USER_LEFT = 'user_left'
+    MESSAGE_ACK = 'message_ack'
+    ERROR = 'error'
 
 
 class WsMessageBase(BaseModel):
@@ -36,6 +39,8 @@ class UserChatMessage(UserWsMessage):
     type: Literal[WsMessageType.MESSAGE]
     chat_id: int
     content: str
+    # Resending with the same key is acknowledged with the stored message instead of sending it again
+    client_msg_id: str | None = None
 
 
 class UserChatProgress(UserWsMessage):
@@ -58,6 +63,8 @@ class ServerChatMessage(ServerWsMessageWithUser):
     type: Literal[WsMessageType.MESSAGE]
     content: str | None
     message_id: int
+    seq: int | None = None
+    timestamp: datetime | None = None
 
 
 class ServerNewUserMessage(ServerWsMessageWithUser):
@@ -82,6 +89,27 @@ class ServerUserProgress(ServerWsMessageWithUser):
     last_read_message_id: int
 
 
+# Sent only to the socket the message came from, once it is stored
+class ServerMessageAck(ServerWsMessage):
+    type: Literal[WsMessageType.MESSAGE_ACK]
+    client_msg_id: str
+    message_id: int
+    seq: int
+    timestamp: datetime
+    duplicate: bool
+
+
+# Sent only to the socket whose frame was rejected, the frame is dropped
+class ServerErrorMessage(WsMessageBase):
+    type: Literal[WsMessageType.ERROR]
+    code: str
+    detail: str
+    # Type of the rejected frame
+    action: WsMessageType
+    retry_after: float | None = None
+    client_msg_id: str | None = None
+
+
 def parse_server_message(message: dict) -> ServerWsMessage | ServerWsMessageWithUser |None:
     mapping: dict[WsMessageType | str, type(ServerWsMessage)] = {
         WsMessageType.MESSAGE: ServerChatMessage,
@@ -117,6 +145,7 @@ class UserData(BaseModel):
 
 class TokenData(BaseModel):
     user_id: int
+    expires_at: int | None = None
 
 
 class Token(BaseModel):
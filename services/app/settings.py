@@ -1,4 +1,5 @@
 from datetime import timedelta
+from typing import List
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -11,18 +12,33 @@ class DatabaseSettings(BaseSettings):
     DB_NAME: str = ""
     DB_USER: str = ""
     DB_PASS: str = ""
+    # Comma separated host:port list of streaming replicas, same database and credentials as the primary
+    DB_REPLICA_HOSTS: str = ""
+    DB_REPLICA_MAX_LAG_SECONDS: float = 1.0
+    DB_REPLICA_LAG_CHECK_SECONDS: float = 1.0
+    # Connection pool of every replica engine, each replica has its own max_connections to fit into
+    DB_REPLICA_POOL_SIZE: int = 10
+    DB_REPLICA_MAX_OVERFLOW: int = 20
 
     model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
 
     def get_db_url(self) -> str:
         return f'postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}'
 
+    def get_db_replica_urls(self) -> List[str]:
+        return [
+            f'postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{host.strip()}/{self.DB_NAME}'
+            for host in self.DB_REPLICA_HOSTS.split(',') if host.strip()
+        ]
+
 
 class SecuritySettings(BaseSettings):
     SECRET_KEY: str = ""
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
 
     model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
 
@@ -44,6 +60,69 @@ class RedisSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
 
 
+class ArchiveSettings(BaseSettings):
+    MESSAGE_ARCHIVE_AFTER_DAYS: int = 90
+    MESSAGE_ARCHIVE_BLOCK_SIZE: int = 1000
+    MESSAGE_ARCHIVE_KEEP_LAST: int = 500
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
+class ProgressSettings(BaseSettings):
+    PROGRESS_FLUSH_INTERVAL_MS: float = 5
+    PROGRESS_FLUSH_MAX_BATCH: int = 500
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
+class HistoryCacheSettings(BaseSettings):
+    HISTORY_CACHE_CHATS: int = 10_000
+    HISTORY_CACHE_MESSAGES: int = 200
+    HISTORY_CACHE_TTL_SECONDS: float = 60
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
+class TokenRevocationSettings(BaseSettings):
+    TOKEN_REVOCATION_BLOOM_CAPACITY: int = 1_000_000
+    TOKEN_REVOCATION_BLOOM_ERROR_RATE: float = 0.001
+    TOKEN_REVOCATION_BLOOM_REBUILD_SECONDS: float = 60 * 60
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
+class PrincipalCacheSettings(BaseSettings):
+    PRINCIPAL_CACHE_SIZE: int = 100_000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 5 * 60
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
+class MembershipCacheSettings(BaseSettings):
+    MEMBERSHIP_CACHE_USERS: int = 100_000
+    MEMBERSHIP_CACHE_TTL_SECONDS: float = 60
+    MEMBERSHIP_CACHE_REDIS_TTL_SECONDS: int = 60 * 60
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
+class DirectoryCacheSettings(BaseSettings):
+    DIRECTORY_CACHE_SIZE: int = 50_000
+    DIRECTORY_CACHE_TTL_SECONDS: float = 30
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
+class RateLimitSettings(BaseSettings):
+    RATE_LIMIT_MESSAGES_PER_SECOND: float = 5
+    RATE_LIMIT_MESSAGES_BURST: int = 20
+    RATE_LIMIT_PROGRESS_PER_SECOND: float = 10
+    RATE_LIMIT_PROGRESS_BURST: int = 50
+    RATE_LIMIT_LOCAL_BUCKETS: int = 100_000
+
+    model_config = SettingsConfigDict(env_file=".env", frozen=True, env_ignore_empty=True)
+
+
 class FrontendSettings(BaseSettings):
     MAIN_URL_HTTP: str = ""
     MAIN_URL_WS: str = ""
@@ -55,6 +134,14 @@ class Settings(
     DatabaseSettings,
     SecuritySettings,
     RedisSettings,
+    ArchiveSettings,
+    ProgressSettings,
+    HistoryCacheSettings,
+    TokenRevocationSettings,
+    PrincipalCacheSettings,
+    MembershipCacheSettings,
+    DirectoryCacheSettings,
+    RateLimitSettings,
     FrontendSettings
 ):
     pass
@@ -1,8 +1,12 @@
 from functools import lru_cache
 from services.backend.modules.chat import ChatModule
+from services.backend.modules.chat.membership_cache import MembershipCache
+from services.backend.modules.directory_cache import DirectoryCache
 from services.backend.modules.authentication import AuthenticationModule
+from services.backend.modules.authentication.revocation import TokenRevocations
 from services.backend.modules.message import MessageModule
 from services.backend.modules.progress import ProgressModule
+from services.backend.modules.rate_limit import RateLimiter
 from services.backend.modules.redis import RedisModule, get_redis_module
 from services.backend.modules.user import UserModule
 from services.backend.modules.websocket import WebsocketModule, get_ws_module
@@ -11,16 +15,30 @@ from services.db import Db, get_db
 
 class Backend:
     def __init__(self, db: Db):
-        self.auth_module = AuthenticationModule(db=db)
-        self.chat_module: ChatModule = ChatModule(db=db)
+        self.redis_module: RedisModule = get_redis_module()
+        db.set_redis_client(redis_client=self.redis_module.redis)
+        self.auth_module = AuthenticationModule(
+            db=db,
+            revocations=TokenRevocations(redis_client=self.redis_module.redis)
+        )
+        self.directory_cache = DirectoryCache()
+        self.chat_module: ChatModule = ChatModule(
+            db=db,
+            membership_cache=MembershipCache(redis_client=self.redis_module.redis),
+            directory_cache=self.directory_cache
+        )
         self.message_module: MessageModule = MessageModule(db=db)
-        self.user_module: UserModule = UserModule(db=db)
+        self.user_module: UserModule = UserModule(db=db, directory_cache=self.directory_cache)
         self.progress_module: ProgressModule = ProgressModule(db=db)
+        self.rate_limiter = RateLimiter(redis_client=self.redis_module.redis)
 
         self.ws_module: WebsocketModule = get_ws_module()
-        self.redis_module: RedisModule = get_redis_module()
         self.ws_module.set_redis_module(redis_module=self.redis_module)
         self.redis_module.set_websocket_module(ws_module=self.ws_module)
+        self.chat_module.membership_cache.set_redis_module(redis_module=self.redis_module)
+        self.redis_module.add_listener(listener=self.message_module.history_cache)
+        self.redis_module.add_listener(listener=self.chat_module.membership_cache)
+        self.redis_module.add_listener(listener=self.chat_module)
 
 
 @lru_cache
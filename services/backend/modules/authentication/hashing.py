@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import bcrypt
+
+from services.app.exceptions import ServiceUnavailable
+from services.app.settings import settings
+from services.backend.modules.authentication.schemas import PasswordHashStats
+
+T = TypeVar('T')
+
+
+# bcrypt releases the GIL, so hashing on a few dedicated threads keeps the event loop - and with it the websocket
+# fan-out of the instance - responsive during login bursts. Work beyond the workers waits in a bounded queue,
+# anything beyond that is rejected right away instead of piling up behind requests that will time out anyway.
+class PasswordHasher:
+    def __init__(self,
+                 workers: int = settings.PASSWORD_HASH_WORKERS,
+                 queue_size: int = settings.PASSWORD_HASH_QUEUE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.limit = workers + queue_size
+        self.pending = 0
+        self.stats = PasswordHashStats()
+
+    async def check(self, password: str, hashed_password: str) -> bool:
+        return await self._run(bcrypt.checkpw, password.encode(), hashed_password.encode())
+
+    async def hash(self, password: str) -> str:
+        hashed_password = await self._run(bcrypt.hashpw, password.encode(), bcrypt.gensalt())
+        return hashed_password.decode()
+
+    def get_stats(self) -> PasswordHashStats:
+        return self.stats.model_copy(update={'pending': self.pending})
+
+    async def _run(self, function: Callable[..., T], *args) -> T:
+        if self.pending >= self.limit:
+            self.stats.rejected += 1
+            raise ServiceUnavailable(message='Too many logins at once, try again later', name='AuthenticationModule')
+        self.pending += 1
+        self.stats.max_pending = max(self.stats.max_pending, self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+            self.stats.completed += 1
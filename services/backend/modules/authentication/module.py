@@ -1,31 +1,45 @@
+import secrets
 from datetime import datetime, UTC
 from typing import Tuple, Optional, Any
 
 from services.app.logger import logger
-from services.db.models import TokenBlacklist
 
-import bcrypt
 import jwt
 from jwt import PyJWTError
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 
 from services.app.schemas import Cookie, TokenData, TokenType
 from services.app.settings import settings
 from services.backend.exceptions import BackendServiceException
-from services.backend.modules.base import ModuleWithDb
+from services.backend.modules.authentication.hashing import PasswordHasher
+from services.backend.modules.authentication.principal_cache import PrincipalCache
+from services.backend.modules.authentication.revocation import TokenRevocations, get_token_digest
+from services.backend.modules.base import ModuleWithDb, project_rows
+from services.backend.modules.user.schemas import UserBase
+from services.db import Db
 from services.db.models import User
 
+CURRENT_USER_QUERY = select(User.id, User.name).where(User.id == bindparam('user_id'))
+
 
 class AuthenticationModule(ModuleWithDb):
+    def __init__(self, db: Db, revocations: TokenRevocations):
+        super().__init__(db=db)
+        self.revocations = revocations
+        self.password_hasher = PasswordHasher()
+        self.principal_cache = PrincipalCache()
+        self.revocations.add_listener(self.principal_cache.on_revoked)
+
     async def login(self, email: str, password: str) -> Tuple[User, Cookie, Cookie]:
         user = await self._authenticate_user(email=email, password=password)
         if not user:
             raise BackendServiceException('Invalid authentication credentials.')
 
-        access_token_val = await self._create_token(data={'sub': str(user.id)}, token_type=TokenType.ACCESS)
+        # Freshly signed tokens need no verification, so issuing them is pure CPU work
+        access_token_val = self._create_token(data={'sub': str(user.id)}, token_type=TokenType.ACCESS)
         access_max_age = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
 
-        refresh_token_val = await self._create_token(data={'sub': str(user.id)}, token_type=TokenType.REFRESH)
+        refresh_token_val = self._create_token(data={'sub': str(user.id)}, token_type=TokenType.REFRESH)
         refresh_max_age = settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
 
         access_token = Cookie(
@@ -54,9 +68,9 @@ class AuthenticationModule(ModuleWithDb):
         if not user_data:
             raise BackendServiceException('Invalid refresh token.')
 
-        access_token = await self._create_token(data={'sub': str(user_data.user_id)}, token_type=TokenType.ACCESS)
+        access_token = self._create_token(data={'sub': str(user_data.user_id)}, token_type=TokenType.ACCESS)
         if cur_access_token:
-            await self._blacklist_token(cur_access_token)
+            await self._blacklist_tokens(cur_access_token)
         access_max_age = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
 
         access_token = Cookie(
@@ -70,47 +84,43 @@ class AuthenticationModule(ModuleWithDb):
 
         return access_token
 
-    async def get_current_user(self, token: str) -> User | None:
+    async def get_current_user(self, token: str) -> UserBase:
+        digest = get_token_digest(token)
+        principal = self.principal_cache.get(digest)
+        if principal is not None:
+            return principal.user
+
+        # A revocation arriving while the token is verified and the user loaded must not be cached over
+        revocations_version = self.revocations.version
         token_data = await self._verify_token(token, TokenType.ACCESS)
         if token_data is None:
             raise BackendServiceException("User not authenticated.")
 
-        query = select(User).where(User.id == token_data.user_id)
-        async with self.db.session_scope() as sess:
-            result = await sess.execute(query)
-            db_user = result.scalar_one_or_none()
-            sess.expunge_all()
+        async with self.db.read_session_scope(('user', token_data.user_id)) as sess:
+            result = await sess.execute(CURRENT_USER_QUERY, {'user_id': token_data.user_id})
+            users = project_rows(UserBase, result)
 
-        if db_user:
-            return db_user
-        else:
+        if not users:
             raise BackendServiceException("User not found.")
+        if self.revocations.in_sync and self.revocations.version == revocations_version:
+            self.principal_cache.put(digest=digest, token_data=token_data, user=users[0],
+                                     token_expires_at=token_data.expires_at)
+        return users[0]
 
     async def logout(self, access_token: Optional[str], refresh_token: Optional[str]):
-        if access_token:
-            try:
-                await self._blacklist_token(token=access_token)
-            except:
-                pass
-        if refresh_token:
-            try:
-                await self._blacklist_token(token=refresh_token)
-            except:
-                pass
+        await self._blacklist_tokens(access_token, refresh_token)
 
-    @staticmethod
-    async def _verify_password(plain_password: str, hashed_password: str) -> bool:
-        correct_password: bool = bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+    async def _verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        correct_password: bool = await self.password_hasher.check(plain_password, hashed_password)
         return correct_password
 
-    @staticmethod
-    def _get_password_hash(password: str) -> str:
-        hashed_password: str = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    async def _get_password_hash(self, password: str) -> str:
+        hashed_password: str = await self.password_hasher.hash(password)
         return hashed_password
 
     async def _authenticate_user(self, email: str, password: str) -> User | None:
         query = select(User).where(User.email == email)
-        async with self.db.session_scope() as sess:
+        async with self.db.read_session_scope() as sess:
             result = await sess.execute(query)
             db_user = result.scalar_one_or_none()
             sess.expunge_all()
@@ -121,23 +131,18 @@ class AuthenticationModule(ModuleWithDb):
 
         return db_user
 
-    async def _create_token(self,
-                            data: dict[str, Any],
-                            token_type: TokenType
-                            ) -> str:
+    @staticmethod
+    def _create_token(data: dict[str, Any], token_type: TokenType) -> str:
         to_encode = data.copy()
         expire = datetime.now(UTC).replace(tzinfo=None) + settings.get_expiration(token_type=token_type)
-        to_encode.update({"exp": expire, "token_type": token_type})
+        # Tokens issued within the same second would be identical otherwise, and revoking the access token
+        # replaced on refresh would revoke its successor as well
+        to_encode.update({"exp": expire, "token_type": token_type, "jti": secrets.token_urlsafe(8)})
         encoded_jwt: str = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-        await self._verify_token(token=encoded_jwt, expected_token_type=token_type)
         return encoded_jwt
 
     async def _verify_token(self, token: str, expected_token_type: TokenType) -> TokenData | None:
-        query = select(TokenBlacklist).where(TokenBlacklist.token == token)
-        async with self.db.session_scope() as sess:
-            result = await sess.execute(query)
-            is_blacklisted = result.scalar_one_or_none()
-        if is_blacklisted:
+        if await self.revocations.is_revoked(token):
             return None
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -145,7 +150,7 @@ class AuthenticationModule(ModuleWithDb):
             token_type: str = payload.get("token_type")
             if user_id is None or token_type != expected_token_type:
                 return None
-            return TokenData(user_id=int(user_id))
+            return TokenData(user_id=int(user_id), expires_at=payload.get("exp"))
         except PyJWTError as e:
             logger.exception(e)
             return None
@@ -153,13 +158,16 @@ class AuthenticationModule(ModuleWithDb):
             logger.exception(e)
             return None
 
-    async def _blacklist_token(self, token: str) -> None:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        expires_at = datetime.fromtimestamp(payload.get("exp"))
-        async with self.db.session_scope() as sess:
-            sess.add_all([
-                TokenBlacklist(
-                    token=token,
-                    expires_at=expires_at
-                )
-            ])
+    async def _blacklist_tokens(self, *tokens: Optional[str]) -> None:
+        # Tokens that are forged or already expired need no revocation, the rest is revoked in one batch
+        revoked = []
+        for token in tokens:
+            if not token:
+                continue
+            try:
+                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            except PyJWTError:
+                continue
+            revoked.append((token, payload.get("exp")))
+        if revoked:
+            await self.revocations.revoke_many(revoked)
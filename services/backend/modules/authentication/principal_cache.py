@@ -0,0 +1,64 @@
+import time
+from collections import OrderedDict
+
+from services.app.schemas import TokenData
+from services.app.settings import settings
+from services.backend.modules.authentication.schemas import PrincipalCacheStats
+from services.backend.modules.user.schemas import UserBase
+
+
+class Principal:
+    __slots__ = ('token_data', 'user', 'expires_at')
+
+    def __init__(self, token_data: TokenData, user: UserBase, expires_at: float):
+        self.token_data = token_data
+        self.user = user
+        self.expires_at = expires_at
+
+
+# Verified tokens with their user, keyed by the token digest, LRU evicted. An entry lives until the token expires
+# or for the TTL, whichever comes first. It is dropped as soon as the token revocations report the token as revoked,
+# and all entries are dropped when revocations may have been missed.
+class PrincipalCache:
+    def __init__(self,
+                 size: int = settings.PRINCIPAL_CACHE_SIZE,
+                 ttl: float = settings.PRINCIPAL_CACHE_TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self.stats = PrincipalCacheStats()
+        self._principals: OrderedDict[bytes, Principal] = OrderedDict()
+
+    def get(self, digest: bytes) -> Principal | None:
+        principal = self._principals.get(digest)
+        if principal is None:
+            self.stats.misses += 1
+            return None
+        if time.time() >= principal.expires_at:
+            del self._principals[digest]
+            self.stats.misses += 1
+            return None
+        self._principals.move_to_end(digest)
+        self.stats.hits += 1
+        return principal
+
+    def put(self, digest: bytes, token_data: TokenData, user: UserBase, token_expires_at: float):
+        expires_at = min(token_expires_at, time.time() + self.ttl)
+        self._principals[digest] = Principal(token_data=token_data, user=user, expires_at=expires_at)
+        self._principals.move_to_end(digest)
+        while len(self._principals) > self.size:
+            self._principals.popitem(last=False)
+            self.stats.evictions += 1
+
+    def on_revoked(self, digest: bytes | None):
+        if digest is None:
+            self.stats.invalidations += len(self._principals)
+            self._principals.clear()
+        elif self._principals.pop(digest, None) is not None:
+            self.stats.invalidations += 1
+
+    def get_stats(self) -> PrincipalCacheStats:
+        reads = self.stats.hits + self.stats.misses
+        return self.stats.model_copy(update={
+            'hit_ratio': self.stats.hits / reads if reads else 0,
+            'principals': len(self._principals)
+        })
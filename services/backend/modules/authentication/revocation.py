@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import math
+import time
+from typing import Callable, List, Tuple
+
+import redis.asyncio as redis
+
+from services.app.logger import logger
+from services.app.settings import settings
+from services.backend.modules.authentication.schemas import TokenRevocationStats
+
+REVOKED_TOKEN_PREFIX = 'revoked_token:'
+REVOCATION_CHANNEL = 'token_revocation'
+SCAN_BATCH = 1000
+RESUBSCRIBE_DELAY = 1
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, digest: bytes):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def _positions(self, digest: bytes):
+        # Double hashing over two halves of a sha256 digest
+        first = int.from_bytes(digest[:8])
+        second = int.from_bytes(digest[8:16]) | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+
+def get_token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+# Revoked tokens are redis keys expiring together with the token, so nothing has to purge them.
+# Every instance keeps a Bloom filter of the revoked tokens in front of redis: a token that is not in the filter
+# is not revoked and needs no network round trip, a hit is confirmed against redis.
+# The filter is only trusted while it is in sync - it is rebuilt from the keys after subscribing to the revocation
+# channel and periodically (expired tokens are dropped that way). The channel is read by its own task meanwhile,
+# so revocations published during a rebuild go into the filter in use and the one being built alike.
+# Until the first rebuild, and after losing the channel, every check goes to redis.
+# Other instances see a revocation once it went through the channel, which is the usual pub/sub latency.
+# Listeners are told about every revocation this instance learns of, with None when revocations may have been missed.
+class TokenRevocations:
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 capacity: int = settings.TOKEN_REVOCATION_BLOOM_CAPACITY,
+                 error_rate: float = settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE,
+                 rebuild_interval: float = settings.TOKEN_REVOCATION_BLOOM_REBUILD_SECONDS):
+        self.redis = redis_client
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.stats = TokenRevocationStats()
+        self._filter: BloomFilter | None = None
+        self._next_filter: BloomFilter | None = None
+        self._sync_task: asyncio.Task | None = None
+        self._listeners: List[Callable[[bytes | None], None]] = []
+        # Bumped on every notification, so a reader can tell whether a revocation arrived while it was awaiting
+        self.version = 0
+
+    @property
+    def in_sync(self) -> bool:
+        return self._filter is not None
+
+    async def revoke(self, token: str, expires_at: float):
+        await self.revoke_many([(token, expires_at)])
+
+    async def revoke_many(self, tokens: List[Tuple[str, float]]):
+        # The keys and the notifications of all tokens go to redis in one round trip
+        now = time.time()
+        digests = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for token, expires_at in tokens:
+                ttl = math.ceil(expires_at - now)
+                if ttl <= 0:
+                    continue
+                digest = get_token_digest(token)
+                pipe.set(REVOKED_TOKEN_PREFIX + digest.hex(), 1, ex=ttl)
+                pipe.publish(REVOCATION_CHANNEL, digest.hex())
+                digests.append(digest)
+            if not digests:
+                return
+            # This instance rejects the tokens right away, a filter hit is confirmed against redis anyway
+            for digest in digests:
+                self._add(digest)
+            await pipe.execute()
+        self.stats.revoked += len(digests)
+
+    async def is_revoked(self, token: str) -> bool:
+        self._start_sync()
+        digest = get_token_digest(token)
+        if self._filter is not None and digest not in self._filter:
+            self.stats.filter_negatives += 1
+            return False
+        self.stats.redis_checks += 1
+        revoked = bool(await self.redis.exists(REVOKED_TOKEN_PREFIX + digest.hex()))
+        if not revoked and self._filter is not None:
+            self.stats.false_positives += 1
+        return revoked
+
+    def add_listener(self, listener: Callable[[bytes | None], None]):
+        self._listeners.append(listener)
+
+    def get_stats(self) -> TokenRevocationStats:
+        return self.stats.model_copy(update={
+            'in_sync': self.in_sync,
+            'filter_entries': self._filter.count if self._filter else 0
+        })
+
+    async def stop(self):
+        if self._sync_task:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        self._lose_sync()
+
+    def _start_sync(self):
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync())
+
+    def _add(self, digest: bytes):
+        if self._filter is not None:
+            self._filter.add(digest)
+        if self._next_filter is not None:
+            self._next_filter.add(digest)
+        self._notify(digest)
+
+    def _lose_sync(self):
+        self._filter = None
+        self._next_filter = None
+        self._notify(None)
+
+    def _notify(self, digest: bytes | None):
+        self.version += 1
+        for listener in self._listeners:
+            listener(digest)
+
+    async def _sync(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            listening: asyncio.Task | None = None
+            try:
+                await pubsub.subscribe(REVOCATION_CHANNEL)
+                listening = asyncio.create_task(self._listen(pubsub))
+                while True:
+                    await self._rebuild(listening)
+                    await asyncio.wait([listening], timeout=self.rebuild_interval)
+                    if listening.done():
+                        listening.result()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'Token revocation sync lost, checking every token in redis - {e!r}')
+                self._lose_sync()
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+            finally:
+                if listening is not None:
+                    listening.cancel()
+                    await asyncio.gather(listening, return_exceptions=True)
+                await pubsub.aclose()
+
+    async def _listen(self, pubsub):
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+            if message and message['type'] == 'message':
+                self._add(bytes.fromhex(message['data'].decode()))
+
+    async def _rebuild(self, listening: asyncio.Task):
+        self._next_filter = BloomFilter(capacity=self.capacity, error_rate=self.error_rate)
+        async for key in self.redis.scan_iter(match=REVOKED_TOKEN_PREFIX + '*', count=SCAN_BATCH):
+            self._next_filter.add(bytes.fromhex(key.decode().removeprefix(REVOKED_TOKEN_PREFIX)))
+        # Revocations published after the channel was lost during the scan are missing from the filter
+        if listening.done():
+            listening.result()
+        self._filter, self._next_filter = self._next_filter, None
+        self.stats.rebuilds += 1
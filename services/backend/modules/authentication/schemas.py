@@ -0,0 +1,29 @@
+from pydantic import BaseModel
+
+
+class TokenRevocationStats(BaseModel):
+    revoked: int = 0
+    # Checks answered by the Bloom filter without a redis round trip
+    filter_negatives: int = 0
+    redis_checks: int = 0
+    # Redis checks of tokens the filter matched although they were not revoked
+    false_positives: int = 0
+    rebuilds: int = 0
+    in_sync: bool = False
+    filter_entries: int = 0
+
+
+class PasswordHashStats(BaseModel):
+    completed: int = 0
+    rejected: int = 0
+    pending: int = 0
+    max_pending: int = 0
+
+
+class PrincipalCacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    hit_ratio: float = 0
+    invalidations: int = 0
+    evictions: int = 0
+    principals: int = 0
@@ -1,6 +1,31 @@
+from typing import Awaitable, Callable, Hashable, List, Type, TypeVar
+
+from pydantic import BaseModel
+from sqlalchemy import Result
+
+from services.backend.modules.directory_cache import DirectoryCache
 from services.db import Db
 
+M = TypeVar('M', bound=BaseModel)
+T = TypeVar('T')
+
 
 class ModuleWithDb:
-    def __init__(self, db : Db):
+    def __init__(self, db : Db, directory_cache: DirectoryCache | None = None):
         self.db = db
+        self.directory_cache = directory_cache
+
+    async def read_through(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        if self.directory_cache is None:
+            return await load()
+        return await self.directory_cache.get(key, load)
+
+    def invalidate(self, *keys: Hashable):
+        if self.directory_cache is not None:
+            self.directory_cache.invalidate(*keys)
+
+
+def project_rows(model: Type[M], result: Result) -> List[M]:
+    # Column labels match the model fields and the values come from typed columns, so validation is skipped
+    keys = list(result.keys())
+    return [model.model_construct(**dict(zip(keys, row))) for row in result]
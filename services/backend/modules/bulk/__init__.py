@@ -0,0 +1 @@
+from .module import BulkModule
\ No newline at end of file
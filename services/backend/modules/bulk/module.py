@@ -0,0 +1,190 @@
+import gzip
+import json
+import struct
+import time
+from typing import BinaryIO, List, AsyncIterator
+
+from asyncpg import Connection, IntegrityConstraintViolationError
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.app.exceptions import EntityAlreadyExistsError, InvalidOperationError
+from services.backend.modules.base import ModuleWithDb
+from services.backend.modules.bulk.schemas import BulkTransferStats
+from services.db.models import Chat
+
+# Export file: gzip stream of MAGIC + FORMAT_VERSION followed by frames of a (kind, length) header and a payload.
+# The manifest frame comes first, then per table a table frame, the PostgreSQL binary COPY stream in data frames
+# and an end frame with the row count. Binary COPY needs identical column types on both sides, so an export
+# can only be imported into a database at the same schema revision.
+MAGIC = b'CHATBULK'
+FORMAT_VERSION = 1
+FRAME_HEADER = struct.Struct('>BI')
+FRAME_MANIFEST, FRAME_TABLE, FRAME_DATA, FRAME_END = range(4)
+COMPRESS_LEVEL = 1
+
+# Tables in foreign key order, with the column selecting the rows of the exported chats
+TABLES = (
+    ('chat', 'id', ('id', 'name', 'type', 'common_read_message_id', 'last_seq', 'membership_version')),
+    ('chat_participant', 'chat_id', ('chat_id', 'user_id')),
+    ('message', 'chat_id', ('id', 'chat_id', 'seq', 'user_id', 'content', 'timestamp', 'client_msg_id')),
+    ('message_archive', 'chat_id', ('chat_id', 'first_message_id', 'last_message_id', 'first_seq', 'last_seq',
+                                    'message_count', 'user_counts', 'payload', 'message_ids', 'message_seqs')),
+    ('read_progress', 'chat_id', ('chat_id', 'user_id', 'last_read_message_id', 'last_read_seq')),
+)
+
+REVISION_QUERY = text('SELECT version_num FROM alembic_version')
+# IDs are imported as they are, the sequences must not hand them out again
+SEQUENCES_QUERY = text(
+    "SELECT setval(pg_get_serial_sequence('chat', 'id'), "
+    "              greatest((SELECT max(id) FROM chat), nextval(pg_get_serial_sequence('chat', 'id')))), "
+    "       setval(pg_get_serial_sequence('message', 'id'), "
+    "              greatest((SELECT max(id) FROM message), nextval(pg_get_serial_sequence('message', 'id'))))"
+)
+
+# The participants COPY is one statement, so the membership trigger bumped every imported chat with members once
+MEMBERSHIP_VERSION_QUERY = text(
+    'UPDATE chat SET membership_version = membership_version - 1 '
+    'WHERE id = ANY(:chat_ids) AND EXISTS (SELECT FROM chat_participant WHERE chat_id = chat.id)'
+)
+
+
+# Moves whole chats - members, hot and archived messages, read progress - in and out of the database with COPY.
+# Chat and message IDs are kept, so the users of the chats must exist in the target database and the chats must not.
+class BulkModule(ModuleWithDb):
+    async def export_chats(self, chat_ids: List[int], output: BinaryIO) -> BulkTransferStats:
+        started = time.perf_counter()
+        stats = BulkTransferStats()
+        async with self.db.read_session_scope(*(('chat', chat_id) for chat_id in chat_ids)) as sess:
+            # All tables are read from the same snapshot
+            await sess.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            revision = await self._get_revision(sess)
+            driver = await self._get_driver_connection(sess)
+            with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=COMPRESS_LEVEL) as archive:
+                await self._copy_out(driver=driver, chat_ids=chat_ids, revision=revision, archive=archive, stats=stats)
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    async def import_chats(self, source: BinaryIO) -> BulkTransferStats:
+        started = time.perf_counter()
+        stats = BulkTransferStats()
+        with gzip.GzipFile(fileobj=source, mode='rb') as archive:
+            async with self.db.session_scope() as sess:
+                revision = await self._get_revision(sess)
+                chat_ids = self._read_manifest(archive=archive, revision=revision)
+                result = await sess.execute(select(Chat.id).where(Chat.id.in_(chat_ids)))
+                existing = result.scalars().all()
+                if existing:
+                    raise EntityAlreadyExistsError(
+                        message=f'Chats {sorted(existing)} already exist',
+                        name='BulkModule'
+                    )
+                driver = await self._get_driver_connection(sess)
+                try:
+                    await self._copy_in(driver=driver, archive=archive, stats=stats)
+                except IntegrityConstraintViolationError as e:
+                    raise InvalidOperationError(
+                        message=f'Error while importing the chats - {e}',
+                        name='BulkModule'
+                    )
+                await sess.execute(SEQUENCES_QUERY)
+                await sess.execute(MEMBERSHIP_VERSION_QUERY, {'chat_ids': chat_ids})
+        await self.db.mark_written(*(('chat', chat_id) for chat_id in chat_ids))
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    @staticmethod
+    async def _get_revision(sess: AsyncSession) -> str:
+        # Also begins the transaction the COPY statements on the driver connection then run in
+        result = await sess.execute(REVISION_QUERY)
+        return result.scalar_one()
+
+    @staticmethod
+    async def _get_driver_connection(sess: AsyncSession) -> Connection:
+        conn = await sess.connection()
+        raw_connection = await conn.get_raw_connection()
+        return raw_connection.driver_connection
+
+    async def _copy_out(self, driver: Connection, chat_ids: List[int], revision: str, archive: BinaryIO,
+                        stats: BulkTransferStats):
+        archive.write(MAGIC + bytes([FORMAT_VERSION]))
+        self._write_json(archive, FRAME_MANIFEST, {'revision': revision, 'chat_ids': chat_ids})
+
+        async def write_data(data: bytes):
+            stats.bytes += len(data)
+            self._write_frame(archive, FRAME_DATA, data)
+
+        for table, key, columns in TABLES:
+            self._write_json(archive, FRAME_TABLE, {'table': table, 'columns': columns})
+            status = await driver.copy_from_query(
+                f'SELECT {", ".join(columns)} FROM {table} WHERE {key} = ANY($1::int[])',
+                chat_ids,
+                output=write_data,
+                format='binary'
+            )
+            stats.rows[table] = self._copied_rows(status)
+            self._write_json(archive, FRAME_END, {'rows': stats.rows[table]})
+
+    def _read_manifest(self, archive: BinaryIO, revision: str) -> List[int]:
+        if archive.read(len(MAGIC) + 1) != MAGIC + bytes([FORMAT_VERSION]):
+            raise InvalidOperationError(message='Not a chat export', name='BulkModule')
+        manifest = self._read_json(archive, FRAME_MANIFEST)
+        if manifest['revision'] != revision:
+            raise InvalidOperationError(
+                message=f'Export is of schema revision {manifest['revision']}, the database is at {revision}',
+                name='BulkModule'
+            )
+        return manifest['chat_ids']
+
+    async def _copy_in(self, driver: Connection, archive: BinaryIO, stats: BulkTransferStats):
+        for table, _, columns in TABLES:
+            header = self._read_json(archive, FRAME_TABLE)
+            if header['table'] != table or tuple(header['columns']) != columns:
+                raise InvalidOperationError(message=f'Unexpected table {header['table']}', name='BulkModule')
+            status = await driver.copy_to_table(
+                table,
+                source=self._read_data(archive, stats),
+                columns=columns,
+                format='binary'
+            )
+            stats.rows[table] = self._copied_rows(status)
+
+    async def _read_data(self, archive: BinaryIO, stats: BulkTransferStats) -> AsyncIterator[bytes]:
+        while True:
+            kind, payload = self._read_frame(archive)
+            if kind == FRAME_END:
+                return
+            if kind != FRAME_DATA:
+                raise InvalidOperationError(message=f'Unexpected frame {kind}', name='BulkModule')
+            stats.bytes += len(payload)
+            yield payload
+
+    @staticmethod
+    def _write_frame(archive: BinaryIO, kind: int, payload: bytes):
+        archive.write(FRAME_HEADER.pack(kind, len(payload)))
+        archive.write(payload)
+
+    def _write_json(self, archive: BinaryIO, kind: int, payload: dict):
+        self._write_frame(archive, kind, json.dumps(payload).encode())
+
+    @staticmethod
+    def _read_frame(archive: BinaryIO) -> tuple[int, bytes]:
+        header = archive.read(FRAME_HEADER.size)
+        if len(header) != FRAME_HEADER.size:
+            raise InvalidOperationError(message='Truncated chat export', name='BulkModule')
+        kind, length = FRAME_HEADER.unpack(header)
+        payload = archive.read(length)
+        if len(payload) != length:
+            raise InvalidOperationError(message='Truncated chat export', name='BulkModule')
+        return kind, payload
+
+    def _read_json(self, archive: BinaryIO, kind: int) -> dict:
+        frame_kind, payload = self._read_frame(archive)
+        if frame_kind != kind:
+            raise InvalidOperationError(message=f'Unexpected frame {frame_kind}', name='BulkModule')
+        return json.loads(payload)
+
+    @staticmethod
+    def _copied_rows(status: str) -> int:
+        # asyncpg returns the command tag, e.g. 'COPY 42'
+        return int(status.split()[-1])
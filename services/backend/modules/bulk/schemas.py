@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+
+class BulkTransferStats(BaseModel):
+    # Rows copied per table
+    rows: dict[str, int] = {}
+    # Size of the binary COPY data before compression
+    bytes: int = 0
+    seconds: float = 0
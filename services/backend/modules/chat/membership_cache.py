@@ -0,0 +1,143 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, FrozenSet, Iterable
+
+import redis.asyncio as redis
+
+from services.app.schemas import RedisChannelType, ServerWsMessage, WsMessageType
+from services.app.settings import settings
+from services.backend.modules.chat.schemas import MembershipCacheStats
+from services.backend.modules.redis.interface import IRedisModule, IRedisListener
+
+MEMBERSHIP_PREFIX = 'chat_members:'
+MEMBERSHIP_GENERATION_PREFIX = 'chat_members_gen:'
+MEMBERSHIP_GENERATION_COUNTER = 'chat_members_gen'
+
+
+class UserChats:
+    __slots__ = ('chat_ids', 'loaded_at')
+
+    def __init__(self, chat_ids: FrozenSet[int], loaded_at: float):
+        self.chat_ids = chat_ids
+        self.loaded_at = loaded_at
+
+
+# The chat IDs of a user, in two layers in front of chat_participant.
+# Redis holds every set together with the generation of the user it was read at. A membership change bumps
+# the generation of the user after it is committed, so a set read before the change (even one stored after it)
+# no longer matches and is read again from the database. Generations come from one shared counter,
+# so an expired generation key can never make an old set match again.
+# Every instance keeps the recently used sets in memory as well, LRU evicted, which only stays correct while
+# the join and leave messages of the user reach it - only for users whose redis user channel it is subscribed to,
+# which every membership change of the user is published to. Sets of other users are checked against the
+# generation in redis on every read. The messages drop the set of the user, losing the channel drops it as well,
+# the TTL bounds staleness if all else fails. Other instances stop authorizing a member who left once the
+# message went through the channel, which is the usual pub/sub latency.
+class MembershipCache(IRedisListener):
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 users: int = settings.MEMBERSHIP_CACHE_USERS,
+                 ttl: float = settings.MEMBERSHIP_CACHE_TTL_SECONDS,
+                 redis_ttl: int = settings.MEMBERSHIP_CACHE_REDIS_TTL_SECONDS):
+        self.redis = redis_client
+        self.users = users
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.redis_module: IRedisModule | None = None
+        self.stats = MembershipCacheStats()
+        self._users: OrderedDict[int, UserChats] = OrderedDict()
+        # Bumped on every invalidation, so a set loaded while a membership message arrived is not kept
+        self._version = 0
+
+    def set_redis_module(self, redis_module: IRedisModule):
+        self.redis_module = redis_module
+        self.on_subscriptions_changed()
+
+    def is_subscribed(self, user_id: int) -> bool:
+        # Whether this instance receives the membership messages of the user
+        return self.redis_module is not None and self.redis_module.is_subscribed(type=RedisChannelType.USER,
+                                                                                 key=user_id)
+
+    def on_message(self, message: ServerWsMessage):
+        if message.type in (WsMessageType.NEW_USER, WsMessageType.USER_LEFT):
+            self.invalidate(user_id=message.user_id)
+
+    def on_subscribed(self, type: RedisChannelType, key: int | str):
+        if type == RedisChannelType.USER:
+            self.on_subscriptions_changed()
+
+    def on_unsubscribed(self, type: RedisChannelType, key: int | str):
+        if type == RedisChannelType.USER:
+            self.on_subscriptions_changed()
+
+    def on_subscriptions_changed(self):
+        # A set loaded before a subscription came or went may have missed a message of it
+        self._version += 1
+        for user_id in [user_id for user_id in self._users if not self.is_subscribed(user_id)]:
+            del self._users[user_id]
+            self.stats.invalidations += 1
+
+    def clear(self):
+        self._version += 1
+        self.stats.invalidations += len(self._users)
+        self._users.clear()
+
+    def invalidate(self, user_id: int):
+        self._version += 1
+        if self._users.pop(user_id, None) is not None:
+            self.stats.invalidations += 1
+
+    async def get_chat_ids(self, user_id: int, load: Callable[[], Awaitable[Iterable[int]]]) -> FrozenSet[int]:
+        user_chats = self._get(user_id)
+        if user_chats is not None:
+            self.stats.local_hits += 1
+            return user_chats.chat_ids
+        version = self._version
+        key = MEMBERSHIP_PREFIX + str(user_id)
+        stored, generation = await self.redis.mget(key, MEMBERSHIP_GENERATION_PREFIX + str(user_id))
+        generation = int(generation or 0)
+        chat_ids = None
+        if stored is not None:
+            entry = json.loads(stored)
+            if entry['gen'] == generation:
+                chat_ids = frozenset(entry['chats'])
+                self.stats.redis_hits += 1
+        if chat_ids is None:
+            self.stats.misses += 1
+            chat_ids = frozenset(await load())
+            await self.redis.set(key, json.dumps({'gen': generation, 'chats': sorted(chat_ids)}), ex=self.redis_ttl)
+        if version == self._version and self.is_subscribed(user_id):
+            self._put(user_id, chat_ids)
+        return chat_ids
+
+    async def on_changed(self, user_id: int):
+        # Called after the membership change of the user is committed
+        generation = await self.redis.incr(MEMBERSHIP_GENERATION_COUNTER)
+        await self.redis.set(MEMBERSHIP_GENERATION_PREFIX + str(user_id), generation, ex=self.redis_ttl * 2)
+        await self.redis.delete(MEMBERSHIP_PREFIX + str(user_id))
+        self.invalidate(user_id)
+
+    def get_stats(self) -> MembershipCacheStats:
+        reads = self.stats.local_hits + self.stats.redis_hits + self.stats.misses
+        return self.stats.model_copy(update={
+            'hit_ratio': (self.stats.local_hits + self.stats.redis_hits) / reads if reads else 0,
+            'users': len(self._users)
+        })
+
+    def _get(self, user_id: int) -> UserChats | None:
+        user_chats = self._users.get(user_id)
+        if user_chats is None:
+            return None
+        if time.monotonic() - user_chats.loaded_at > self.ttl or not self.is_subscribed(user_id):
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return user_chats
+
+    def _put(self, user_id: int, chat_ids: FrozenSet[int]):
+        self._users[user_id] = UserChats(chat_ids=chat_ids, loaded_at=time.monotonic())
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.users:
+            self._users.popitem(last=False)
+            self.stats.evictions += 1
@@ -1,29 +1,76 @@
-from typing import List
+from typing import AsyncIterator, FrozenSet, List
 
-from sqlalchemy import select, and_, delete, func
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import select, and_, delete, func, bindparam, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.exc import IntegrityError, DBAPIError
-from sqlalchemy.orm import selectinload
 
 from services.app.exceptions import EntityAlreadyExistsError, InvalidOperationError
-from services.app.schemas import ChatTypeEnum
-from services.backend.modules.base import ModuleWithDb
+from services.app.schemas import ChatTypeEnum, ServerWsMessage, WsMessageType
+from services.backend.modules.base import ModuleWithDb, project_rows
+from services.backend.modules.chat.membership_cache import MembershipCache
+from services.backend.modules.directory_cache import DirectoryCache
+from services.backend.modules.chat.schemas import ChatInbox, ChatFull, ChatMembers, ChatDirectoryPage
+from services.backend.modules.message.schemas import MessageFull
+from services.backend.modules.redis.interface import IRedisListener
+from services.backend.modules.user.schemas import UserBase
+from services.db import Db
 from services.db.models import Chat, ChatParticipant, User, ReadProgress, Message
 
+DIRECTORY_STREAM_BATCH = 1000
 
-class ChatModule(ModuleWithDb):
-    async def get_chat(self, chat_id: int) -> Chat | None:
-        query = (
-            select(Chat)
-            .where(
-                Chat.id == chat_id
-            )
+# Hot reads are built once as column projections with bound parameters, so they compile once
+# and skip the ORM identity map; rows go straight into the response models
+CHAT_COLUMNS = (Chat.id, Chat.name, Chat.type)
+CHAT_QUERY = (
+    select(*CHAT_COLUMNS)
+    .where(Chat.id == bindparam('chat_id'))
+)
+USER_CHATS_QUERY = (
+    select(*CHAT_COLUMNS)
+    .join(ChatParticipant, ChatParticipant.chat_id == Chat.id)
+    .where(ChatParticipant.user_id == bindparam('user_id'))
+)
+MEMBERSHIP_QUERY = (
+    select(literal(True))
+    .where(
+        and_(
+            ChatParticipant.chat_id == bindparam('chat_id'),
+            ChatParticipant.user_id == bindparam('user_id')
         )
-        async with self.db.session_scope() as sess:
-            result = await sess.execute(query)
-            chat = result.scalar_one_or_none()
-            sess.expunge_all()
-        return chat
+    )
+)
+USER_CHAT_IDS_QUERY = (
+    select(ChatParticipant.chat_id)
+    .where(ChatParticipant.user_id == bindparam('user_id'))
+)
+# One statement, so the version is the one of the listed members; a chat without members yields one row without a user
+CHAT_MEMBERS_QUERY = (
+    select(Chat.membership_version, User.id, User.name)
+    .select_from(Chat)
+    .outerjoin(ChatParticipant, ChatParticipant.chat_id == Chat.id)
+    .outerjoin(User, User.id == ChatParticipant.user_id)
+    .where(Chat.id == bindparam('chat_id'))
+    .order_by(User.id)
+)
+MEMBERSHIP_VERSION_QUERY = select(Chat.membership_version).where(Chat.id == bindparam('chat_id'))
+
+
+class ChatModule(ModuleWithDb, IRedisListener):
+    def __init__(self,
+                 db: Db,
+                 membership_cache: MembershipCache | None = None,
+                 directory_cache: DirectoryCache | None = None):
+        super().__init__(db=db, directory_cache=directory_cache)
+        self.membership_cache = membership_cache
+
+    async def get_chat(self, chat_id: int) -> ChatFull | None:
+        return await self.read_through(('chat', chat_id), lambda: self._load_chat(chat_id=chat_id))
+
+    async def _load_chat(self, chat_id: int) -> ChatFull | None:
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
+            result = await sess.execute(CHAT_QUERY, {'chat_id': chat_id})
+            chats = project_rows(ChatFull, result)
+        return chats[0] if chats else None
 
     async def create_chat(self, name: str, type: ChatTypeEnum) -> Chat:
         new_chat = Chat(
@@ -41,23 +88,40 @@ class ChatModule(ModuleWithDb):
                     message='Chat already exists',
                     name='ChatModule'
                 )
+        await self.db.mark_written(('chat', new_chat.id))
         return new_chat
 
     async def check_user_in_chat(self, chat_id: int, user_id: int) -> bool:
-        query = (
-            select(ChatParticipant)
-            .where(
-                and_(
-                    ChatParticipant.chat_id == chat_id,
-                    ChatParticipant.user_id == user_id
-                )
-            )
+        if self.membership_cache is not None:
+            return chat_id in await self.get_user_chat_ids(user_id=user_id)
+        async with self.db.read_session_scope(('chat', chat_id), ('user', user_id)) as sess:
+            result = await sess.execute(MEMBERSHIP_QUERY, {'chat_id': chat_id, 'user_id': user_id})
+            in_chat = result.scalar_one_or_none()
+        return bool(in_chat)
+
+    async def get_user_chat_ids(self, user_id: int) -> FrozenSet[int]:
+        if self.membership_cache is None:
+            return frozenset(await self._load_user_chat_ids(user_id=user_id))
+        return await self.membership_cache.get_chat_ids(
+            user_id=user_id,
+            load=lambda: self._load_user_chat_ids(user_id=user_id)
         )
+
+    async def _load_user_chat_ids(self, user_id: int) -> List[int]:
+        # Cached sets outlive the replica lag window, so they are read from the primary
         async with self.db.session_scope() as sess:
-            result = await sess.execute(query)
-            chat_participant = result.scalar_one_or_none()
-            sess.expunge_all()
-        return bool(chat_participant)
+            result = await sess.execute(USER_CHAT_IDS_QUERY, {'user_id': user_id})
+            return list(result.scalars())
+
+    def on_message(self, message: ServerWsMessage):
+        # Membership changes of other instances
+        if message.type in (WsMessageType.NEW_USER, WsMessageType.USER_LEFT):
+            self.invalidate(('chat_users', message.chat_id))
+
+    async def _membership_changed(self, chat_id: int, user_id: int):
+        self.invalidate(('chat_users', chat_id))
+        if self.membership_cache is not None:
+            await self.membership_cache.on_changed(user_id=user_id)
 
     async def add_user_to_chat(self, chat_id: int, user_id: int) -> Message:
         new_chat_participant = ChatParticipant(
@@ -95,6 +159,8 @@ class ChatModule(ModuleWithDb):
                     message=f'Error while creating the new chat - {sql_error_message}',
                     name='ChatModule'
                 )
+        await self.db.mark_written(('chat', chat_id), ('user', user_id))
+        await self._membership_changed(chat_id=chat_id, user_id=user_id)
         return new_message
 
     async def delete_user_from_chat(self, chat_id: int, user_id: int) -> Message:
@@ -128,35 +194,128 @@ class ChatModule(ModuleWithDb):
             await sess.commit()
             await sess.refresh(new_message)
             sess.expunge_all()
+        await self.db.mark_written(('chat', chat_id), ('user', user_id))
+        await self._membership_changed(chat_id=chat_id, user_id=user_id)
         return new_message
 
-    async def get_user_chats(self, user_id: int) -> List[Chat]:
-        query = (
-            select(Chat)
-            .where(Chat.users.any(User.id == user_id))
-        )
-        async with self.db.session_scope() as sess:
-            result = await sess.execute(query)
-            chats = result.scalars().all()
-            sess.expunge_all()
+    async def get_user_chats(self, user_id: int) -> List[ChatFull]:
+        async with self.db.read_session_scope(('user', user_id)) as sess:
+            result = await sess.execute(USER_CHATS_QUERY, {'user_id': user_id})
+            chats = project_rows(ChatFull, result)
         return chats
 
-    async def get_all_chats(self) -> List[Chat]:
-        query = (
-            select(Chat)
+    async def get_user_inbox(self, user_id: int) -> List[ChatInbox]:
+        # The latest message is found through chat.last_seq, so both queries stay set-based
+        # no matter how many chats the user is in.
+        chats_query = (
+            select(
+                Chat.id,
+                Chat.name,
+                Chat.type,
+                ReadProgress.last_read_message_id,
+                func.greatest(Chat.last_seq - ReadProgress.last_read_seq, 0).label('unread'),
+                Message.id.label('message_id'),
+                Message.seq.label('message_seq'),
+                Message.user_id.label('message_user_id'),
+                Message.content.label('message_content'),
+                Message.timestamp.label('message_timestamp')
+            )
+            .select_from(ChatParticipant)
+            .join(Chat, Chat.id == ChatParticipant.chat_id)
+            .outerjoin(
+                ReadProgress,
+                and_(
+                    ReadProgress.chat_id == ChatParticipant.chat_id,
+                    ReadProgress.user_id == ChatParticipant.user_id
+                )
+            )
+            .outerjoin(
+                Message,
+                and_(
+                    Message.chat_id == Chat.id,
+                    Message.seq == Chat.last_seq
+                )
+            )
+            .where(ChatParticipant.user_id == user_id)
+            .order_by(Chat.id)
         )
-        async with self.db.session_scope() as sess:
+        user_chats = (
+            select(ChatParticipant.chat_id)
+            .where(ChatParticipant.user_id == user_id)
+        )
+        users_query = (
+            select(
+                ChatParticipant.chat_id,
+                func.array_agg(aggregate_order_by(ChatParticipant.user_id, ChatParticipant.user_id)).label('users')
+            )
+            .where(ChatParticipant.chat_id.in_(user_chats))
+            .group_by(ChatParticipant.chat_id)
+        )
+        async with self.db.read_session_scope(('user', user_id)) as sess:
+            result = await sess.execute(chats_query)
+            chats = result.all()
+            result = await sess.execute(users_query)
+            users = {row.chat_id: row.users for row in result}
+        return [
+            ChatInbox(
+                id=chat.id,
+                name=chat.name,
+                type=chat.type,
+                last_message=MessageFull(
+                    id=chat.message_id,
+                    chat_id=chat.id,
+                    seq=chat.message_seq,
+                    user_id=chat.message_user_id,
+                    content=chat.message_content,
+                    timestamp=chat.message_timestamp
+                ) if chat.message_id is not None else None,
+                last_read_message_id=chat.last_read_message_id if chat.last_read_message_id is not None else -1,
+                unread=chat.unread or 0,
+                users=users.get(chat.id, [])
+            )
+            for chat in chats
+        ]
+
+    async def get_chat_directory(self,
+                                 limit: int,
+                                 after_id: int | None = None,
+                                 name: str | None = None,
+                                 type: ChatTypeEnum | None = None) -> ChatDirectoryPage:
+        # Keyset pagination on the primary key, so every page costs the same however deep it is
+        query = self._directory_query(name=name, type=type).limit(limit)
+        if after_id is not None:
+            query = query.where(Chat.id > after_id)
+        async with self.db.read_session_scope() as sess:
             result = await sess.execute(query)
-            chats = result.scalars().all()
-            sess.expunge_all()
-        return chats
+            chats = project_rows(ChatFull, result)
+        next_cursor = str(chats[-1].id) if len(chats) == limit else None
+        return ChatDirectoryPage(chats=chats, next_cursor=next_cursor)
+
+    async def stream_chat_directory(self,
+                                    name: str | None = None,
+                                    type: ChatTypeEnum | None = None) -> AsyncIterator[List[ChatFull]]:
+        # A server-side cursor hands the rows over in batches, so memory does not grow with the number of chats
+        query = self._directory_query(name=name, type=type).execution_options(yield_per=DIRECTORY_STREAM_BATCH)
+        async with self.db.read_session_scope() as sess:
+            result = await sess.stream(query)
+            async for rows in result.partitions():
+                yield [ChatFull.model_construct(id=row.id, name=row.name, type=row.type) for row in rows]
+
+    @staticmethod
+    def _directory_query(name: str | None, type: ChatTypeEnum | None):
+        query = select(*CHAT_COLUMNS).order_by(Chat.id)
+        if name:
+            query = query.where(Chat.name.istartswith(name, autoescape=True))
+        if type is not None:
+            query = query.where(Chat.type == type)
+        return query
 
     async def get_chat_users_read_progress(self, chat_id: int) -> List[ReadProgress]:
         query = (
             select(ReadProgress)
             .where(ReadProgress.chat_id == chat_id)
         )
-        async with self.db.session_scope() as sess:
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
             result = await sess.execute(query)
             progress = result.scalars().all()
             sess.expunge_all()
@@ -172,42 +331,45 @@ class ChatModule(ModuleWithDb):
                 )
             )
         )
-        async with self.db.session_scope() as sess:
+        async with self.db.read_session_scope(('chat', chat_id), ('user', user_id)) as sess:
             result = await sess.execute(query)
             progress = result.scalar_one_or_none()
             sess.expunge_all()
         return progress
 
-    async def get_chat_users(self, chat_id: int) -> List[User]:
-        query = (
-            select(Chat)
-            .where(
-                Chat.id == chat_id
-            )
-            .options(selectinload(Chat.users))
-        )
+    async def get_chat_users(self, chat_id: int) -> List[UserBase]:
+        members = await self.get_chat_members(chat_id=chat_id)
+        return list(members.users) if members else []
+
+    async def get_chat_members(self, chat_id: int) -> ChatMembers | None:
+        key = ('chat_users', chat_id)
+        if self.directory_cache is None:
+            return await self._load_chat_members(chat_id=chat_id)
+        # An instance that missed the membership message of another one would serve its cached list, and its
+        # version as the validator, until the TTL. The version is one primary key lookup, the list is reloaded
+        # when it does not match.
         async with self.db.session_scope() as sess:
-            chat = await sess.execute(query)
-            chat = chat.scalar_one_or_none()
-            users = chat.users if chat else []
-            users = sorted(users, key=lambda x: x.id)
-            sess.expunge_all()
-        return users
+            version = await sess.scalar(MEMBERSHIP_VERSION_QUERY, {'chat_id': chat_id})
+        if version is None:
+            return None
+        members = await self.read_through(key, lambda: self._load_chat_members(chat_id=chat_id))
+        if members is not None and members.membership_version != version:
+            self.invalidate(key)
+            members = await self.read_through(key, lambda: self._load_chat_members(chat_id=chat_id))
+        return members
 
-    async def store_chat_user_read_progress(self,
-                                            chat_id: int,
-                                            user_id: int,
-                                            last_read_message_id: int) -> ReadProgress | None:
-        query = (
-            insert(ReadProgress)
-            .values(chat_id=chat_id, user_id=user_id, last_read_message_id=last_read_message_id)
-            .on_conflict_do_update(
-                index_elements=['chat_id', 'user_id'],
-                set_={'last_read_message_id': func.greatest(ReadProgress.last_read_message_id, last_read_message_id)})
-            .returning(ReadProgress)
+    async def _load_chat_members(self, chat_id: int) -> ChatMembers | None:
+        if self.directory_cache is not None:
+            # Member lists are cached for the TTL, which outlives the replica lag window
+            scope = self.db.session_scope()
+        else:
+            scope = self.db.read_session_scope(('chat', chat_id))
+        async with scope as sess:
+            result = await sess.execute(CHAT_MEMBERS_QUERY, {'chat_id': chat_id})
+            rows = result.all()
+        if not rows:
+            return None
+        return ChatMembers.model_construct(
+            membership_version=rows[0].membership_version,
+            users=[UserBase.model_construct(id=row.id, name=row.name) for row in rows if row.id is not None]
         )
-        async with self.db.serializable_session_scope() as sess:
-            result = await sess.execute(query)
-            progress = result.scalar_one_or_none()
-            sess.expunge_all()
-        return progress
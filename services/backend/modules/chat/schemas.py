@@ -1,6 +1,10 @@
+from typing import List
+
 from pydantic import BaseModel, ConfigDict
 
 from services.app.schemas import ChatTypeEnum
+from services.backend.modules.message.schemas import MessageFull
+from services.backend.modules.user.schemas import UserBase
 
 
 class ChatBase(BaseModel):
@@ -14,3 +18,30 @@ class ChatFull(ChatBase):
 
 class ChatProgress(BaseModel):
     max_common_progress: int
+
+
+class ChatInbox(ChatFull):
+    last_message: MessageFull | None
+    last_read_message_id: int
+    unread: int
+    users: List[int]
+
+
+class ChatDirectoryPage(BaseModel):
+    chats: List[ChatFull]
+    next_cursor: str | None
+
+
+class ChatMembers(BaseModel):
+    membership_version: int
+    users: List[UserBase]
+
+
+class MembershipCacheStats(BaseModel):
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+    hit_ratio: float = 0
+    invalidations: int = 0
+    evictions: int = 0
+    users: int = 0
@@ -0,0 +1,102 @@
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from services.app.settings import settings
+from services.backend.modules.schemas import DirectoryCacheStats
+
+T = TypeVar('T')
+
+
+# Read-through cache for small, rarely changing lookups (chats, users, member lists), TTL and LRU bounded.
+# Concurrent misses of a key share one load. Writers invalidate the keys they touched, which also drops a load
+# still in flight for them: it is not cached, and requests waiting on it look the key up again instead of taking
+# its result, so only the request that started it gets what it read before the write. Writes of other instances
+# reach it through the redis messages they publish, the TTL bounds staleness if a message is missed.
+# Missing entities (None) are not cached.
+class DirectoryCache:
+    def __init__(self,
+                 size: int = settings.DIRECTORY_CACHE_SIZE,
+                 ttl: float = settings.DIRECTORY_CACHE_TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self.stats = DirectoryCacheStats()
+        self._entries: OrderedDict[Hashable, Tuple[Any, float]] = OrderedDict()
+        self._loads: Dict[Hashable, asyncio.Future] = {}
+        # Loads dropped by an invalidation while in flight
+        self._stale: weakref.WeakSet[asyncio.Future] = weakref.WeakSet()
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            if time.monotonic() - loaded_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return value
+            del self._entries[key]
+
+        while (pending := self._loads.get(key)) is not None:
+            self.stats.coalesced += 1
+            try:
+                value = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The request that started the load went away, the next one in line loads again
+                if not pending.cancelled():
+                    raise
+                continue
+            if pending in self._stale:
+                return await self.get(key, load)
+            return value
+
+        self.stats.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loads[key] = future
+        try:
+            value = await load()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved when nobody else waited for it
+            future.exception()
+            raise
+        finally:
+            current = self._loads.get(key) is future
+            if current:
+                del self._loads[key]
+        future.set_result(value)
+        if current and value is not None:
+            self._put(key, value)
+        return value
+
+    def invalidate(self, *keys: Hashable):
+        for key in keys:
+            pending = self._loads.pop(key, None)
+            if pending is not None:
+                self._stale.add(pending)
+            if self._entries.pop(key, None) is not None:
+                self.stats.invalidations += 1
+
+    def clear(self):
+        self.stats.invalidations += len(self._entries)
+        self._entries.clear()
+        self._stale.update(self._loads.values())
+        self._loads.clear()
+
+    def get_stats(self) -> DirectoryCacheStats:
+        lookups = self.stats.hits + self.stats.misses + self.stats.coalesced
+        return self.stats.model_copy(update={
+            'hit_ratio': (self.stats.hits + self.stats.coalesced) / lookups if lookups else 0,
+            'entries': len(self._entries)
+        })
+
+    def _put(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
@@ -0,0 +1,190 @@
+import json
+import zlib
+from collections import Counter
+from datetime import datetime, UTC, timedelta
+from typing import AsyncIterator, List
+
+from sqlalchemy import select, and_, func, delete, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.app.logger import logger
+from services.app.settings import settings
+from services.backend.modules.base import ModuleWithDb
+from services.backend.modules.message.schemas import MessageFull
+from services.db.models import Message, MessageArchiveBlock, Chat
+
+EXPORT_BLOCK_BATCH = 16
+
+
+# Cold storage for old messages. The oldest messages of a chat are moved out of the hot message table
+# in compressed blocks, so the archive always holds an id prefix of the chat history and the hot table the rest.
+class MessageArchive(ModuleWithDb):
+    async def archive(self, older_than: datetime | None = None) -> int:
+        if older_than is None:
+            older_than = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=settings.MESSAGE_ARCHIVE_AFTER_DAYS)
+        oldest_message = (
+            select(Message.timestamp)
+            .where(Message.chat_id == Chat.id)
+            .order_by(Message.seq)
+            .limit(1)
+            .scalar_subquery()
+        )
+        query = (
+            select(Chat.id)
+            .where(oldest_message < older_than)
+        )
+        async with self.db.session_scope() as sess:
+            result = await sess.execute(query)
+            chat_ids = result.scalars().all()
+        archived = 0
+        for chat_id in chat_ids:
+            archived += await self.archive_chat(chat_id=chat_id, older_than=older_than)
+        return archived
+
+    async def archive_chat(self, chat_id: int, older_than: datetime) -> int:
+        archived = 0
+        while True:
+            block_size = await self._archive_block(chat_id=chat_id, older_than=older_than)
+            if not block_size:
+                break
+            archived += block_size
+        if archived:
+            logger.info(f'Archived {archived} messages of chat {chat_id}')
+        return archived
+
+    async def _archive_block(self, chat_id: int, older_than: datetime) -> int:
+        keep_after_seq = (
+            select(Chat.last_seq - max(settings.MESSAGE_ARCHIVE_KEEP_LAST, 1))
+            .where(Chat.id == chat_id)
+            .scalar_subquery()
+        )
+        query = (
+            select(Message.id, Message.seq, Message.user_id, Message.content, Message.timestamp)
+            .where(Message.chat_id == chat_id)
+            .where(Message.seq <= keep_after_seq)
+            .order_by(Message.id)
+            .limit(settings.MESSAGE_ARCHIVE_BLOCK_SIZE)
+            .with_for_update()
+        )
+        async with self.db.session_scope() as sess:
+            result = await sess.execute(query)
+            rows = []
+            # Only an uninterrupted prefix is archived, so reads can split pages at a single boundary
+            for row in result:
+                if row.timestamp >= older_than:
+                    break
+                rows.append(row)
+            if not rows:
+                return 0
+            sess.add(MessageArchiveBlock(
+                chat_id=chat_id,
+                first_message_id=rows[0].id,
+                last_message_id=rows[-1].id,
+                first_seq=min(row.seq for row in rows),
+                last_seq=max(row.seq for row in rows),
+                message_count=len(rows),
+                user_counts={str(user_id): count for user_id, count in Counter(row.user_id for row in rows).items()},
+                payload=self._encode(rows),
+                message_ids=[row.id for row in rows],
+                message_seqs=[row.seq for row in rows]
+            ))
+            await sess.execute(
+                delete(Message)
+                .where(
+                    and_(
+                        Message.chat_id == chat_id,
+                        Message.id.in_([row.id for row in rows])
+                    )
+                )
+            )
+        await self.db.mark_written(('chat', chat_id))
+        return len(rows)
+
+    async def get_messages(self,
+                           chat_id: int,
+                           user_id: int | None = None,
+                           limit: int = 100,
+                           offset: int = 0) -> List[MessageFull]:
+        if limit <= 0:
+            return []
+        count = self._block_count(user_id)
+        blocks = (
+            select(
+                MessageArchiveBlock.payload,
+                count.label('count'),
+                func.sum(count).over(order_by=MessageArchiveBlock.first_message_id.desc()).label('running')
+            )
+            .where(MessageArchiveBlock.chat_id == chat_id)
+            .subquery()
+        )
+        query = (
+            select(blocks.c.payload, blocks.c.count, blocks.c.running)
+            .where(
+                and_(
+                    blocks.c.count > 0,
+                    blocks.c.running > offset,
+                    blocks.c.running - blocks.c.count < offset + limit
+                )
+            )
+            .order_by(blocks.c.running)
+        )
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
+            result = await sess.execute(query)
+            rows = result.all()
+        if not rows:
+            return []
+        skip = offset - (rows[0].running - rows[0].count)
+        messages = []
+        for row in rows:
+            messages.extend(
+                message for message in reversed(self._decode(chat_id, row.payload))
+                if user_id is None or message.user_id == user_id
+            )
+        return messages[skip:skip + limit]
+
+    async def get_count(self, chat_id: int, user_id: int | None = None) -> int:
+        query = (
+            select(func.coalesce(func.sum(self._block_count(user_id)), 0))
+            .where(MessageArchiveBlock.chat_id == chat_id)
+        )
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
+            result = await sess.execute(query)
+            count = result.scalar_one()
+        return count
+
+    async def stream_messages(self, sess: AsyncSession, chat_id: int) -> AsyncIterator[List[MessageFull]]:
+        # All archived messages of the chat in id order, one decoded block at a time, read in the given session
+        query = (
+            select(MessageArchiveBlock.payload)
+            .where(MessageArchiveBlock.chat_id == chat_id)
+            .order_by(MessageArchiveBlock.first_message_id)
+            .execution_options(yield_per=EXPORT_BLOCK_BATCH)
+        )
+        result = await sess.stream(query)
+        async for payload in result.scalars():
+            yield self._decode(chat_id, payload)
+
+    @staticmethod
+    def _block_count(user_id: int | None):
+        if user_id is None:
+            return MessageArchiveBlock.message_count
+        return func.coalesce(MessageArchiveBlock.user_counts[str(user_id)].astext.cast(Integer), 0)
+
+    @staticmethod
+    def _encode(rows) -> bytes:
+        data = [[row.id, row.seq, row.user_id, row.content, row.timestamp.isoformat()] for row in rows]
+        return zlib.compress(json.dumps(data, separators=(',', ':')).encode())
+
+    @staticmethod
+    def _decode(chat_id: int, payload: bytes) -> List[MessageFull]:
+        return [
+            MessageFull(
+                id=message_id,
+                chat_id=chat_id,
+                seq=seq,
+                user_id=user_id,
+                content=content,
+                timestamp=datetime.fromisoformat(timestamp)
+            )
+            for message_id, seq, user_id, content, timestamp in json.loads(zlib.decompress(payload))
+        ]
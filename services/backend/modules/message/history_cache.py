@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import List, Tuple
+
+from services.app.schemas import RedisChannelType, ServerWsMessage, WsMessageType
+from services.app.settings import settings
+from services.backend.modules.message.schemas import MessageFull, HistoryCacheStats
+from services.backend.modules.redis.interface import IRedisListener
+
+
+class ChatHistory:
+    __slots__ = ('messages', 'seeded_at')
+
+    def __init__(self, messages: deque[MessageFull], seeded_at: float):
+        self.messages = messages
+        self.seeded_at = seeded_at
+
+
+# In-process ring buffers with the newest messages of recently read chats, LRU evicted.
+# A buffer is seeded with the newest messages by sequence number from the database and then extended by the chat messages going through
+# the redis chat channel, which every instance with websocket users is subscribed to. It only ever holds
+# an uninterrupted run of sequence numbers ending at the newest message seen:
+# - a sequence gap (a missed or unsequenced message) drops the buffer of the chat,
+# - join and leave messages are published without a sequence number and drop it as well,
+# - losing the chat channel subscription clears everything and disables seeding,
+# - buffers are reseeded from the database after the TTL, which bounds staleness if all else fails.
+class HistoryCache(IRedisListener):
+    def __init__(self,
+                 chats: int = settings.HISTORY_CACHE_CHATS,
+                 size: int = settings.HISTORY_CACHE_MESSAGES,
+                 ttl: float = settings.HISTORY_CACHE_TTL_SECONDS):
+        self.chats = chats
+        self.size = size
+        self.ttl = ttl
+        self.enabled = False
+        self.stats = HistoryCacheStats()
+        self._histories: OrderedDict[int, ChatHistory] = OrderedDict()
+        # Newest sequence number seen on the channel, also for chats without a buffer,
+        # so a window read from the database before a message arrived is not cached after it
+        self._latest_seq: OrderedDict[int, int] = OrderedDict()
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+        if not enabled:
+            self.clear()
+
+    def on_subscribed(self, type: RedisChannelType, key: int | str):
+        if type == RedisChannelType.CHAT:
+            self.set_enabled(True)
+
+    def on_unsubscribed(self, type: RedisChannelType, key: int | str):
+        # Without the chat channel the cached histories can no longer be kept up to date
+        if type == RedisChannelType.CHAT:
+            self.set_enabled(False)
+
+    def on_message(self, message: ServerWsMessage):
+        if message.type == WsMessageType.MESSAGE:
+            if message.seq is None or message.timestamp is None:
+                self.invalidate(chat_id=message.chat_id)
+                return
+            self.append(MessageFull(
+                id=message.message_id,
+                chat_id=message.chat_id,
+                seq=message.seq,
+                user_id=message.user_id,
+                content=message.content or '',
+                timestamp=message.timestamp
+            ))
+        elif message.type in (WsMessageType.NEW_USER, WsMessageType.USER_LEFT):
+            self.invalidate(chat_id=message.chat_id)
+
+    def clear(self):
+        self.stats.invalidations += len(self._histories)
+        self._histories.clear()
+        self._latest_seq.clear()
+
+    def invalidate(self, chat_id: int):
+        if self._histories.pop(chat_id, None) is not None:
+            self.stats.invalidations += 1
+
+    def append(self, message: MessageFull):
+        self._remember_seq(chat_id=message.chat_id, seq=message.seq)
+        history = self._histories.get(message.chat_id)
+        if history is None:
+            return
+        last_seq = history.messages[-1].seq
+        if message.seq <= last_seq:
+            return
+        if message.seq != last_seq + 1:
+            self.invalidate(message.chat_id)
+            return
+        history.messages.append(message)
+
+    def seed(self, chat_id: int, messages: List[MessageFull], last_seq: int) -> bool:
+        if not self.enabled or not messages:
+            return False
+        ordered = sorted(messages, key=lambda message: message.seq)
+        if ordered[-1].seq != last_seq or last_seq < self._latest_seq.get(chat_id, 0):
+            return False
+        if any(newer.seq != older.seq + 1 for older, newer in zip(ordered, ordered[1:])):
+            return False
+        self._histories[chat_id] = ChatHistory(
+            messages=deque(ordered[-self.size:], maxlen=self.size),
+            seeded_at=time.monotonic()
+        )
+        self._histories.move_to_end(chat_id)
+        while len(self._histories) > self.chats:
+            self._histories.popitem(last=False)
+            self.stats.evictions += 1
+        return True
+
+    def get_latest(self,
+                   chat_id: int,
+                   limit: int,
+                   record: bool = True) -> Tuple[List[MessageFull], int] | None:
+        history = self._get(chat_id)
+        if history is None or (len(history.messages) < limit and history.messages[0].seq != 1):
+            self._record(hit=False, record=record)
+            return None
+        self._record(hit=True, record=record)
+        return list(islice(reversed(history.messages), limit)), history.messages[-1].seq
+
+    def get_after(self,
+                  chat_id: int,
+                  after_seq: int,
+                  limit: int,
+                  record: bool = True) -> Tuple[List[MessageFull], int] | None:
+        history = self._get(chat_id)
+        if history is None or history.messages[0].seq > after_seq + 1:
+            self._record(hit=False, record=record)
+            return None
+        self._record(hit=True, record=record)
+        start = max(after_seq + 1 - history.messages[0].seq, 0)
+        messages = list(islice(history.messages, start, start + limit))
+        messages.reverse()
+        return messages, history.messages[-1].seq
+
+    def get_last_seq(self, chat_id: int) -> int | None:
+        history = self._get(chat_id)
+        return history.messages[-1].seq if history is not None else None
+
+    def get_stats(self) -> HistoryCacheStats:
+        reads = self.stats.hits + self.stats.misses
+        return self.stats.model_copy(update={
+            'hit_ratio': self.stats.hits / reads if reads else 0,
+            'chats': len(self._histories),
+            'messages': sum(len(history.messages) for history in self._histories.values())
+        })
+
+    def _record(self, hit: bool, record: bool):
+        # Reads answered right after seeding on a miss are not counted twice
+        if not record or not self.enabled:
+            return
+        if hit:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+
+    def _get(self, chat_id: int) -> ChatHistory | None:
+        history = self._histories.get(chat_id)
+        if history is None:
+            return None
+        if time.monotonic() - history.seeded_at > self.ttl:
+            del self._histories[chat_id]
+            return None
+        self._histories.move_to_end(chat_id)
+        return history
+
+    def _remember_seq(self, chat_id: int, seq: int):
+        self._latest_seq[chat_id] = max(self._latest_seq.get(chat_id, 0), seq)
+        self._latest_seq.move_to_end(chat_id)
+        while len(self._latest_seq) > self.chats * 4:
+            self._latest_seq.popitem(last=False)
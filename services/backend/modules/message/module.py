@@ -1,42 +1,204 @@
 import asyncio
-from typing import List
+from typing import AsyncIterator, List, Tuple
 
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, func, and_, literal, true, tuple_, literal_column, bindparam, exists, union_all, \
+    column, Integer, String
+from sqlalchemy.dialects.postgresql import insert, REGCONFIG, ARRAY
+from sqlalchemy.exc import IntegrityError
 
-from services.backend.modules.base import ModuleWithDb
-from services.backend.modules.message.schemas import MessagesPagination, MessageFull
-from services.db.models import Message
+from services.app.exceptions import Forbidden
+from services.backend.modules.base import ModuleWithDb, project_rows
+from services.backend.modules.message.archive import MessageArchive
+from services.backend.modules.message.history_cache import HistoryCache
+from services.backend.modules.message.schemas import MessagesPagination, MessageFull, SentMessage, MessageSearchPage, \
+    MessageSearchHit, OutgoingMessage, BatchSentMessage, SentMessageBatch
+from services.db import Db
+from services.db.models import Message, ChatParticipant, ReadProgress, Chat
+
+SEARCH_CONFIG = literal_column("'simple'", type_=REGCONFIG)
+MESSAGE_COLUMNS = (Message.id, Message.chat_id, Message.seq, Message.user_id, Message.content, Message.timestamp)
+# History pages are built once with bound parameters and read as plain rows, see ChatModule
+MESSAGES_PAGE_QUERY = (
+    select(*MESSAGE_COLUMNS)
+    .where(Message.chat_id == bindparam('chat_id'))
+    .order_by(Message.id.desc())
+    .limit(bindparam('limit'))
+    .offset(bindparam('offset'))
+)
+USER_MESSAGES_PAGE_QUERY = MESSAGES_PAGE_QUERY.where(Message.user_id == bindparam('user_id'))
+EXPORT_BATCH = 1000
+EXPORT_QUERY = (
+    select(*MESSAGE_COLUMNS)
+    .where(Message.chat_id == bindparam('chat_id'))
+    .order_by(Message.id)
+    .execution_options(yield_per=EXPORT_BATCH)
+)
+# The newest messages by sequence number, used to seed the history cache
+HISTORY_WINDOW_QUERY = (
+    select(*MESSAGE_COLUMNS, Chat.last_seq)
+    .join(Chat, Chat.id == Message.chat_id)
+    .where(
+        and_(
+            Message.chat_id == bindparam('chat_id'),
+            Message.seq > Chat.last_seq - bindparam('size')
+        )
+    )
+    .order_by(Message.seq)
+)
+
+SEND_BATCH_CONSTRAINT = 'uq_message_chat_id_user_id_client_msg_id'
+SEND_BATCH_USER_ID = bindparam('user_id', type_=Integer)
+SEND_BATCH_ITEMS = (
+    func.unnest(
+        bindparam('chat_ids', type_=ARRAY(Integer)),
+        bindparam('contents', type_=ARRAY(String)),
+        bindparam('client_msg_ids', type_=ARRAY(String))
+    )
+    .table_valued(column('chat_id', Integer), column('content', String), column('client_msg_id', String),
+                  with_ordinality='position')
+    .render_derived(name='items')
+)
+# Items in chats of the sender, which is the whole membership check
+SEND_BATCH_MEMBER_ITEMS = (
+    select(SEND_BATCH_ITEMS)
+    .join(
+        ChatParticipant,
+        and_(
+            ChatParticipant.chat_id == SEND_BATCH_ITEMS.c.chat_id,
+            ChatParticipant.user_id == SEND_BATCH_USER_ID
+        )
+    )
+    .cte('member_items')
+)
+SEND_BATCH_STORED = (
+    select(*MESSAGE_COLUMNS, Message.client_msg_id)
+    .join(
+        SEND_BATCH_MEMBER_ITEMS,
+        and_(
+            Message.chat_id == SEND_BATCH_MEMBER_ITEMS.c.chat_id,
+            Message.user_id == SEND_BATCH_USER_ID,
+            Message.client_msg_id == SEND_BATCH_MEMBER_ITEMS.c.client_msg_id
+        )
+    )
+    .cte('stored')
+)
+# Rows are inserted in chat order, so concurrent batches lock the chats (the seq trigger) in the same order
+SEND_BATCH_NEW_MESSAGES = (
+    insert(Message)
+    .from_select(
+        ['chat_id', 'user_id', 'content', 'client_msg_id'],
+        select(
+            SEND_BATCH_MEMBER_ITEMS.c.chat_id,
+            SEND_BATCH_USER_ID,
+            SEND_BATCH_MEMBER_ITEMS.c.content,
+            SEND_BATCH_MEMBER_ITEMS.c.client_msg_id
+        )
+        .where(
+            ~exists().where(
+                and_(
+                    SEND_BATCH_STORED.c.chat_id == SEND_BATCH_MEMBER_ITEMS.c.chat_id,
+                    SEND_BATCH_STORED.c.client_msg_id == SEND_BATCH_MEMBER_ITEMS.c.client_msg_id
+                )
+            )
+        )
+        .order_by(SEND_BATCH_MEMBER_ITEMS.c.chat_id, SEND_BATCH_MEMBER_ITEMS.c.position)
+    )
+    .returning(*MESSAGE_COLUMNS, Message.client_msg_id)
+    .cte('new_message')
+)
+SEND_BATCH_PROGRESS = insert(ReadProgress).from_select(
+    ['chat_id', 'user_id', 'last_read_message_id'],
+    select(SEND_BATCH_NEW_MESSAGES.c.chat_id, SEND_BATCH_USER_ID, func.max(SEND_BATCH_NEW_MESSAGES.c.id))
+    .group_by(SEND_BATCH_NEW_MESSAGES.c.chat_id)
+    .order_by(SEND_BATCH_NEW_MESSAGES.c.chat_id)
+)
+SEND_BATCH_SENDER_PROGRESS = (
+    SEND_BATCH_PROGRESS
+    .on_conflict_do_update(
+        index_elements=['chat_id', 'user_id'],
+        set_={'last_read_message_id': func.greatest(ReadProgress.last_read_message_id,
+                                                    SEND_BATCH_PROGRESS.excluded.last_read_message_id)})
+    .returning(ReadProgress.chat_id)
+    .cte('sender_progress')
+)
+# One statement for the batch: membership check, lookup of the keys already stored, insert of the rest
+# and sender progress upserts, like send_message for a single message
+SEND_BATCH_QUERY = union_all(
+    select(
+        *SEND_BATCH_NEW_MESSAGES.c,
+        literal(False).label('duplicate'),
+        Chat.common_read_message_id.label('previous_chat_progress')
+    )
+    .select_from(SEND_BATCH_NEW_MESSAGES)
+    .join(SEND_BATCH_SENDER_PROGRESS, SEND_BATCH_SENDER_PROGRESS.c.chat_id == SEND_BATCH_NEW_MESSAGES.c.chat_id)
+    .join(Chat, Chat.id == SEND_BATCH_NEW_MESSAGES.c.chat_id),
+    select(
+        *SEND_BATCH_STORED.c,
+        literal(True).label('duplicate'),
+        literal(None, type_=Integer).label('previous_chat_progress')
+    )
+)
+CHATS_PROGRESS_QUERY = (
+    select(Chat.id, Chat.common_read_message_id)
+    .where(Chat.id == func.any(bindparam('chat_ids', type_=ARRAY(Integer))))
+)
 
 
 class MessageModule(ModuleWithDb):
+    def __init__(self, db: Db):
+        super().__init__(db=db)
+        self.archive = MessageArchive(db=db)
+        self.history_cache = HistoryCache()
+
     async def get_messages(self,
                            chat_id: int,
                            user_id: int | None = None,
                            limit: int = 100,
-                           offset: int = 0) -> List[Message]:
-        query = (
-            select(Message)
-            .where(
-                Message.chat_id == chat_id
-            )
-            .order_by(Message.id.desc())
-            .limit(limit)
-            .offset(offset)
-            .options(selectinload(Message.user))
-        )
-        if user_id is not None:
-            query = query.where(Message.user_id == user_id)
-
-        async with self.db.session_scope() as sess:
-            result = await sess.execute(query)
-            messages = result.scalars().all()
-            sess.expunge_all()
-        return messages
+                           offset: int = 0) -> List[MessageFull]:
+        query = MESSAGES_PAGE_QUERY if user_id is None else USER_MESSAGES_PAGE_QUERY
+        params = {'chat_id': chat_id, 'user_id': user_id, 'limit': limit, 'offset': offset}
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
+            result = await sess.execute(query, params)
+            messages = project_rows(MessageFull, result)
+        if len(messages) == limit:
+            return messages
+        # The page reaches past the oldest hot message, continue in the archive
+        if messages:
+            archive_offset = 0
+        else:
+            archive_offset = offset - await self._get_hot_count(chat_id=chat_id, user_id=user_id)
+        archived = await self.archive.get_messages(
+            chat_id=chat_id, user_id=user_id, limit=limit - len(messages), offset=max(archive_offset, 0))
+        return messages + archived
 
     async def get_count(self,
                         chat_id: int,
                         user_id: int | None = None) -> int:
+        if user_id is None:
+            # Sequence numbers are dense and messages are never deleted, only archived
+            query = (
+                select(Chat.last_seq)
+                .where(Chat.id == chat_id)
+            )
+            async with self.db.read_session_scope(('chat', chat_id)) as sess:
+                result = await sess.execute(query)
+                count = result.scalar_one_or_none()
+            return count or 0
+        hot_count, archived_count = await asyncio.gather(
+            self._get_hot_count(chat_id=chat_id, user_id=user_id),
+            self.archive.get_count(chat_id=chat_id, user_id=user_id)
+        )
+        return hot_count + archived_count
+
+    async def get_last_seq(self, chat_id: int) -> int:
+        last_seq = self.history_cache.get_last_seq(chat_id=chat_id)
+        if last_seq is None:
+            last_seq = await self.get_count(chat_id=chat_id)
+        return last_seq
+
+    async def _get_hot_count(self,
+                             chat_id: int,
+                             user_id: int | None = None) -> int:
         query = (
             select(func.count(Message.id))
             .where(Message.chat_id == chat_id)
@@ -44,7 +206,7 @@ class MessageModule(ModuleWithDb):
         if user_id is not None:
             query = query.where(Message.user_id == user_id)
 
-        async with self.db.session_scope() as sess:
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
             result = await sess.execute(query)
             count = result.scalar_one()
         return count
@@ -53,18 +215,129 @@ class MessageModule(ModuleWithDb):
                                                 chat_id: int,
                                                 user_id: int | None = None,
                                                 limit: int = 100,
-                                                offset: int = 0) -> MessagesPagination:
+                                                offset: int = 0,
+                                                after_seq: int | None = None) -> MessagesPagination:
+        if after_seq is not None:
+            return await self._get_messages_after(chat_id=chat_id, after_seq=after_seq, limit=limit)
+        if user_id is None and offset == 0:
+            cached = self.history_cache.get_latest(chat_id=chat_id, limit=limit)
+            if cached is None and await self._load_history(chat_id=chat_id):
+                cached = self.history_cache.get_latest(chat_id=chat_id, limit=limit, record=False)
+            if cached is not None:
+                messages, count = cached
+                return MessagesPagination(messages=messages, limit=limit, offset=offset, total_count=count)
         messages, count = await asyncio.gather(
             self.get_messages(chat_id=chat_id, user_id=user_id, limit=limit, offset=offset),
             self.get_count(chat_id=chat_id, user_id=user_id)
         )
         return MessagesPagination(
-            messages=[MessageFull.model_validate(message) for message in messages],
+            messages=messages,
+            limit=limit,
+            offset=offset,
+            total_count=count
+        )
+
+    async def _load_history(self, chat_id: int) -> bool:
+        if not self.history_cache.enabled:
+            return False
+        params = {'chat_id': chat_id, 'size': self.history_cache.size}
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
+            result = await sess.execute(HISTORY_WINDOW_QUERY, params)
+            rows = result.all()
+        if not rows:
+            return False
+        messages = [
+            MessageFull.model_construct(id=row.id, chat_id=row.chat_id, seq=row.seq, user_id=row.user_id,
+                                        content=row.content, timestamp=row.timestamp)
+            for row in rows
+        ]
+        return self.history_cache.seed(chat_id=chat_id, messages=messages, last_seq=rows[0].last_seq)
+
+    async def _get_messages_after(self, chat_id: int, after_seq: int, limit: int) -> MessagesPagination:
+        # Resume read: the messages following after_seq, newest first like every history page
+        cached = self.history_cache.get_after(chat_id=chat_id, after_seq=after_seq, limit=limit)
+        if cached is None and await self._load_history(chat_id=chat_id):
+            cached = self.history_cache.get_after(chat_id=chat_id, after_seq=after_seq, limit=limit, record=False)
+        if cached is not None:
+            messages, count = cached
+            offset = max(count - after_seq - limit, 0)
+            return MessagesPagination(messages=messages, limit=limit, offset=offset, total_count=count)
+        count = await self.get_count(chat_id=chat_id)
+        # Sequence numbers are dense, so the position of after_seq in the history is known
+        remaining = max(count - after_seq, 0)
+        offset = max(remaining - limit, 0)
+        messages = []
+        if remaining:
+            messages = await self.get_messages(chat_id=chat_id, limit=min(limit, remaining), offset=offset)
+        return MessagesPagination(
+            messages=[message for message in messages if message.seq > after_seq],
             limit=limit,
             offset=offset,
             total_count=count
         )
 
+    async def export_messages(self, chat_id: int) -> AsyncIterator[List[MessageFull]]:
+        # The whole history, oldest first: the archived prefix, then the hot messages through a server-side cursor.
+        # One snapshot for both, so messages archived meanwhile are neither missed nor read twice.
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
+            await sess.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            async for messages in self.archive.stream_messages(sess, chat_id=chat_id):
+                yield messages
+            result = await sess.stream(EXPORT_QUERY, {'chat_id': chat_id})
+            async for rows in result.partitions():
+                yield [
+                    MessageFull.model_construct(id=row.id, chat_id=row.chat_id, seq=row.seq, user_id=row.user_id,
+                                                content=row.content, timestamp=row.timestamp)
+                    for row in rows
+                ]
+
+    async def search(self,
+                     user_id: int,
+                     text: str,
+                     chat_id: int | None = None,
+                     limit: int = 20,
+                     after: Tuple[float, int] | None = None) -> MessageSearchPage:
+        # The document expression must match the ix_message_content_tsv index definition
+        document = func.to_tsvector(SEARCH_CONFIG, Message.content)
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+        matches = (
+            select(
+                Message.id,
+                Message.chat_id,
+                Message.seq,
+                Message.user_id,
+                Message.content,
+                Message.timestamp,
+                func.ts_rank(document, ts_query).label('rank')
+            )
+            .join(
+                ChatParticipant,
+                and_(
+                    ChatParticipant.chat_id == Message.chat_id,
+                    ChatParticipant.user_id == user_id
+                )
+            )
+            .where(document.bool_op('@@')(ts_query))
+        )
+        if chat_id is not None:
+            matches = matches.where(Message.chat_id == chat_id)
+        matches = matches.subquery()
+        query = (
+            select(matches)
+            .order_by(matches.c.rank.desc(), matches.c.id.desc())
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(tuple_(matches.c.rank, matches.c.id) < tuple_(*after))
+
+        consistency_keys = [('user', user_id)] if chat_id is None else [('chat', chat_id), ('user', user_id)]
+        async with self.db.read_session_scope(*consistency_keys) as sess:
+            result = await sess.execute(query)
+            rows = result.all()
+        hits = [MessageSearchHit(**row._mapping) for row in rows]
+        next_cursor = f'{hits[-1].rank!r}:{hits[-1].id}' if len(hits) == limit else None
+        return MessageSearchPage(messages=hits, next_cursor=next_cursor)
+
     async def store_message(self,
                             chat_id: int,
                             user_id: int,
@@ -79,4 +352,143 @@ class MessageModule(ModuleWithDb):
             await sess.commit()
             await sess.refresh(new_message)
             sess.expunge_all()
+        await self.db.mark_written(('chat', chat_id), ('user', user_id))
         return new_message
+
+    async def send_message(self,
+                           chat_id: int,
+                           user_id: int,
+                           content: str) -> SentMessage:
+        # Membership check, insert and sender progress upsert in one statement. The chat progress
+        # is maintained by a read_progress trigger, so the new value is read after it in the same transaction.
+        member = (
+            select(ChatParticipant.chat_id, ChatParticipant.user_id)
+            .where(
+                and_(
+                    ChatParticipant.chat_id == chat_id,
+                    ChatParticipant.user_id == user_id
+                )
+            )
+            .cte('member')
+        )
+        new_message = (
+            insert(Message)
+            .from_select(
+                ['chat_id', 'user_id', 'content'],
+                select(member.c.chat_id, member.c.user_id, literal(content))
+            )
+            .returning(Message.id, Message.chat_id, Message.seq, Message.user_id, Message.content, Message.timestamp)
+            .cte('new_message')
+        )
+        progress_query = insert(ReadProgress).from_select(
+            ['chat_id', 'user_id', 'last_read_message_id'],
+            select(new_message.c.chat_id, new_message.c.user_id, new_message.c.id)
+        )
+        sender_progress = (
+            progress_query
+            .on_conflict_do_update(
+                index_elements=['chat_id', 'user_id'],
+                set_={'last_read_message_id': func.greatest(ReadProgress.last_read_message_id,
+                                                            progress_query.excluded.last_read_message_id)})
+            .returning(ReadProgress.last_read_message_id)
+            .cte('sender_progress')
+        )
+        query = (
+            select(
+                new_message.c.id,
+                new_message.c.chat_id,
+                new_message.c.seq,
+                new_message.c.user_id,
+                new_message.c.content,
+                new_message.c.timestamp,
+                Chat.common_read_message_id.label('previous_chat_progress')
+            )
+            .select_from(new_message)
+            .join(sender_progress, true())
+            .join(Chat, Chat.id == new_message.c.chat_id)
+        )
+        chat_progress_query = (
+            select(Chat.common_read_message_id)
+            .where(Chat.id == chat_id)
+        )
+        async with self.db.session_scope() as sess:
+            result = await sess.execute(query)
+            row = result.one_or_none()
+            if row is None:
+                raise Forbidden(
+                    message='You are not in the chat',
+                    name='MessageModule'
+                )
+            result = await sess.execute(chat_progress_query)
+            chat_progress = result.scalar_one()
+        await self.db.mark_written(('chat', chat_id), ('user', user_id))
+        return SentMessage(
+            message=MessageFull(
+                id=row.id,
+                chat_id=row.chat_id,
+                seq=row.seq,
+                user_id=row.user_id,
+                content=row.content,
+                timestamp=row.timestamp
+            ),
+            previous_chat_progress=row.previous_chat_progress if row.previous_chat_progress is not None else -1,
+            chat_progress=chat_progress if chat_progress is not None else -1
+        )
+
+    async def send_messages(self,
+                            user_id: int,
+                            messages: List[OutgoingMessage]) -> SentMessageBatch:
+        # A concurrent retry of the same keys fails on the unique constraint after waiting for the first send,
+        # the second attempt then finds its messages stored. Keys of archived messages are not checked.
+        try:
+            return await self._send_messages(user_id=user_id, messages=messages)
+        except IntegrityError as e:
+            if SEND_BATCH_CONSTRAINT not in str(e.orig):
+                raise
+        return await self._send_messages(user_id=user_id, messages=messages)
+
+    async def _send_messages(self,
+                             user_id: int,
+                             messages: List[OutgoingMessage]) -> SentMessageBatch:
+        params = {
+            'user_id': user_id,
+            'chat_ids': [message.chat_id for message in messages],
+            'contents': [message.content for message in messages],
+            'client_msg_ids': [message.client_msg_id for message in messages]
+        }
+        async with self.db.session_scope() as sess:
+            result = await sess.execute(SEND_BATCH_QUERY, params)
+            rows = {(row.chat_id, row.client_msg_id): row for row in result}
+            if len(rows) < len(messages):
+                # Raised inside the transaction, so nothing of the batch is stored
+                raise Forbidden(
+                    message='You are not in the chat',
+                    name='MessageModule'
+                )
+            previous_chat_progress = {row.chat_id: row.previous_chat_progress for row in rows.values()
+                                      if not row.duplicate}
+            chat_progress = {}
+            if previous_chat_progress:
+                result = await sess.execute(CHATS_PROGRESS_QUERY, {'chat_ids': list(previous_chat_progress)})
+                chat_progress = {chat_id: progress for chat_id, progress in result}
+        chat_ids = {message.chat_id for message in messages}
+        await self.db.mark_written(('user', user_id), *(('chat', chat_id) for chat_id in chat_ids))
+        return SentMessageBatch(
+            messages=[
+                BatchSentMessage.model_construct(
+                    id=row.id,
+                    chat_id=row.chat_id,
+                    seq=row.seq,
+                    user_id=row.user_id,
+                    content=row.content,
+                    timestamp=row.timestamp,
+                    client_msg_id=row.client_msg_id,
+                    duplicate=row.duplicate
+                )
+                for row in (rows[message.chat_id, message.client_msg_id] for message in messages)
+            ],
+            previous_chat_progress={chat_id: progress if progress is not None else -1
+                                    for chat_id, progress in previous_chat_progress.items()},
+            chat_progress={chat_id: progress if progress is not None else -1
+                           for chat_id, progress in chat_progress.items()}
+        )
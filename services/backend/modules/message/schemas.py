@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import Dict, List
 
 from pydantic import BaseModel, ConfigDict
 
@@ -9,6 +9,7 @@ class MessageFull(BaseModel):
 
     id: int
     chat_id: int
+    seq: int
     user_id: int
     content: str
     timestamp: datetime
@@ -19,3 +20,47 @@ class MessagesPagination(BaseModel):
     limit: int
     offset: int
     total_count: int
+
+
+class SentMessage(BaseModel):
+    message: MessageFull
+    previous_chat_progress: int
+    chat_progress: int
+
+
+class OutgoingMessage(BaseModel):
+    chat_id: int
+    content: str
+    client_msg_id: str
+
+
+class BatchSentMessage(MessageFull):
+    client_msg_id: str
+    # Stored by an earlier send with the same client_msg_id
+    duplicate: bool
+
+
+class SentMessageBatch(BaseModel):
+    messages: List[BatchSentMessage]
+    # Chat progress before and after the batch, by chat ID, for the chats with new messages
+    previous_chat_progress: Dict[int, int]
+    chat_progress: Dict[int, int]
+
+
+class MessageSearchHit(MessageFull):
+    rank: float
+
+
+class MessageSearchPage(BaseModel):
+    messages: List[MessageSearchHit]
+    next_cursor: str | None
+
+
+class HistoryCacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    hit_ratio: float = 0
+    invalidations: int = 0
+    evictions: int = 0
+    chats: int = 0
+    messages: int = 0
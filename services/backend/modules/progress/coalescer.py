@@ -0,0 +1,173 @@
+import asyncio
+from collections import defaultdict
+from typing import List, Tuple
+
+from sqlalchemy import select, and_, func, bindparam, column, Integer
+from sqlalchemy.dialects.postgresql import insert, ARRAY
+
+from services.app.exceptions import Forbidden
+from services.app.logger import logger
+from services.app.settings import settings
+from services.backend.modules.base import ModuleWithDb
+from services.backend.modules.progress.schemas import ProgressUpdate, ProgressCoalescerStats
+from services.db import Db
+from services.db.models import ReadProgress, ChatParticipant, Chat
+
+LEGACY_ROUND_TRIPS_PER_UPDATE = 3
+ROUND_TRIPS_PER_FLUSH = 2
+
+
+def _build_flush_query():
+    updates = func.unnest(
+        bindparam('chat_ids', type_=ARRAY(Integer)),
+        bindparam('user_ids', type_=ARRAY(Integer)),
+        bindparam('last_read_message_ids', type_=ARRAY(Integer))
+    ).table_valued(
+        column('chat_id', Integer),
+        column('user_id', Integer),
+        column('last_read_message_id', Integer)
+    ).render_derived(name='updates')
+    # Only members get progress rows
+    source = (
+        select(updates.c.chat_id, updates.c.user_id, updates.c.last_read_message_id)
+        .join(
+            ChatParticipant,
+            and_(
+                ChatParticipant.chat_id == updates.c.chat_id,
+                ChatParticipant.user_id == updates.c.user_id
+            )
+        )
+        .order_by(updates.c.chat_id, updates.c.user_id)
+    )
+    previous = (
+        select(Chat.id, Chat.common_read_message_id)
+        .where(Chat.id.in_(select(updates.c.chat_id)))
+        .cte('previous')
+    )
+    progress_query = insert(ReadProgress).from_select(['chat_id', 'user_id', 'last_read_message_id'], source)
+    stored = (
+        progress_query
+        .on_conflict_do_update(
+            index_elements=['chat_id', 'user_id'],
+            set_={'last_read_message_id': func.greatest(ReadProgress.last_read_message_id,
+                                                        progress_query.excluded.last_read_message_id)})
+        .returning(ReadProgress.chat_id, ReadProgress.user_id, ReadProgress.last_read_message_id)
+        .cte('stored')
+    )
+    return (
+        select(
+            stored.c.chat_id,
+            stored.c.user_id,
+            stored.c.last_read_message_id,
+            previous.c.common_read_message_id.label('previous_chat_progress')
+        )
+        .select_from(stored)
+        .join(previous, previous.c.id == stored.c.chat_id)
+    )
+
+
+FLUSH_QUERY = _build_flush_query()
+
+
+# Write-behind buffer for read progress. Updates of the same (chat, user) merge to the maximum and are
+# written every few milliseconds with one multi-row upsert; callers are answered once their batch is stored.
+# Progress only moves forward, so READ COMMITTED with greatest() is enough, and rows are written in
+# (chat_id, user_id) order so concurrent batches from other instances lock in the same order.
+class ReadProgressCoalescer(ModuleWithDb):
+    def __init__(self,
+                 db: Db,
+                 flush_interval: float = settings.PROGRESS_FLUSH_INTERVAL_MS / 1000,
+                 max_batch: int = settings.PROGRESS_FLUSH_MAX_BATCH):
+        super().__init__(db=db)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.stats = ProgressCoalescerStats()
+        self._pending: dict[Tuple[int, int], int] = {}
+        self._waiters: defaultdict[Tuple[int, int], List[asyncio.Future]] = defaultdict(list)
+        self._flush_task: asyncio.Task | None = None
+
+    async def store(self, chat_id: int, user_id: int, last_read_message_id: int) -> ProgressUpdate:
+        key = (chat_id, user_id)
+        self.stats.updates += 1
+        if key in self._pending:
+            self.stats.coalesced += 1
+            self._pending[key] = max(self._pending[key], last_read_message_id)
+        else:
+            self._pending[key] = last_read_message_id
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[key].append(future)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # Updates arriving while a batch is written are picked up by the next round
+        while self._pending:
+            pending, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, defaultdict(list)
+            keys = sorted(pending)
+            for start in range(0, len(keys), self.max_batch):
+                batch = keys[start:start + self.max_batch]
+                try:
+                    updates = await self._flush([(*key, pending[key]) for key in batch])
+                except Exception as e:
+                    for key in batch:
+                        self._fail(waiters[key], e)
+                    continue
+                # Every caller publishes the chat progress it was handed when it moved, so a move is handed
+                # to one caller of the chat and the others see it as already announced
+                announced = set()
+                for key in batch:
+                    update = updates.get(key)
+                    if update is None:
+                        self._fail(waiters[key], Forbidden(message='You are not in the chat', name='ProgressModule'))
+                        continue
+                    unmoved = update.model_copy(update={'previous_chat_progress': update.chat_progress})
+                    for future in waiters[key]:
+                        if future.done():
+                            continue
+                        if update.chat_id in announced:
+                            future.set_result(unmoved)
+                        else:
+                            announced.add(update.chat_id)
+                            future.set_result(update)
+
+    async def _flush(self, rows: List[Tuple[int, int, int]]) -> dict[Tuple[int, int], ProgressUpdate]:
+        chat_ids = [row[0] for row in rows]
+        async with self.db.session_scope() as sess:
+            result = await sess.execute(FLUSH_QUERY, {
+                'chat_ids': chat_ids,
+                'user_ids': [row[1] for row in rows],
+                'last_read_message_ids': [row[2] for row in rows]
+            })
+            stored = result.all()
+            result = await sess.execute(
+                select(Chat.id, Chat.common_read_message_id)
+                .where(Chat.id.in_(set(chat_ids)))
+            )
+            chat_progress = {row.id: row.common_read_message_id for row in result}
+        self.stats.flushes += 1
+        self.stats.rows += len(rows)
+        self.stats.round_trips += ROUND_TRIPS_PER_FLUSH
+        self.stats.round_trips_saved = (
+            self.stats.updates * LEGACY_ROUND_TRIPS_PER_UPDATE - self.stats.round_trips
+        )
+        await self.db.mark_written(*(key for row in stored for key in (('chat', row.chat_id), ('user', row.user_id))))
+        return {
+            (row.chat_id, row.user_id): ProgressUpdate(
+                chat_id=row.chat_id,
+                user_id=row.user_id,
+                last_read_message_id=row.last_read_message_id,
+                previous_chat_progress=row.previous_chat_progress or -1,
+                chat_progress=chat_progress.get(row.chat_id) or -1
+            )
+            for row in stored
+        }
+
+    @staticmethod
+    def _fail(futures: List[asyncio.Future], error: Exception):
+        logger.warning(f'Read progress update failed: {error!r}')
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
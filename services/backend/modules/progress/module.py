@@ -1,47 +1,81 @@
+from typing import List
+
 from sqlalchemy import select, and_, func
 
 from services.backend.modules.base import ModuleWithDb
-from services.db.models import Message, ReadProgress
+from services.backend.modules.progress.coalescer import ReadProgressCoalescer
+from services.backend.modules.progress.schemas import ChatUnread
+from services.db import Db
+from services.db.models import Message, ReadProgress, Chat, ChatParticipant
 
 
 class ProgressModule(ModuleWithDb):
-    async def get_user_unread_in_chat(self, chat_id: int, user_id: int, until_mess_id: int | None = None) -> bool:
+    def __init__(self, db: Db):
+        super().__init__(db=db)
+        self.coalescer = ReadProgressCoalescer(db=db)
+
+    async def get_user_unread_in_chat(self, chat_id: int, user_id: int, until_mess_id: int | None = None) -> int:
+        # Sending a message advances the sender's progress to it, so none of the user's own messages
+        # are above their read sequence number and the difference of sequence numbers is the unread count.
+        if until_mess_id is None:
+            last_seq = Chat.last_seq
+        else:
+            last_seq = (
+                select(Message.seq)
+                .where(
+                    and_(
+                        Message.id == until_mess_id,
+                        Message.chat_id == chat_id
+                    )
+                ).scalar_subquery()
+            )
         query = (
-            select(func.count())
-            .select_from(Message)
+            select(func.greatest(last_seq - ReadProgress.last_read_seq, 0))
+            .select_from(ReadProgress)
+            .join(Chat, Chat.id == ReadProgress.chat_id)
             .where(
                 and_(
-                    Message.id > (
-                        select(ReadProgress.last_read_message_id)
-                        .where(
-                            and_(
-                                ReadProgress.chat_id == chat_id,
-                                ReadProgress.user_id == user_id
-                            )
-                        ).scalar_subquery()
-                    ),
-                    Message.chat_id == chat_id,
-                    Message.user_id != user_id
+                    ReadProgress.chat_id == chat_id,
+                    ReadProgress.user_id == user_id
                 )
             )
         )
-        if until_mess_id is not None:
-            query = query.where(Message.id <= until_mess_id)
-        async with self.db.session_scope() as sess:
+        async with self.db.read_session_scope(('chat', chat_id), ('user', user_id)) as sess:
             result = await sess.execute(query)
             unread = result.scalar_one_or_none()
             sess.expunge_all()
-        return unread
+        return unread or 0
 
-    async def get_chat_progress(self, chat_id):
+    async def get_user_unread_in_chats(self, user_id: int, chat_ids: List[int] | None = None) -> List[ChatUnread]:
         query = (
             select(
-                func.min(ReadProgress.last_read_message_id)
-            ).where(
-                ReadProgress.chat_id == chat_id
+                ReadProgress.chat_id,
+                func.greatest(Chat.last_seq - ReadProgress.last_read_seq, 0).label('unread')
             )
+            .join(Chat, Chat.id == ReadProgress.chat_id)
+            .join(
+                ChatParticipant,
+                and_(
+                    ChatParticipant.chat_id == ReadProgress.chat_id,
+                    ChatParticipant.user_id == ReadProgress.user_id
+                )
+            )
+            .where(ReadProgress.user_id == user_id)
+            .order_by(ReadProgress.chat_id)
+        )
+        if chat_ids is not None:
+            query = query.where(ReadProgress.chat_id.in_(chat_ids))
+        async with self.db.read_session_scope(('user', user_id)) as sess:
+            result = await sess.execute(query)
+            rows = result.all()
+        return [ChatUnread(chat_id=row.chat_id, unread=row.unread) for row in rows]
+
+    async def get_chat_progress(self, chat_id):
+        query = (
+            select(Chat.common_read_message_id)
+            .where(Chat.id == chat_id)
         )
-        async with self.db.session_scope() as sess:
+        async with self.db.read_session_scope(('chat', chat_id)) as sess:
             result = await sess.execute(query)
             progress = result.scalar_one_or_none()
             sess.expunge_all()
@@ -0,0 +1,24 @@
+from pydantic import BaseModel
+
+
+class ChatUnread(BaseModel):
+    chat_id: int
+    unread: int
+
+
+class ProgressUpdate(BaseModel):
+    chat_id: int
+    user_id: int
+    last_read_message_id: int
+    previous_chat_progress: int
+    chat_progress: int
+
+
+class ProgressCoalescerStats(BaseModel):
+    updates: int = 0
+    coalesced: int = 0
+    flushes: int = 0
+    rows: int = 0
+    round_trips: int = 0
+    # What the same updates cost before: chat progress read, serializable upsert, chat progress read
+    round_trips_saved: int = 0
@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import redis.asyncio as redis
+
+from services.app.logger import logger
+from services.app.schemas import WsMessageType
+from services.app.settings import settings
+from services.backend.modules.schemas import RateLimitStats
+
+RATE_LIMIT_PREFIX = 'rate_limit:'
+# Token bucket of one user and action: refills at rate tokens per second up to burst, every frame takes one.
+# The time comes from the redis server, so the clocks of the instances do not matter.
+# Returns whether the frame is allowed and the tokens left, as a string to keep the fraction.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil or ts == nil then
+  tokens = burst
+  ts = now
+end
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class Bucket:
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+# Per user and action token buckets for the websocket frames, enforced in redis so the limit holds however many
+# instances the user is connected to. Every instance keeps a copy of the buckets it checked, refilled at the same
+# rate and set to what redis returned. Other instances only ever take tokens, so the copy never holds fewer than
+# redis, and a frame the copy rejects is rejected without asking redis: a flooding client costs one redis call per
+# refilled token. When redis is unreachable the copy alone limits the user on this instance.
+class RateLimiter:
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 limits: Dict[WsMessageType, Tuple[float, int]] | None = None,
+                 buckets: int = settings.RATE_LIMIT_LOCAL_BUCKETS):
+        self.redis = redis_client
+        # Tokens per second and burst by action, actions without a limit are always allowed
+        self.limits = limits if limits is not None else {
+            WsMessageType.MESSAGE: (settings.RATE_LIMIT_MESSAGES_PER_SECOND, settings.RATE_LIMIT_MESSAGES_BURST),
+            WsMessageType.USER_PROGRESS: (settings.RATE_LIMIT_PROGRESS_PER_SECOND, settings.RATE_LIMIT_PROGRESS_BURST)
+        }
+        self.buckets = buckets
+        self.stats = RateLimitStats()
+        self._script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self._buckets: OrderedDict[Tuple[int, WsMessageType], Bucket] = OrderedDict()
+
+    async def acquire(self, user_id: int, action: WsMessageType) -> float:
+        # Takes a token of the user for the action. Returns 0 if the frame is allowed,
+        # otherwise the seconds until the next token.
+        limit = self.limits.get(action)
+        if limit is None:
+            return 0
+        rate, burst = limit
+        bucket = self._get(user_id=user_id, action=action, rate=rate, burst=burst)
+        if bucket.tokens < 1:
+            self.stats.local_rejections += 1
+            return (1 - bucket.tokens) / rate
+        try:
+            allowed, tokens = await self._script(
+                keys=[f'{RATE_LIMIT_PREFIX}{action.value}:{user_id}'],
+                args=[rate, burst]
+            )
+            bucket.tokens = float(tokens)
+        except redis.RedisError as e:
+            logger.error(f'Rate limiter: redis is unavailable, limiting user {user_id} on this instance - {e!r}')
+            self.stats.redis_errors += 1
+            bucket.tokens -= 1
+            allowed = True
+        if not allowed:
+            self.stats.redis_rejections += 1
+            return (1 - bucket.tokens) / rate
+        self.stats.allowed += 1
+        return 0
+
+    def get_stats(self) -> RateLimitStats:
+        return self.stats.model_copy(update={'buckets': len(self._buckets)})
+
+    def _get(self, user_id: int, action: WsMessageType, rate: float, burst: int) -> Bucket:
+        now = time.monotonic()
+        key = (user_id, action)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = Bucket(tokens=burst, updated_at=now)
+            while len(self._buckets) > self.buckets:
+                self._buckets.popitem(last=False)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+            self._buckets.move_to_end(key)
+        return bucket
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from services.app.schemas import RedisChannelType
+from services.app.schemas import RedisChannelType, ServerWsMessage
 
 
 class IRedisModule(ABC):
@@ -11,3 +11,20 @@ class IRedisModule(ABC):
     @abstractmethod
     async def unsubscribe(self, type: RedisChannelType, key: int | str):
         ...
+
+    @abstractmethod
+    def is_subscribed(self, type: RedisChannelType, key: int | str) -> bool:
+        ...
+
+
+class IRedisListener(ABC):
+    # Told about every message this instance publishes or receives, before it goes to the websockets
+    @abstractmethod
+    def on_message(self, message: ServerWsMessage) -> None:
+        ...
+
+    def on_subscribed(self, type: RedisChannelType, key: int | str) -> None:
+        pass
+
+    def on_unsubscribed(self, type: RedisChannelType, key: int | str) -> None:
+        pass
@@ -2,7 +2,7 @@ import asyncio
 import json
 from collections import defaultdict
 from functools import lru_cache
-from typing import Set
+from typing import List, Set, Tuple
 
 from services.app.logger import logger
 from services.app.schemas import RedisChannelType, ServerWsMessage, parse_server_message
@@ -11,7 +11,7 @@ from services.app.settings import settings
 import redis.asyncio as redis
 
 from services.backend.modules.redis.handlers import get_handler
-from services.backend.modules.redis.interface import IRedisModule
+from services.backend.modules.redis.interface import IRedisModule, IRedisListener
 from services.backend.modules.websocket.interface import IWebsocketModule
 
 
@@ -26,16 +26,22 @@ class RedisModule(IRedisModule):
         self.pubsub = self.redis.pubsub()
         self.running_task = None
         self.websocket_module = None
+        self.listeners: List[IRedisListener] = []
         self.channels_subscriptions: Set[str] = set()
 
     def set_websocket_module(self, ws_module: IWebsocketModule):
         self.websocket_module = ws_module
 
+    def add_listener(self, listener: IRedisListener):
+        self.listeners.append(listener)
+
     async def subscribe(self, type: RedisChannelType, key: int | str):
         channel = self.get_channel(type=type, key=key)
         if channel:
             await self.pubsub.subscribe(**{channel: self._processor})
             self.channels_subscriptions.add(channel)
+            for listener in self.listeners:
+                listener.on_subscribed(type=type, key=key)
             if not self.running_task:
                 await self.run()
         else:
@@ -46,14 +52,16 @@ class RedisModule(IRedisModule):
         if channel and channel in self.channels_subscriptions:
             await self.pubsub.unsubscribe(channel)
             self.channels_subscriptions.remove(channel)
+            for listener in self.listeners:
+                listener.on_unsubscribed(type=type, key=key)
         else:
             logger.error(f'Redis module: attempted to unsubscribe but cannot find the channel for the key: {key}')
 
+    def is_subscribed(self, type: RedisChannelType, key: int | str) -> bool:
+        return self.get_channel(type=type, key=key) in self.channels_subscriptions
+
     async def _processor(self, *args, **kwargs):
         logger.debug(args)
-        if not self.websocket_module:
-            logger.error('Redis module: attempted to parse redis message but no websocket module is set. Skipping.')
-            return
         try:
             message_data = args[0]['data'].decode('utf-8')
             message_json = json.loads(message_data)
@@ -63,6 +71,11 @@ class RedisModule(IRedisModule):
                          f'Input - {args}')
             return
         message_parsed = parse_server_message(message_json)
+        if message_parsed:
+            self._notify(message=message_parsed)
+        if not self.websocket_module:
+            logger.error('Redis module: attempted to parse redis message but no websocket module is set. Skipping.')
+            return
         if message_parsed:
             handler = get_handler(message_parsed.type)
             await handler(
@@ -75,10 +88,26 @@ class RedisModule(IRedisModule):
 
     async def publish(self, type: RedisChannelType, key: str | int, message: ServerWsMessage):
         channel = self.get_channel(type=type, key=key)
+        self._notify(message=message)
         await self.redis.publish(channel, message.model_dump_json())
         if channel not in self.channels_subscriptions:
             logger.error(f'Published {message.model_dump_json()} in {channel}, but not subscribed to it')
 
+    async def publish_many(self, messages: List[Tuple[RedisChannelType, str | int, ServerWsMessage]]):
+        # One round trip for the whole list, in order
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for type, key, message in messages:
+                channel = self.get_channel(type=type, key=key)
+                self._notify(message=message)
+                pipe.publish(channel, message.model_dump_json())
+                if channel not in self.channels_subscriptions:
+                    logger.error(f'Published {message.model_dump_json()} in {channel}, but not subscribed to it')
+            await pipe.execute()
+
+    def _notify(self, message: ServerWsMessage):
+        for listener in self.listeners:
+            listener.on_message(message)
+
     async def run(self):
         self.running_task = asyncio.create_task(self.pubsub.run())
 
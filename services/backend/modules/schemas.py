@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+
+class DirectoryCacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    hit_ratio: float = 0
+    invalidations: int = 0
+    evictions: int = 0
+    entries: int = 0
+
+
+class RateLimitStats(BaseModel):
+    allowed: int = 0
+    local_rejections: int = 0
+    redis_rejections: int = 0
+    redis_errors: int = 0
+    buckets: int = 0
@@ -1,19 +1,18 @@
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 
-from services.backend.modules.base import ModuleWithDb
+from services.backend.modules.base import ModuleWithDb, project_rows
+from services.backend.modules.user.schemas import UserBase
 from services.db.models import User
 
+USER_QUERY = select(User.id, User.name).where(User.id == bindparam('user_id'))
+
 
 class UserModule(ModuleWithDb):
-    async def get_user(self, user_id: int) -> User | None:
-        query = (
-            select(User)
-            .where(
-                User.id == user_id
-            )
-        )
-        async with self.db.session_scope() as sess:
-            result = await sess.execute(query)
-            user = result.scalar_one_or_none()
-            sess.expunge_all()
-        return user
+    async def get_user(self, user_id: int) -> UserBase | None:
+        return await self.read_through(('user', user_id), lambda: self._load_user(user_id=user_id))
+
+    async def _load_user(self, user_id: int) -> UserBase | None:
+        async with self.db.read_session_scope() as sess:
+            result = await sess.execute(USER_QUERY, {'user_id': user_id})
+            users = project_rows(UserBase, result)
+        return users[0] if users else None
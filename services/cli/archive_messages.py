@@ -0,0 +1,36 @@
+"""Moves messages older than MESSAGE_ARCHIVE_AFTER_DAYS into the compressed message_archive table.
+
+    python -m services.cli.archive_messages [--older-than-days 90] [--interval 3600]
+Without --interval it archives once and exits.
+"""
+import argparse
+import asyncio
+from datetime import datetime, UTC, timedelta
+
+from services.app.logger import logger
+from services.app.settings import settings
+from services.backend.modules.message.archive import MessageArchive
+from services.db import get_db
+
+
+async def run(older_than_days: int, interval: float | None):
+    db = get_db()
+    archive = MessageArchive(db=db)
+    try:
+        while True:
+            older_than = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=older_than_days)
+            archived = await archive.archive(older_than=older_than)
+            logger.info(f'Archived {archived} messages older than {older_than.isoformat()}')
+            if interval is None:
+                break
+            await asyncio.sleep(interval)
+    finally:
+        await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--older-than-days', type=int, default=settings.MESSAGE_ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--interval', type=float, default=None, help='Seconds between archiving runs')
+    args = parser.parse_args()
+    asyncio.run(run(older_than_days=args.older_than_days, interval=args.interval))
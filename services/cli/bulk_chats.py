@@ -0,0 +1,49 @@
+"""Exports chats with their members, hot and archived messages and read progress through binary COPY,
+or imports such an export.
+
+    python -m services.cli.bulk_chats export --chat-ids 1 2 3 --output chats.bulk
+    python -m services.cli.bulk_chats import --input chats.bulk
+Chat and message IDs are kept: the target database must be at the same schema revision,
+must have the users of the chats and must not have the chats yet.
+"""
+import argparse
+import asyncio
+
+from services.app.logger import logger
+from services.backend.modules.bulk import BulkModule
+from services.backend.modules.bulk.schemas import BulkTransferStats
+from services.db import get_db
+
+
+def log_stats(action: str, stats: BulkTransferStats):
+    rows = ', '.join(f'{table}: {count}' for table, count in stats.rows.items())
+    messages = stats.rows.get('message', 0)
+    logger.info(f'{action} {rows} in {stats.seconds:.2f} s, {stats.bytes / 2 ** 20:.1f} MiB of COPY data, '
+                f'{messages / stats.seconds:.0f} messages/s')
+
+
+async def run(args: argparse.Namespace):
+    db = get_db()
+    bulk_module = BulkModule(db=db)
+    try:
+        if args.command == 'export':
+            with open(args.output, 'wb') as output:
+                stats = await bulk_module.export_chats(chat_ids=args.chat_ids, output=output)
+            log_stats('Exported', stats)
+        else:
+            with open(args.input, 'rb') as source:
+                stats = await bulk_module.import_chats(source=source)
+            log_stats('Imported', stats)
+    finally:
+        await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export')
+    export_parser.add_argument('--chat-ids', type=int, nargs='+', required=True)
+    export_parser.add_argument('--output', required=True)
+    import_parser = commands.add_parser('import')
+    import_parser.add_argument('--input', required=True)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,51 @@
+"""Moves the still valid tokens of the token_blacklist table to the redis revocation keys and empties the table.
+
+    python -m services.cli.migrate_token_blacklist [--batch-size 1000]
+Expired tokens are only deleted. It can run while the application is online and as often as needed;
+nothing writes to the table anymore, so it stays empty afterwards.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import select, delete
+
+from services.app.logger import logger
+from services.backend.modules.authentication.revocation import TokenRevocations
+from services.backend.modules.redis import get_redis_module
+from services.db import get_db
+from services.db.models import TokenBlacklist
+
+
+async def run(batch_size: int):
+    db = get_db()
+    redis_client = get_redis_module().redis
+    revocations = TokenRevocations(redis_client=redis_client)
+    deleted = 0
+    try:
+        while True:
+            query = (
+                select(TokenBlacklist.id, TokenBlacklist.token, TokenBlacklist.expires_at)
+                .order_by(TokenBlacklist.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            async with db.session_scope() as sess:
+                rows = (await sess.execute(query)).all()
+                if not rows:
+                    break
+                for row in rows:
+                    # expires_at was stored as a naive local time, timestamp() is its inverse
+                    await revocations.revoke(token=row.token, expires_at=row.expires_at.timestamp())
+                await sess.execute(delete(TokenBlacklist).where(TokenBlacklist.id.in_([row.id for row in rows])))
+            deleted += len(rows)
+        logger.info(f'Moved {revocations.stats.revoked} revoked tokens to redis, deleted {deleted} rows of token_blacklist')
+    finally:
+        await redis_client.aclose()
+        await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(batch_size=args.batch_size))
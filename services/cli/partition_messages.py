@@ -0,0 +1,230 @@
+"""Moves the rows of message into message_partitioned in chunks and swaps the tables.
+
+Run after `alembic upgrade` created message_partitioned:
+    python -m services.cli.partition_messages --chunk-size 10000
+New writes are mirrored by a trigger while the copy runs, so the application can stay online.
+The swap takes a short exclusive lock and leaves the old table as message_legacy.
+"""
+import argparse
+import asyncio
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.app.logger import logger
+from services.db import get_db, Db
+
+# Columns, constraints and indexes are read from the catalog, so the tool works at any schema revision
+# that has message_partitioned, whatever columns or indexes later migrations added to both tables
+COLUMNS_QUERY = text("""
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = :table
+    ORDER BY ordinal_position
+""")
+CONSTRAINTS_QUERY = text("""
+    SELECT conname FROM pg_constraint
+    WHERE conrelid = CAST(:table AS regclass)
+    ORDER BY conname
+""")
+# Indexes backing a constraint are renamed with it
+INDEXES_QUERY = text("""
+    SELECT indexname FROM pg_indexes
+    WHERE schemaname = current_schema() AND tablename = :table
+      AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass))
+    ORDER BY indexname
+""")
+
+SWAP_PREPARE = [
+    'LOCK TABLE message, message_partitioned IN ACCESS EXCLUSIVE MODE',
+    'DROP TRIGGER mirror_message_to_partitioned ON message',
+    'DROP FUNCTION mirror_message_to_partitioned()',
+    'DROP TRIGGER assign_message_seq ON message',
+]
+SWAP_FINISH = [
+    # Otherwise dropping message_legacy would drop the sequence with it
+    'ALTER SEQUENCE message_id_seq OWNED BY message.id',
+]
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def copy_chunk_query(columns: List[str]):
+    names = ', '.join(quote(column) for column in columns)
+    return text(f"""
+        INSERT INTO message_partitioned ({names})
+        SELECT {names} FROM message
+        WHERE id > :from_id AND id <= :to_id
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def reconcile_queries(columns: List[str]) -> List[Tuple[str, object]]:
+    # A chunk copy races deletes on message (e.g. the archiver): the mirrored DELETE does not see the row the copy
+    # has not committed yet, which then only exists in message_partitioned. Updates can race the same way.
+    key = 'm.chat_id = p.chat_id AND m.id = p.id'
+    values = [column for column in columns if column not in ('chat_id', 'id')]
+    names = ', '.join(quote(column) for column in columns)
+    source = ', '.join(f'm.{quote(column)}' for column in columns)
+    source_values = ', '.join(f'm.{quote(column)}' for column in values)
+    target_values = ', '.join(f'p.{quote(column)}' for column in values)
+    return [
+        ('extra', text(f"""
+            DELETE FROM message_partitioned p
+            WHERE NOT EXISTS (SELECT FROM message m WHERE {key})
+        """)),
+        ('missing', text(f"""
+            INSERT INTO message_partitioned ({names})
+            SELECT {source} FROM message m
+            WHERE NOT EXISTS (SELECT FROM message_partitioned p WHERE {key})
+            ON CONFLICT DO NOTHING
+        """)),
+        ('changed', text(f"""
+            UPDATE message_partitioned p
+            SET ({', '.join(quote(column) for column in values)}) = ROW({source_values})
+            FROM message m
+            WHERE {key} AND ROW({target_values}) IS DISTINCT FROM ROW({source_values})
+        """)),
+    ]
+
+
+def diff_query(columns: List[str]):
+    # Rows of either table without an identical row in the other one
+    names = ', '.join(quote(column) for column in columns)
+    return text(f"""
+        SELECT
+          (SELECT count(*) FROM (SELECT {names} FROM message EXCEPT ALL SELECT {names} FROM message_partitioned) d),
+          (SELECT count(*) FROM (SELECT {names} FROM message_partitioned EXCEPT ALL SELECT {names} FROM message) d)
+    """)
+
+
+async def get_names(sess: AsyncSession, query, table: str) -> List[str]:
+    result = await sess.execute(query, {'table': table})
+    return list(result.scalars())
+
+
+async def get_rename_statements(sess: AsyncSession, table: str, old: str, new: str) -> List[str]:
+    # message_pkey -> message_legacy_pkey, uq_message_partitioned_chat_id_seq -> uq_message_chat_id_seq, ...
+    statements = []
+    for kind, query in (('TABLE', CONSTRAINTS_QUERY), ('INDEX', INDEXES_QUERY)):
+        for name in await get_names(sess, query, table):
+            if old not in name:
+                continue
+            renamed = name.replace(old, new, 1)
+            if kind == 'TABLE':
+                statements.append(f'ALTER TABLE {table} RENAME CONSTRAINT {quote(name)} TO {quote(renamed)}')
+            else:
+                statements.append(f'ALTER INDEX {quote(name)} RENAME TO {quote(renamed)}')
+    return statements
+
+
+async def is_partitioned(db: Db) -> bool:
+    async with db.session_scope() as sess:
+        result = await sess.execute(text("SELECT relkind::text FROM pg_class WHERE relname = 'message'"))
+        return result.scalar_one() == 'p'
+
+
+async def has_partitioned_copy(db: Db) -> bool:
+    async with db.session_scope() as sess:
+        result = await sess.execute(text("SELECT to_regclass('message_partitioned') IS NOT NULL"))
+        return result.scalar_one()
+
+
+async def get_columns(db: Db) -> List[str] | None:
+    # The columns to copy, None when the two tables differ
+    async with db.session_scope() as sess:
+        columns = await get_names(sess, COLUMNS_QUERY, 'message')
+        partitioned_columns = await get_names(sess, COLUMNS_QUERY, 'message_partitioned')
+    return columns if set(columns) == set(partitioned_columns) else None
+
+
+async def copy_rows(db: Db, columns: List[str], chunk_size: int, pause: float) -> int:
+    async with db.session_scope() as sess:
+        result = await sess.execute(text('SELECT min(id), max(id) FROM message'))
+        min_id, max_id = result.one()
+    if min_id is None:
+        return 0
+    # Rows above max_id are written after this point and reach message_partitioned through the trigger
+    copy_chunk = copy_chunk_query(columns)
+    copied = 0
+    from_id = min_id - 1
+    while from_id < max_id:
+        to_id = min(from_id + chunk_size, max_id)
+        async with db.session_scope() as sess:
+            result = await sess.execute(copy_chunk, {'from_id': from_id, 'to_id': to_id})
+            copied += result.rowcount
+        logger.info(f'Copied messages with id in ({from_id}, {to_id}], {copied} rows so far')
+        from_id = to_id
+        if pause:
+            await asyncio.sleep(pause)
+    return copied
+
+
+async def reconcile(sess: AsyncSession, columns: List[str]) -> None:
+    for name, query in reconcile_queries(columns):
+        result = await sess.execute(query)
+        if result.rowcount:
+            logger.info(f'Reconciled {result.rowcount} {name} rows of message_partitioned')
+
+
+async def verify(db: Db, columns: List[str]) -> bool:
+    async with db.session_scope() as sess:
+        result = await sess.execute(diff_query(columns))
+        only_source, only_target = result.one()
+    logger.info(f'Rows only in message: {only_source}, only in message_partitioned: {only_target}')
+    return only_source == only_target == 0
+
+
+async def swap(db: Db, columns: List[str]) -> None:
+    async with db.session_scope() as sess:
+        for statement in SWAP_PREPARE:
+            await sess.execute(text(statement))
+        # Nothing writes either table any more, so this catches the races since the verification
+        await reconcile(sess, columns)
+        # Read under the lock, the old table is renamed first so the names it gives up are free
+        statements = [
+            *await get_rename_statements(sess, table='message', old='message', new='message_legacy'),
+            'ALTER TABLE message RENAME TO message_legacy',
+            *await get_rename_statements(sess, table='message_partitioned', old='message_partitioned', new='message'),
+            'ALTER TABLE message_partitioned RENAME TO message',
+            *SWAP_FINISH
+        ]
+        for statement in statements:
+            await sess.execute(text(statement))
+    logger.info('message is now partitioned, the old table is kept as message_legacy')
+
+
+async def run(chunk_size: int, pause: float, skip_swap: bool):
+    db = get_db()
+    try:
+        if await is_partitioned(db):
+            logger.info('message is already partitioned')
+            return
+        if not await has_partitioned_copy(db):
+            logger.error('message_partitioned does not exist, run alembic upgrade first')
+            return
+        columns = await get_columns(db)
+        if columns is None:
+            logger.error('message and message_partitioned have different columns, not copying')
+            return
+        await copy_rows(db, columns=columns, chunk_size=chunk_size, pause=pause)
+        async with db.session_scope() as sess:
+            await reconcile(sess, columns)
+        if not await verify(db, columns):
+            logger.error('The tables differ, not swapping. Re-run to copy the missing rows.')
+            return
+        if not skip_swap:
+            await swap(db, columns)
+    finally:
+        await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+    parser.add_argument('--skip-swap', action='store_true', help='Only copy and verify the rows')
+    args = parser.parse_args()
+    asyncio.run(run(chunk_size=args.chunk_size, pause=args.pause, skip_swap=args.skip_swap))
@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import Set, List
 
-from sqlalchemy import Integer, String, ForeignKey, Enum, DateTime, text
+from sqlalchemy import Integer, String, ForeignKey, Enum, DateTime, text, FetchedValue, UniqueConstraint, Index, \
+    LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from services.app.schemas import ChatTypeEnum
@@ -36,6 +38,12 @@ class Chat(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
     type: Mapped[ChatTypeEnum] = mapped_column(Enum(ChatTypeEnum), nullable=False)
+    # Minimum of the members' read progress, maintained by the read_progress trigger
+    common_read_message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Sequence number of the latest message, bumped by the message insert trigger
+    last_seq: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+    # Bumped by the chat_participant triggers on every join and leave
+    membership_version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
 
     users: Mapped[Set['User']] = relationship(secondary='chat_participant', back_populates='chats')
     messages: Mapped[List['Message']] = relationship(back_populates='chat')
@@ -43,28 +51,60 @@ class Chat(Base):
 
 class Message(Base):
     __tablename__ = 'message'
-
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    chat_id: Mapped[int] = mapped_column(Integer, ForeignKey('chat.id'), nullable=False)
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'seq', name='uq_message_chat_id_seq'),
+        UniqueConstraint('chat_id', 'user_id', 'client_msg_id', name='uq_message_chat_id_user_id_client_msg_id'),
+        Index('ix_message_content_tsv', text("to_tsvector('simple', content)"), postgresql_using='gin'),
+        {'postgresql_partition_by': 'HASH (chat_id)'},
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer, ForeignKey('chat.id'), primary_key=True)
+    # Dense per-chat sequence number, assigned by the message insert trigger
+    seq: Mapped[int] = mapped_column(Integer, nullable=False, server_default=FetchedValue())
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False)
     content: Mapped[str] = mapped_column(String, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False,
                                                 server_default=text("(now() at time zone 'utc')"))
+    # Idempotency key of the sender, a retried send with the same key returns the stored message
+    client_msg_id: Mapped[str | None] = mapped_column(String, nullable=True)
 
     chat: Mapped['Chat'] = relationship(back_populates='messages')
     user: Mapped['User'] = relationship(back_populates='messages')
 
 
+class MessageArchiveBlock(Base):
+    __tablename__ = 'message_archive'
+
+    chat_id: Mapped[int] = mapped_column(Integer, ForeignKey('chat.id'), primary_key=True)
+    first_message_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    last_message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Number of messages in the block per author, keyed by the user ID as a string
+    user_counts: Mapped[dict[str, int]] = mapped_column(JSONB, nullable=False)
+    # zlib compressed JSON list of [id, seq, user_id, content, timestamp] rows in id order
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # Ids and seqs of the payload rows, for the read_progress trigger to find the seq of an archived message
+    message_ids: Mapped[List[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    message_seqs: Mapped[List[int]] = mapped_column(ARRAY(Integer), nullable=False)
+
+
 class ReadProgress(Base):
     __tablename__ = 'read_progress'
+    __table_args__ = (
+        Index('ix_read_progress_chat_id_last_read_message_id', 'chat_id', 'last_read_message_id'),
+    )
 
     chat_id: Mapped[int] = mapped_column(Integer, ForeignKey('chat.id'), primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), primary_key=True)
-    last_read_message_id: Mapped[int] = mapped_column(Integer, ForeignKey('message.id'), nullable=False)
+    last_read_message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Sequence number of last_read_message_id, assigned by the read_progress trigger
+    last_read_seq: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
 
     chat: Mapped['Chat'] = relationship()
     user: Mapped['User'] = relationship()
-    message: Mapped['Message'] = relationship()
 
 
 class TokenBlacklist(Base):
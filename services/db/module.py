@@ -1,35 +1,206 @@
+import asyncio
+import random
+import time
 from contextlib import asynccontextmanager
 from functools import lru_cache
-from typing import AsyncIterator
+from typing import AsyncIterator, Hashable, Iterable, List, Tuple
 
+import redis.asyncio as redis
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from services.app.logger import logger
 from services.app.settings import settings
 
+# Zero when the replica has replayed everything it received, otherwise the age of the last replayed commit.
+# A server that is not in recovery (e.g. the primary itself listed as a replica) has no lag. Having replayed
+# everything received says nothing while the WAL receiver is down or has not heard from the primary for
+# wal_receiver_timeout, so then the lag is unknown (NULL). The receiver status is only visible to roles with
+# pg_read_all_stats, other roles only see whether a receiver process is running.
+# Also returns the WAL position the server has replayed, in bytes.
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+      WHEN NOT pg_is_in_recovery() THEN 0
+      WHEN NOT EXISTS (
+        SELECT FROM pg_stat_wal_receiver
+        WHERE coalesce(status, 'streaming') = 'streaming'
+          AND (last_msg_receipt_time IS NULL
+               OR current_setting('wal_receiver_timeout')::interval = interval '0'
+               OR last_msg_receipt_time > now() - current_setting('wal_receiver_timeout')::interval)
+      ) THEN NULL
+      WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+      ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END,
+    (CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END - '0/0')::bigint
+""")
+WRITTEN_LSN_QUERY = text("SELECT (pg_current_wal_lsn() - '0/0')::bigint")
+REPLICA_LAG_CHECK_TIMEOUT = 5
+WRITTEN_KEYS_PRUNE_SIZE = 10_000
+WRITTEN_PREFIX = 'db_written:'
+# Keeps the highest WAL position written for every key, writes of other instances may arrive out of order
+WRITTEN_SCRIPT = """
+local lsn = tonumber(ARGV[1])
+for _, key in ipairs(KEYS) do
+  local current = tonumber(redis.call('GET', key))
+  if current == nil or current < lsn then
+    redis.call('SET', key, ARGV[1], 'PX', ARGV[2])
+  end
+end
+"""
+
+
+def written_key(key: Hashable) -> str:
+    parts = key if isinstance(key, tuple) else (key,)
+    return WRITTEN_PREFIX + ':'.join(str(part) for part in parts)
+
+
+class Replica:
+    def __init__(self, url, pool_size: int, max_overflow: int):
+        self.engine = create_async_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_recycle=60 * 10)
+        self.session_maker = async_sessionmaker(bind=self.engine, class_=AsyncSession)
+        # Seconds behind the primary, None until measured or while the replica is unreachable
+        self.lag: float | None = None
+        # WAL position replayed as of the last check
+        self.replayed_lsn: int | None = None
+
 
 class Db:
-    def __init__(self, url):
+    def __init__(self,
+                 url,
+                 replica_urls: Iterable[str] = (),
+                 max_replica_lag: float = 1.0,
+                 lag_check_interval: float = 1.0,
+                 replica_pool_size: int = 10,
+                 replica_max_overflow: int = 20):
         self.engine = create_async_engine(url, pool_size=50, max_overflow=100, pool_recycle=60 * 10)
         self.serializable_mode = self.engine.execution_options(isolation_level='SERIALIZABLE')
         self.session_maker = async_sessionmaker(bind=self.engine, class_=AsyncSession)
+        self.replicas: List[Replica] = [
+            Replica(url=replica_url, pool_size=replica_pool_size, max_overflow=replica_max_overflow)
+            for replica_url in replica_urls
+        ]
+        self.max_replica_lag = max_replica_lag
+        self.lag_check_interval = lag_check_interval
+        self._lag_checked_at = float('-inf')
+        self._lag_check: asyncio.Task | None = None
+        # WAL position and time of the last write of every key through this process
+        self._written: dict[Hashable, Tuple[int, float]] = {}
+        self.redis: redis.Redis | None = None
+        self._written_script = None
 
     @asynccontextmanager
     async def session_scope(self) -> AsyncIterator[AsyncSession]:
-        async with self.session_maker() as session:
-            try:
-                yield session
-                await session.commit()
-                await session.close()
-            except Exception as e:
-                logger.exception(e)
-                await session.rollback()
-                await session.close()
-                raise
+        async with self._scope(self.session_maker()) as session:
+            yield session
 
     @asynccontextmanager
     async def serializable_session_scope(self) -> AsyncIterator[AsyncSession]:
-        async with self.session_maker(bind=self.serializable_mode) as session:
+        async with self._scope(self.session_maker(bind=self.serializable_mode)) as session:
+            yield session
+
+    @asynccontextmanager
+    async def read_session_scope(self, *consistency_keys: Hashable) -> AsyncIterator[AsyncSession]:
+        # Read-only work goes to a replica that is within the lag limit and has replayed the last
+        # write of the keys through any instance.
+        replica = await self._pick_replica(consistency_keys)
+        session_maker = replica.session_maker if replica else self.session_maker
+        async with self._scope(session_maker()) as session:
+            yield session
+
+    def set_redis_client(self, redis_client: redis.Redis) -> None:
+        # Shares the written positions with the other instances behind the load balancer
+        self.redis = redis_client
+        self._written_script = redis_client.register_script(WRITTEN_SCRIPT)
+
+    async def mark_written(self, *consistency_keys: Hashable) -> None:
+        # Called after the commit, so the position covers the write
+        if not self.replicas or not consistency_keys:
+            return
+        lsn = await self._current_lsn()
+        now = time.monotonic()
+        window = self._consistency_window()
+        for key in consistency_keys:
+            previous = self._written.get(key)
+            if previous is not None and now - previous[1] < window:
+                lsn = max(lsn, previous[0])
+            self._written[key] = (lsn, now)
+        if len(self._written) > WRITTEN_KEYS_PRUNE_SIZE:
+            self._written = {key: written for key, written in self._written.items() if now - written[1] < window}
+        if self.redis is None:
+            return
+        try:
+            await self._written_script(keys=[written_key(key) for key in consistency_keys],
+                                       args=[lsn, int(window * 1000)])
+        except redis.RedisError as e:
+            logger.error(f'Db: redis is unavailable, writes only stay on the primary for this instance - {e!r}')
+
+    async def _current_lsn(self) -> int:
+        async with self.engine.connect() as conn:
+            return await conn.scalar(WRITTEN_LSN_QUERY)
+
+    def _consistency_window(self) -> float:
+        # A replica within the lag limit has replayed a write after the lag limit plus one check
+        # interval, so the written positions are only kept that long
+        return self.max_replica_lag + self.lag_check_interval
+
+    async def _pick_replica(self, consistency_keys: Iterable[Hashable]) -> Replica | None:
+        if not self.replicas:
+            return None
+        now = time.monotonic()
+        self._schedule_lag_check(now)
+        fresh = [replica for replica in self.replicas
+                 if replica.lag is not None and replica.lag <= self.max_replica_lag]
+        if not fresh:
+            return None
+        try:
+            written_lsn = await self._written_lsn(list(consistency_keys), now)
+        except redis.RedisError as e:
+            logger.error(f'Db: redis is unavailable, reading from the primary - {e!r}')
+            return None
+        if written_lsn is not None:
+            # The replayed position is as of the last check, so it can only be behind
+            fresh = [replica for replica in fresh
+                     if replica.replayed_lsn is not None and replica.replayed_lsn >= written_lsn]
+        return random.choice(fresh) if fresh else None
+
+    async def _written_lsn(self, consistency_keys: List[Hashable], now: float) -> int | None:
+        window = self._consistency_window()
+        positions = [written[0] for written in map(self._written.get, consistency_keys)
+                     if written is not None and now - written[1] < window]
+        if self.redis is not None and consistency_keys:
+            values = await self.redis.mget([written_key(key) for key in consistency_keys])
+            positions.extend(int(value) for value in values if value is not None)
+        return max(positions, default=None)
+
+    def _schedule_lag_check(self, now: float) -> None:
+        if now - self._lag_checked_at < self.lag_check_interval:
+            return
+        if self._lag_check is not None and not self._lag_check.done():
+            return
+        self._lag_checked_at = now
+        self._lag_check = asyncio.create_task(self._check_replica_lag())
+
+    async def _check_replica_lag(self) -> None:
+        await asyncio.gather(*(self._check_lag(replica) for replica in self.replicas))
+
+    @staticmethod
+    async def _check_lag(replica: Replica) -> None:
+        try:
+            async with asyncio.timeout(REPLICA_LAG_CHECK_TIMEOUT):
+                async with replica.engine.connect() as conn:
+                    result = await conn.execute(REPLICA_LAG_QUERY)
+                    lag, replayed_lsn = result.one()
+            replica.lag = float(lag) if lag is not None else None
+            replica.replayed_lsn = replayed_lsn
+        except Exception as e:
+            logger.warning(f'Replica {replica.engine.url.host} lag check failed: {e!r}')
+            replica.lag = None
+            replica.replayed_lsn = None
+
+    @staticmethod
+    @asynccontextmanager
+    async def _scope(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+        async with session:
             try:
                 yield session
                 await session.commit()
@@ -44,4 +215,11 @@ class Db:
 @lru_cache
 def get_db():
     url = settings.get_db_url()
-    return Db(url=url)
+    return Db(
+        url=url,
+        replica_urls=settings.get_db_replica_urls(),
+        max_replica_lag=settings.DB_REPLICA_MAX_LAG_SECONDS,
+        lag_check_interval=settings.DB_REPLICA_LAG_CHECK_SECONDS,
+        replica_pool_size=settings.DB_REPLICA_POOL_SIZE,
+        replica_max_overflow=settings.DB_REPLICA_MAX_OVERFLOW
+    )
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, UTC
+
+import jwt
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.app.schemas import TokenType
+from services.app.settings import settings
+from services.backend.modules.authentication import AuthenticationModule
+from services.backend.modules.authentication.revocation import TokenRevocations
+from services.db import Db
+from services.db.models import User
+
+
+@pytest.fixture
+def revocations():
+    revocations = MagicMock(TokenRevocations)
+    revocations.is_revoked = AsyncMock(return_value=False)
+    revocations.revoke_many = AsyncMock()
+    return revocations
+
+
+@pytest.fixture
+def auth_module(revocations):
+    auth_module = AuthenticationModule(db=MagicMock(Db), revocations=revocations)
+    auth_module._authenticate_user = AsyncMock(return_value=User(id=1, name='first'))
+    return auth_module
+
+
+@pytest.mark.asyncio
+async def test_login_checks_no_revocations(auth_module, revocations):
+    user, access_token, refresh_token = await auth_module.login(email='first@example.com', password='password')
+
+    assert await auth_module._verify_token(access_token.value, TokenType.ACCESS)
+    assert await auth_module._verify_token(refresh_token.value, TokenType.REFRESH)
+    assert revocations.is_revoked.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_revokes_current_access_token(auth_module, revocations):
+    refresh_token = auth_module._create_token(data={'sub': '1'}, token_type=TokenType.REFRESH)
+    access_token = auth_module._create_token(data={'sub': '1'}, token_type=TokenType.ACCESS)
+
+    cookie = await auth_module.refresh_access(refresh_token=refresh_token, cur_access_token=access_token)
+
+    assert cookie.value != access_token
+    revocations.is_revoked.assert_awaited_once_with(refresh_token)
+    revocations.revoke_many.assert_awaited_once()
+    assert revocations.revoke_many.await_args.args[0][0][0] == access_token
+
+
+@pytest.mark.asyncio
+async def test_refresh_skips_expired_access_token(auth_module, revocations):
+    refresh_token = auth_module._create_token(data={'sub': '1'}, token_type=TokenType.REFRESH)
+    expired_access_token = jwt.encode({'sub': '1', 'exp': datetime.now(UTC) - timedelta(minutes=1),
+                                       'token_type': TokenType.ACCESS}, settings.SECRET_KEY,
+                                      algorithm=settings.ALGORITHM)
+
+    await auth_module.refresh_access(refresh_token=refresh_token, cur_access_token=expired_access_token)
+
+    revocations.revoke_many.assert_not_awaited()
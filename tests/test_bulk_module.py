@@ -0,0 +1,99 @@
+import gzip
+import io
+
+import pytest
+from unittest.mock import MagicMock
+
+from services.app.exceptions import InvalidOperationError
+from services.backend.modules.bulk import BulkModule
+from services.backend.modules.bulk.module import TABLES
+from services.backend.modules.bulk.schemas import BulkTransferStats
+from services.db import Db
+from services.db.models import Base
+
+
+class FakeDriver:
+    def __init__(self, tables: dict[str, list[bytes]]):
+        self.tables = tables
+        self.copied: dict[str, bytes] = {}
+        self.columns: dict[str, list[str]] = {}
+
+    async def copy_from_query(self, query, *args, output, format):
+        table = query.split(' FROM ')[1].split()[0]
+        for chunk in self.tables[table]:
+            await output(chunk)
+        return f'COPY {len(self.tables[table])}'
+
+    async def copy_to_table(self, table, source, columns, format):
+        chunks = [chunk async for chunk in source]
+        self.copied[table] = b''.join(chunks)
+        self.columns[table] = columns
+        return f'COPY {len(chunks)}'
+
+
+@pytest.fixture
+def bulk_module():
+    return BulkModule(db=MagicMock(Db))
+
+
+async def export(bulk_module: BulkModule, driver: FakeDriver, revision: str = 'head') -> io.BytesIO:
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as archive:
+        await bulk_module._copy_out(driver=driver, chat_ids=[1, 2], revision=revision, archive=archive,
+                                    stats=BulkTransferStats())
+    output.seek(0)
+    return output
+
+
+@pytest.mark.asyncio
+async def test_export_round_trips(bulk_module):
+    tables = {table: [f'{table} {i}'.encode() for i in range(3)] for table, _, _ in TABLES}
+    tables['message_archive'] = []
+    source = await export(bulk_module, FakeDriver(tables))
+
+    target = FakeDriver({})
+    stats = BulkTransferStats()
+    with gzip.GzipFile(fileobj=source, mode='rb') as archive:
+        assert bulk_module._read_manifest(archive=archive, revision='head') == [1, 2]
+        await bulk_module._copy_in(driver=target, archive=archive, stats=stats)
+
+    assert target.copied == {table: b''.join(chunks) for table, chunks in tables.items()}
+    assert stats.rows['message'] == 3
+    assert stats.rows['message_archive'] == 0
+
+
+def test_every_column_of_the_tables_is_transferred():
+    assert {table: set(columns) for table, _, columns in TABLES} == \
+        {table: set(Base.metadata.tables[table].columns.keys()) for table, _, _ in TABLES}
+
+
+@pytest.mark.asyncio
+async def test_messages_keep_their_client_msg_id(bulk_module):
+    source = await export(bulk_module, FakeDriver({table: [] for table, _, _ in TABLES}))
+
+    target = FakeDriver({})
+    with gzip.GzipFile(fileobj=source, mode='rb') as archive:
+        bulk_module._read_manifest(archive=archive, revision='head')
+        await bulk_module._copy_in(driver=target, archive=archive, stats=BulkTransferStats())
+
+    assert 'client_msg_id' in target.columns['message']
+
+
+@pytest.mark.asyncio
+async def test_other_schema_revision_is_rejected(bulk_module):
+    source = await export(bulk_module, FakeDriver({table: [] for table, _, _ in TABLES}), revision='old')
+
+    with gzip.GzipFile(fileobj=source, mode='rb') as archive:
+        with pytest.raises(InvalidOperationError):
+            bulk_module._read_manifest(archive=archive, revision='head')
+
+
+@pytest.mark.asyncio
+async def test_truncated_export_is_rejected(bulk_module):
+    source = await export(bulk_module, FakeDriver({table: [b'rows'] for table, _, _ in TABLES}))
+    truncated = gzip.decompress(source.read())[:-20]
+
+    with gzip.GzipFile(fileobj=io.BytesIO(gzip.compress(truncated)), mode='rb') as archive:
+        bulk_module._read_manifest(archive=archive, revision='head')
+        with pytest.raises(InvalidOperationError):
+            await bulk_module._copy_in(driver=FakeDriver({}), archive=archive, stats=BulkTransferStats())
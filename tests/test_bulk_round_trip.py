@@ -0,0 +1,124 @@
+import io
+import os
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, delete, text
+from sqlalchemy.exc import SQLAlchemyError
+from unittest.mock import patch
+
+from services.app.schemas import ChatTypeEnum
+from services.app.settings import settings
+from services.backend.modules.bulk import BulkModule
+from services.backend.modules.bulk.module import TABLES
+from services.backend.modules.message.archive import MessageArchive
+from services.db import Db
+from services.db.models import User, Chat, ChatParticipant, Message, MessageArchiveBlock, ReadProgress
+
+# COPY and the insert triggers only run against a database, the configured one is used when it is reachable.
+# BULK_ROUND_TRIP_MESSAGES sizes the chat, e.g. 1000000 to measure the throughput on a real history.
+MESSAGES = int(os.environ.get('BULK_ROUND_TRIP_MESSAGES', 2000))
+ARCHIVE_SETTINGS = SimpleNamespace(MESSAGE_ARCHIVE_AFTER_DAYS=90, MESSAGE_ARCHIVE_BLOCK_SIZE=100,
+                                   MESSAGE_ARCHIVE_KEEP_LAST=MESSAGES // 2)
+SEED_QUERY = text("""
+    INSERT INTO message (chat_id, seq, user_id, content, timestamp, client_msg_id)
+    SELECT :chat_id, n, CASE WHEN n % 3 = 0 THEN CAST(:second_user_id AS int) ELSE CAST(:first_user_id AS int) END,
+           'round trip message ' || n || repeat(' lorem ipsum', n % 8),
+           timestamp '2020-01-01' + n * interval '1 second',
+           CASE WHEN n % 2 = 0 THEN 'client-' || n END
+    FROM generate_series(1, CAST(:messages AS int)) n
+""")
+
+
+def checksum_query(table: str, key: str, columns: tuple[str, ...]):
+    row = f'ROW({", ".join(columns)})::text'
+    return text(f"SELECT count(*), md5(coalesce(string_agg({row}, ',' ORDER BY {row}), '')) "
+                f"FROM {table} WHERE {key} = :chat_id")
+
+
+@pytest_asyncio.fixture
+async def db():
+    db = Db(url=settings.get_db_url())
+    try:
+        async with db.engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+    except (OSError, SQLAlchemyError) as e:
+        await db.engine.dispose()
+        pytest.skip(f'Database is not available - {e!r}')
+    yield db
+    await db.engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def chat(db):
+    async with db.session_scope() as sess:
+        users = [User(name=f'bulk {i}', email=f'{uuid.uuid4()}@test', password='-') for i in range(2)]
+        chat = Chat(name='bulk round trip', type=ChatTypeEnum.GROUP, last_seq=MESSAGES)
+        sess.add_all([*users, chat])
+        await sess.flush()
+        sess.add_all([ChatParticipant(chat_id=chat.id, user_id=user.id) for user in users])
+        chat_id, user_ids = chat.id, [user.id for user in users]
+    async with db.session_scope() as sess:
+        await sess.execute(SEED_QUERY, {'chat_id': chat_id, 'first_user_id': user_ids[0],
+                                        'second_user_id': user_ids[1], 'messages': MESSAGES})
+    yield chat_id, user_ids
+    async with db.session_scope() as sess:
+        for model in (ReadProgress, MessageArchiveBlock, Message, ChatParticipant):
+            await sess.execute(delete(model).where(model.chat_id == chat_id))
+        await sess.execute(delete(Chat).where(Chat.id == chat_id))
+        await sess.execute(delete(User).where(User.id.in_(user_ids)))
+
+
+async def checksums(db: Db, chat_id: int) -> dict[str, tuple]:
+    async with db.session_scope() as sess:
+        return {
+            table: tuple((await sess.execute(checksum_query(table, key, columns), {'chat_id': chat_id})).one())
+            for table, key, columns in TABLES
+        }
+
+
+@pytest.mark.asyncio
+async def test_exported_chat_is_imported_unchanged(db, chat):
+    chat_id, user_ids = chat
+    with patch('services.backend.modules.message.archive.settings', ARCHIVE_SETTINGS):
+        archived = await MessageArchive(db).archive_chat(chat_id=chat_id, older_than=datetime(2021, 1, 1))
+    async with db.session_scope() as sess:
+        message_ids = (await sess.execute(
+            select(Message.id).where(Message.chat_id == chat_id).order_by(Message.seq)
+        )).scalars().all()
+        first_archived = (await sess.execute(
+            select(MessageArchiveBlock.message_ids[1]).where(MessageArchiveBlock.chat_id == chat_id)
+            .order_by(MessageArchiveBlock.first_message_id).limit(1)
+        )).scalar_one()
+        # Progress on the last hot message and on the first archived one
+        sess.add_all([
+            ReadProgress(chat_id=chat_id, user_id=user_ids[0], last_read_message_id=message_ids[-1]),
+            ReadProgress(chat_id=chat_id, user_id=user_ids[1], last_read_message_id=first_archived)
+        ])
+    before = await checksums(db, chat_id)
+
+    bulk_module = BulkModule(db=db)
+    export = io.BytesIO()
+    exported = await bulk_module.export_chats(chat_ids=[chat_id], output=export)
+    async with db.session_scope() as sess:
+        for model in (ReadProgress, MessageArchiveBlock, Message, ChatParticipant):
+            await sess.execute(delete(model).where(model.chat_id == chat_id))
+        await sess.execute(delete(Chat).where(Chat.id == chat_id))
+    export.seek(0)
+    imported = await bulk_module.import_chats(source=export)
+
+    print(f'\nbulk round trip of {MESSAGES} messages ({archived} archived): '
+          f'export {MESSAGES / exported.seconds:.0f} messages/s, import {MESSAGES / imported.seconds:.0f} messages/s, '
+          f'{exported.bytes / 2 ** 20:.1f} MiB COPY data, {export.getbuffer().nbytes / 2 ** 20:.1f} MiB compressed')
+    assert archived > 0
+    assert imported.rows == exported.rows
+    assert await checksums(db, chat_id) == before
+    async with db.session_scope() as sess:
+        assert await sess.scalar(select(Chat.last_seq).where(Chat.id == chat_id)) == MESSAGES
+        progress = (await sess.execute(
+            select(ReadProgress.user_id, ReadProgress.last_read_seq).where(ReadProgress.chat_id == chat_id)
+        )).all()
+    assert dict(progress) == {user_ids[0]: MESSAGES, user_ids[1]: 1}
@@ -0,0 +1,122 @@
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import HTTPException
+
+from services.app.api.v1 import chat
+from services.app.schemas import ChatTypeEnum
+from services.backend.modules.chat import ChatModule
+from services.backend.modules.chat.schemas import ChatFull
+from services.backend.modules.user.schemas import UserBase
+
+USER = UserBase(id=1, name='first')
+
+
+class FakeResult:
+    def __init__(self, rows: list[tuple]):
+        self.rows = rows
+
+    def keys(self):
+        return ['id', 'name', 'type']
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeStreamResult:
+    def __init__(self, rows: list[tuple], batch: int):
+        self.rows = rows
+        self.batch = batch
+
+    async def partitions(self):
+        for start in range(0, len(self.rows), self.batch):
+            yield [ChatFull(id=id, name=name, type=type) for id, name, type in self.rows[start:start + self.batch]]
+
+
+class FakeSession:
+    def __init__(self, chats: list[tuple]):
+        self.chats = chats
+        self.queries = []
+
+    def _select(self, query) -> list[tuple]:
+        self.queries.append(query)
+        params = query.compile().params
+        rows = [c for c in self.chats if c[0] > params.get('id_1', 0)
+                and c[1].lower().startswith(params.get('name_1', '').lower())
+                and params.get('type_1', c[2]) == c[2]]
+        return rows[:params['param_1']] if 'param_1' in params else rows
+
+    async def execute(self, query):
+        return FakeResult(self._select(query))
+
+    async def stream(self, query):
+        return FakeStreamResult(self._select(query), batch=query.get_execution_options()['yield_per'])
+
+
+class FakeDb:
+    def __init__(self, chats: list[tuple]):
+        self.session = FakeSession(chats)
+
+    @asynccontextmanager
+    async def read_session_scope(self, *consistency_keys):
+        yield self.session
+
+
+class FakeBackend:
+    def __init__(self, chat_module: ChatModule):
+        self.chat_module = chat_module
+
+
+@pytest.fixture
+def chat_module():
+    chats = [(id, f'{"team" if id % 2 else "room"} {id}',
+              ChatTypeEnum.GROUP if id % 3 else ChatTypeEnum.PRIVATE) for id in range(1, 26)]
+    return ChatModule(db=FakeDb(chats))
+
+
+@pytest.mark.asyncio
+async def test_pages_follow_cursor_until_exhausted(chat_module):
+    backend = FakeBackend(chat_module)
+    ids, cursor = [], None
+    while True:
+        page = await chat.directory(backend=backend, user=USER, name='Team', type=None, limit=5, cursor=cursor)
+        ids += [c.id for c in page.chats]
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+
+    assert ids == list(range(1, 26, 2))
+    # Pages after the first seek past the cursor instead of skipping rows
+    assert all('chat.id >' in str(q) and 'OFFSET' not in str(q) for q in chat_module.db.session.queries[1:])
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_is_rejected(chat_module):
+    with pytest.raises(HTTPException) as e:
+        await chat.directory(backend=FakeBackend(chat_module), user=USER, name=None, type=None, limit=5,
+                             cursor='abc')
+    assert e.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_all_still_lists_chats_up_to_limit(chat_module):
+    chats = await chat.get_all(backend=FakeBackend(chat_module), user=USER, limit=10)
+
+    assert [c.id for c in chats] == list(range(1, 11))
+    assert chat_module.db.session.queries[0].compile().params['param_1'] == 10
+
+
+@pytest.mark.asyncio
+async def test_stream_writes_one_chat_per_line_in_batches(chat_module, monkeypatch):
+    monkeypatch.setattr('services.backend.modules.chat.module.DIRECTORY_STREAM_BATCH', 4)
+    response = await chat.directory_stream(backend=FakeBackend(chat_module), user=USER, name=None,
+                                           type=ChatTypeEnum.PRIVATE)
+
+    chunks = [chunk async for chunk in response.body_iterator]
+    chats = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+
+    assert response.media_type == 'application/x-ndjson'
+    assert [c['id'] for c in chats] == list(range(3, 26, 3))
+    assert {c['type'] for c in chats} == {ChatTypeEnum.PRIVATE.value}
+    assert len(chunks) == 2
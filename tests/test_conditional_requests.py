@@ -0,0 +1,207 @@
+from datetime import datetime
+
+import pytest
+from fastapi import Request, Response
+from unittest.mock import AsyncMock
+
+from services.app.api.v1 import chat, message
+from services.app.api.v1.conditional import is_not_modified
+from services.app.exceptions import Forbidden
+from services.app.schemas import ChatTypeEnum
+from services.backend.modules.chat.schemas import ChatFull, ChatMembers
+from services.backend.modules.message.schemas import MessagesPagination, MessageFull
+from services.backend.modules.user.schemas import UserBase
+
+FIRST = UserBase(id=1, name='first')
+SECOND = UserBase(id=2, name='second')
+
+
+class FakeChats:
+    def __init__(self):
+        self.members = {1: {FIRST.id}, 2: {FIRST.id, SECOND.id}}
+        self.membership_version = {1: 1, 2: 2}
+        self.messages: dict[int, list[MessageFull]] = {1: [], 2: []}
+        self.progress = {1: None, 2: None}
+
+    def send(self, chat_id: int, user_id: int):
+        seq = len(self.messages[chat_id]) + 1
+        self.messages[chat_id].append(MessageFull(id=seq, chat_id=chat_id, seq=seq, user_id=user_id,
+                                                  content=f'message {seq}', timestamp=datetime(2026, 1, 1)))
+
+    def join(self, chat_id: int, user_id: int):
+        self.members[chat_id].add(user_id)
+        self.membership_version[chat_id] += 1
+        self.send(chat_id, user_id)
+
+    def leave(self, chat_id: int, user_id: int):
+        self.send(chat_id, user_id)
+        self.members[chat_id].discard(user_id)
+        self.membership_version[chat_id] += 1
+
+
+class FakeChatModule:
+    def __init__(self, chats: FakeChats):
+        self.chats = chats
+        self.get_user_chats = AsyncMock(side_effect=self._get_user_chats)
+
+    async def get_chat(self, chat_id: int) -> ChatFull | None:
+        return ChatFull(id=chat_id, name=f'chat {chat_id}', type=ChatTypeEnum.GROUP)
+
+    async def check_user_in_chat(self, chat_id: int, user_id: int) -> bool:
+        return user_id in self.chats.members[chat_id]
+
+    async def get_user_chat_ids(self, user_id: int) -> frozenset[int]:
+        return frozenset(chat_id for chat_id, members in self.chats.members.items() if user_id in members)
+
+    async def _get_user_chats(self, user_id: int) -> list[ChatFull]:
+        return [await self.get_chat(chat_id) for chat_id in sorted(await self.get_user_chat_ids(user_id))]
+
+    async def get_chat_members(self, chat_id: int) -> ChatMembers:
+        users = {FIRST.id: FIRST, SECOND.id: SECOND}
+        return ChatMembers(membership_version=self.chats.membership_version[chat_id],
+                           users=[users[user_id] for user_id in sorted(self.chats.members[chat_id])])
+
+
+class FakeMessageModule:
+    def __init__(self, chats: FakeChats):
+        self.chats = chats
+        self.get_messages_with_pagination_data = AsyncMock(side_effect=self._get_page)
+
+    async def get_last_seq(self, chat_id: int) -> int:
+        return len(self.chats.messages[chat_id])
+
+    async def get_count(self, chat_id: int) -> int:
+        return len(self.chats.messages[chat_id])
+
+    async def _get_page(self, chat_id, user_id, limit, offset, after_seq) -> MessagesPagination:
+        messages = [m for m in reversed(self.chats.messages[chat_id]) if user_id is None or m.user_id == user_id]
+        return MessagesPagination(messages=messages[offset:offset + limit], limit=limit, offset=offset,
+                                  total_count=len(messages))
+
+
+class FakeProgressModule:
+    def __init__(self, chats: FakeChats):
+        self.chats = chats
+
+    async def get_chat_progress(self, chat_id: int) -> int | None:
+        return self.chats.progress[chat_id]
+
+
+class FakeBackend:
+    def __init__(self):
+        self.chats = FakeChats()
+        self.chat_module = FakeChatModule(self.chats)
+        self.message_module = FakeMessageModule(self.chats)
+        self.progress_module = FakeProgressModule(self.chats)
+
+
+def get_request(etag: str | None = None) -> Request:
+    headers = [(b'if-none-match', etag.encode())] if etag else []
+    return Request({'type': 'http', 'method': 'GET', 'headers': headers})
+
+
+async def fetch(route, backend: FakeBackend, etag: str | None = None, **params) -> tuple[int, str, object]:
+    response = Response()
+    result = await route(request=get_request(etag), response=response, backend=backend, **params)
+    if isinstance(result, Response):
+        return result.status_code, result.headers['etag'], None
+    return 200, response.headers['etag'], result
+
+
+@pytest.fixture
+def backend():
+    backend = FakeBackend()
+    backend.chats.send(2, FIRST.id)
+    return backend
+
+
+async def get_history(backend, etag=None, user=FIRST, **params):
+    return await fetch(message.get_chat_messages, backend, etag, user=user, chat_id=2, **params)
+
+
+@pytest.mark.asyncio
+async def test_unchanged_history_is_not_read_again(backend):
+    status, etag, page = await get_history(backend)
+    assert status == 200 and page.total_count == 1
+
+    status, same_etag, page = await get_history(backend, etag)
+
+    assert (status, same_etag, page) == (304, etag, None)
+    backend.message_module.get_messages_with_pagination_data.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_send_changes_history_validator(backend):
+    _, etag, _ = await get_history(backend)
+    _, user_etag, _ = await get_history(backend, user_id=SECOND.id)
+
+    backend.chats.send(2, FIRST.id)
+
+    status, new_etag, page = await get_history(backend, etag)
+    assert status == 200 and new_etag != etag and page.total_count == 2
+    # A page of another member's messages is revalidated as well, the validator is the chat's latest message
+    status, new_user_etag, _ = await get_history(backend, user_etag, user_id=SECOND.id)
+    assert status == 200 and new_user_etag != user_etag
+    assert (await get_history(backend, new_etag))[0] == 304
+
+
+@pytest.mark.asyncio
+async def test_member_who_left_gets_no_not_modified(backend):
+    _, etag, _ = await get_history(backend, user=SECOND)
+
+    backend.chats.leave(2, SECOND.id)
+
+    with pytest.raises(Forbidden):
+        await get_history(backend, etag, user=SECOND)
+
+
+@pytest.mark.asyncio
+async def test_joins_and_leaves_change_member_list_validator(backend):
+    status, etag, users = await fetch(chat.get_chat_users, backend, user=FIRST, chat_id=1)
+    assert status == 200 and users == [FIRST]
+    assert (await fetch(chat.get_chat_users, backend, etag, user=FIRST, chat_id=1))[0] == 304
+
+    backend.chats.join(1, SECOND.id)
+    status, joined_etag, users = await fetch(chat.get_chat_users, backend, etag, user=FIRST, chat_id=1)
+    assert status == 200 and joined_etag != etag and users == [FIRST, SECOND]
+
+    backend.chats.leave(1, SECOND.id)
+    status, left_etag, users = await fetch(chat.get_chat_users, backend, joined_etag, user=FIRST, chat_id=1)
+    assert status == 200 and left_etag not in (etag, joined_etag) and users == [FIRST]
+
+
+@pytest.mark.asyncio
+async def test_joins_and_leaves_change_user_chats_validator(backend):
+    status, etag, chats = await fetch(chat.get_user_chats, backend, user=SECOND)
+    assert status == 200 and [c.id for c in chats] == [2]
+    assert (await fetch(chat.get_user_chats, backend, etag, user=SECOND))[0] == 304
+    backend.chat_module.get_user_chats.assert_awaited_once()
+
+    backend.chats.join(1, SECOND.id)
+    status, joined_etag, chats = await fetch(chat.get_user_chats, backend, etag, user=SECOND)
+    assert status == 200 and [c.id for c in chats] == [1, 2]
+
+    backend.chats.leave(1, SECOND.id)
+    status, left_etag, chats = await fetch(chat.get_user_chats, backend, joined_etag, user=SECOND)
+    # Back in the same chats as before, so the first validator is current again
+    assert status == 200 and left_etag == etag and [c.id for c in chats] == [2]
+
+
+@pytest.mark.asyncio
+async def test_read_progress_changes_progress_validator(backend):
+    status, etag, progress = await fetch(chat.progress, backend, user=FIRST, chat_id=2)
+    assert (status, progress) == (200, None)
+    assert (await fetch(chat.progress, backend, etag, user=FIRST, chat_id=2))[0] == 304
+
+    backend.chats.progress[2] = 1
+
+    status, new_etag, progress = await fetch(chat.progress, backend, etag, user=FIRST, chat_id=2)
+    assert (status, progress) == (200, 1) and new_etag != etag
+
+
+def test_if_none_match_uses_weak_comparison():
+    assert is_not_modified(get_request('"seq-1"'), 'W/"seq-1"')
+    assert is_not_modified(get_request('W/"seq-0", W/"seq-1"'), 'W/"seq-1"')
+    assert is_not_modified(get_request('*'), 'W/"seq-1"')
+    assert not is_not_modified(get_request('W/"seq-10"'), 'W/"seq-1"')
+    assert not is_not_modified(get_request(), 'W/"seq-1"')
@@ -0,0 +1,197 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from services.app.schemas import WsMessageType, ServerUserLeftMessage
+from services.backend.modules.chat import ChatModule
+from services.backend.modules.chat.module import CHAT_MEMBERS_QUERY, MEMBERSHIP_VERSION_QUERY
+from services.backend.modules.directory_cache import DirectoryCache
+from services.backend.modules.redis import RedisModule
+from services.db import Db
+
+
+class MembersDb:
+    # The chat and participant rows shared by the instances
+    def __init__(self):
+        self.version = 1
+        self.users = [(1, 'first')]
+        self.member_loads = 0
+
+    @asynccontextmanager
+    async def session_scope(self):
+        yield self
+
+    async def scalar(self, query, params):
+        assert query is MEMBERSHIP_VERSION_QUERY
+        return self.version
+
+    async def execute(self, query, params):
+        assert query is CHAT_MEMBERS_QUERY
+        self.member_loads += 1
+        result = MagicMock()
+        result.all.return_value = [SimpleNamespace(membership_version=self.version, id=user_id, name=name)
+                                   for user_id, name in self.users]
+        return result
+
+
+class Loader:
+    def __init__(self, value='value'):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.value
+
+
+@pytest.mark.asyncio
+async def test_read_through_until_ttl():
+    cache = DirectoryCache(size=10, ttl=30)
+    load = Loader()
+    with patch('services.backend.modules.directory_cache.time.monotonic', return_value=100.0):
+        assert await cache.get('key', load) == 'value'
+        assert await cache.get('key', load) == 'value'
+    with patch('services.backend.modules.directory_cache.time.monotonic', return_value=131.0):
+        assert await cache.get('key', load) == 'value'
+
+    assert load.calls == 2
+    stats = cache.get_stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_load_once():
+    cache = DirectoryCache(size=10, ttl=30)
+    load = Loader()
+    load.release.clear()
+
+    readers = [asyncio.create_task(cache.get('key', load)) for _ in range(10)]
+    await asyncio.sleep(0)
+    load.release.set()
+
+    assert await asyncio.gather(*readers) == ['value'] * 10
+    assert load.calls == 1
+    assert cache.get_stats().coalesced == 9
+
+
+@pytest.mark.asyncio
+async def test_load_in_flight_during_invalidation_is_not_cached():
+    cache = DirectoryCache(size=10, ttl=30)
+    stale = Loader('stale')
+    stale.release.clear()
+    reader = asyncio.create_task(cache.get('key', stale))
+    await asyncio.sleep(0)
+
+    cache.invalidate('key')
+    assert await cache.get('key', Loader('fresh')) == 'fresh'
+    stale.release.set()
+    assert await reader == 'stale'
+
+    assert await cache.get('key', Loader('newer')) == 'fresh'
+
+
+@pytest.mark.asyncio
+async def test_waiters_of_invalidated_load_load_again():
+    cache = DirectoryCache(size=10, ttl=30)
+    stale = Loader('stale')
+    stale.release.clear()
+    loading = asyncio.create_task(cache.get('key', stale))
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(cache.get('key', Loader('fresh')))
+    await asyncio.sleep(0)
+
+    cache.invalidate('key')
+    stale.release.set()
+
+    assert await loading == 'stale'
+    assert await waiting == 'fresh'
+    assert await cache.get('key', Loader('newer')) == 'fresh'
+
+
+@pytest.mark.asyncio
+async def test_waiters_load_again_when_loading_request_goes_away():
+    cache = DirectoryCache(size=10, ttl=30)
+    first = Loader('first')
+    first.release.clear()
+    loading = asyncio.create_task(cache.get('key', first))
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(cache.get('key', Loader('second')))
+    await asyncio.sleep(0)
+
+    loading.cancel()
+
+    assert await waiting == 'second'
+    assert await cache.get('key', Loader('third')) == 'second'
+
+
+@pytest.mark.asyncio
+async def test_errors_and_missing_entities_are_not_cached():
+    cache = DirectoryCache(size=10, ttl=30)
+
+    async def fail():
+        raise ConnectionError('database is gone')
+
+    with pytest.raises(ConnectionError):
+        await cache.get('key', fail)
+    assert await cache.get('key', Loader(None)) is None
+    assert await cache.get('key', Loader('value')) == 'value'
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entries_are_evicted():
+    cache = DirectoryCache(size=2, ttl=30)
+    for key in ('first', 'second'):
+        await cache.get(key, Loader(key))
+    await cache.get('first', Loader())
+    await cache.get('third', Loader('third'))
+
+    assert await cache.get('first', Loader('reloaded')) == 'first'
+    assert await cache.get('second', Loader('reloaded')) == 'reloaded'
+    assert cache.get_stats().evictions == 2
+
+
+@pytest.mark.asyncio
+async def test_membership_changes_drop_member_lists():
+    cache = DirectoryCache(size=10, ttl=30)
+    chat_module = ChatModule(db=MagicMock(Db), directory_cache=cache)
+    with patch('redis.asyncio.Redis'):
+        redis_module = RedisModule()
+    redis_module.add_listener(chat_module)
+    await cache.get(('chat_users', 1), Loader(['first', 'second']))
+    await cache.get(('chat_users', 2), Loader(['first']))
+
+    # A leave through this instance, then one published by another instance
+    await chat_module._membership_changed(chat_id=1, user_id=2)
+    redis_module._notify(ServerUserLeftMessage(
+        type=WsMessageType.USER_LEFT, chat_id=2, user_id=1, message_id=1, content='I left!'
+    ))
+
+    assert await cache.get(('chat_users', 1), Loader(['first'])) == ['first']
+    assert await cache.get(('chat_users', 2), Loader([])) == []
+    assert cache.get_stats().invalidations == 2
+
+
+@pytest.mark.asyncio
+async def test_member_list_cached_by_instance_that_missed_the_change_is_reloaded():
+    db = MembersDb()
+    first = ChatModule(db=db, directory_cache=DirectoryCache(size=10, ttl=30))
+    second = ChatModule(db=db, directory_cache=DirectoryCache(size=10, ttl=30))
+    assert (await first.get_chat_members(chat_id=1)).membership_version == 1
+    assert (await second.get_chat_members(chat_id=1)).membership_version == 1
+
+    # A join through the first instance, the second one is not subscribed to the chat and hears nothing
+    db.version = 2
+    db.users.append((2, 'second'))
+    first.invalidate(('chat_users', 1))
+
+    members = await second.get_chat_members(chat_id=1)
+    assert members.membership_version == 2
+    assert [user.id for user in members.users] == [1, 2]
+    await second.get_chat_members(chat_id=1)
+    assert db.member_loads == 3
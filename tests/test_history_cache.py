@@ -0,0 +1,122 @@
+from datetime import datetime
+
+import pytest
+from unittest.mock import patch
+
+from services.backend.modules.message.history_cache import HistoryCache
+from services.backend.modules.message.schemas import MessageFull
+
+
+def make_message(seq: int, chat_id: int = 1) -> MessageFull:
+    return MessageFull(
+        id=seq * 10,
+        chat_id=chat_id,
+        seq=seq,
+        user_id=1,
+        content=f'message {seq}',
+        timestamp=datetime(2025, 1, 1)
+    )
+
+
+def make_page(first_seq: int, last_seq: int, chat_id: int = 1):
+    return [make_message(seq, chat_id=chat_id) for seq in range(last_seq, first_seq - 1, -1)]
+
+
+@pytest.fixture
+def cache():
+    cache = HistoryCache(chats=2, size=5, ttl=60)
+    cache.set_enabled(True)
+    return cache
+
+
+def test_seeded_first_page_is_served(cache):
+    cache.seed(chat_id=1, messages=make_page(8, 10), last_seq=10)
+
+    messages, count = cache.get_latest(chat_id=1, limit=3)
+
+    assert [message.seq for message in messages] == [10, 9, 8]
+    assert count == 10
+    assert cache.get_latest(chat_id=1, limit=4) is None
+    assert cache.get_stats().hit_ratio == 0.5
+
+
+def test_short_history_is_complete(cache):
+    cache.seed(chat_id=1, messages=make_page(1, 2), last_seq=2)
+
+    messages, count = cache.get_latest(chat_id=1, limit=100)
+
+    assert [message.seq for message in messages] == [2, 1]
+    assert count == 2
+
+
+def test_appends_extend_ring_buffer(cache):
+    cache.seed(chat_id=1, messages=make_page(1, 3), last_seq=3)
+    for seq in range(4, 9):
+        cache.append(make_message(seq))
+    cache.append(make_message(8))
+
+    messages, count = cache.get_latest(chat_id=1, limit=5)
+
+    assert [message.seq for message in messages] == [8, 7, 6, 5, 4]
+    assert count == 8
+    assert cache.get_latest(chat_id=1, limit=6) is None
+
+
+def test_sequence_gap_drops_chat(cache):
+    cache.seed(chat_id=1, messages=make_page(1, 3), last_seq=3)
+    cache.append(make_message(5))
+
+    assert cache.get_latest(chat_id=1, limit=1) is None
+    assert cache.get_stats().invalidations == 1
+
+
+def test_stale_page_is_not_seeded(cache):
+    cache.append(make_message(11))
+    cache.seed(chat_id=1, messages=make_page(8, 10), last_seq=10)
+    cache.seed(chat_id=2, messages=make_page(8, 10, chat_id=2), last_seq=11)
+    cache.seed(chat_id=3, messages=[make_message(10, chat_id=3), make_message(8, chat_id=3)], last_seq=10)
+
+    assert cache.get_stats().chats == 0
+
+
+def test_disabled_cache_is_not_seeded(cache):
+    cache.set_enabled(False)
+    cache.seed(chat_id=1, messages=make_page(1, 3), last_seq=3)
+
+    assert cache.get_latest(chat_id=1, limit=1) is None
+
+
+def test_least_recently_used_chat_is_evicted(cache):
+    for chat_id in (1, 2):
+        cache.seed(chat_id=chat_id, messages=make_page(1, 1, chat_id=chat_id), last_seq=1)
+    cache.get_latest(chat_id=1, limit=1)
+    cache.seed(chat_id=3, messages=make_page(1, 1, chat_id=3), last_seq=1)
+
+    assert cache.get_latest(chat_id=2, limit=1) is None
+    assert cache.get_latest(chat_id=1, limit=1) is not None
+    assert cache.get_stats().evictions == 1
+
+
+def test_resume_after_seq(cache):
+    cache.seed(chat_id=1, messages=make_page(6, 10), last_seq=10)
+
+    messages, count = cache.get_after(chat_id=1, after_seq=7, limit=2)
+    assert [message.seq for message in messages] == [9, 8]
+    assert count == 10
+    assert cache.get_after(chat_id=1, after_seq=10, limit=2)[0] == []
+    assert cache.get_after(chat_id=1, after_seq=5, limit=2) is not None
+    assert cache.get_after(chat_id=1, after_seq=4, limit=2) is None
+
+
+def test_expired_chat_is_reloaded(cache):
+    with patch('services.backend.modules.message.history_cache.time.monotonic', return_value=100.0):
+        cache.seed(chat_id=1, messages=make_page(1, 1), last_seq=1)
+    with patch('services.backend.modules.message.history_cache.time.monotonic', return_value=161.0):
+        assert cache.get_latest(chat_id=1, limit=1) is None
+
+
+def test_lookups_are_not_counted_while_disabled(cache):
+    cache.set_enabled(False)
+    cache.get_latest(chat_id=1, limit=1)
+
+    assert cache.get_stats().misses == 0
@@ -0,0 +1,198 @@
+from contextlib import asynccontextmanager
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy import Delete
+
+from services.app.schemas import RedisChannelType, WsMessageType, ServerUserLeftMessage
+from services.backend.modules.chat import ChatModule
+from services.backend.modules.chat.membership_cache import MembershipCache
+from services.backend.modules.redis import RedisModule
+from services.backend.modules.websocket.interface import IWebsocketModule
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def mget(self, *keys):
+        return [self.values.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = str(value).encode()
+
+    async def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+        return int(self.values[key])
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+class FakeDb:
+    def __init__(self, participants: set[tuple[int, int]]):
+        self.participants = participants
+        self.membership_reads = 0
+
+    @asynccontextmanager
+    async def session_scope(self):
+        session = MagicMock()
+        session.execute = AsyncMock(side_effect=self._execute)
+        session.commit = AsyncMock()
+        session.refresh = AsyncMock()
+        yield session
+
+    async def _execute(self, query, params=None):
+        result = MagicMock()
+        if isinstance(query, Delete):
+            if query.table.name == 'chat_participant':
+                values = list(query.compile().params.values())
+                self.participants.discard((values[0], values[1]))
+        else:
+            self.membership_reads += 1
+            result.scalars.return_value = [chat_id for chat_id, user_id in self.participants
+                                           if user_id == params['user_id']]
+        return result
+
+    async def mark_written(self, *consistency_keys):
+        pass
+
+
+class Node:
+    def __init__(self, db: FakeDb, redis_client: FakeRedis, nodes: list['Node']):
+        with patch('redis.asyncio.Redis') as mock_redis_class:
+            mock_redis_instance = MagicMock()
+            mock_redis_instance.publish = AsyncMock(side_effect=self._publish)
+            mock_redis_class.return_value = mock_redis_instance
+            self.redis_module = RedisModule()
+        self.redis_module.pubsub.subscribe = AsyncMock()
+        self.redis_module.pubsub.unsubscribe = AsyncMock()
+        self.redis_module.run = AsyncMock()
+        # A channel per user and chat, so an instance only hears about the users connected to it
+        self.redis_module.get_channel = lambda type, key: f'{type.value}:{key}'
+        self.redis_module.set_websocket_module(MagicMock(IWebsocketModule))
+        self.chat_module = ChatModule(db=db, membership_cache=MembershipCache(redis_client=redis_client))
+        self.chat_module.membership_cache.set_redis_module(self.redis_module)
+        self.redis_module.add_listener(self.chat_module.membership_cache)
+        self.nodes = nodes
+        nodes.append(self)
+
+    async def _publish(self, channel: str, data: str):
+        # Redis delivers the message to every subscribed instance, the publishing one included
+        for node in self.nodes:
+            if channel in node.redis_module.channels_subscriptions:
+                await node.redis_module._processor({'channel': channel.encode(), 'data': data.encode()})
+
+    async def leave(self, chat_id: int, user_id: int):
+        message = await self.chat_module.delete_user_from_chat(chat_id=chat_id, user_id=user_id)
+        await self.redis_module.publish(
+            type=RedisChannelType.USER,
+            key=user_id,
+            message=ServerUserLeftMessage(type=WsMessageType.USER_LEFT, chat_id=chat_id, user_id=user_id,
+                                          message_id=message.id or 0, content='I left!')
+        )
+
+
+@pytest.fixture
+def db():
+    return FakeDb(participants={(1, 1), (2, 1), (1, 2)})
+
+
+@pytest.fixture
+def nodes(db):
+    redis_client = FakeRedis()
+    nodes = []
+    Node(db=db, redis_client=redis_client, nodes=nodes)
+    Node(db=db, redis_client=redis_client, nodes=nodes)
+    return nodes
+
+
+async def subscribe(node: Node, user_id: int):
+    await node.redis_module.subscribe(type=RedisChannelType.USER, key=user_id)
+
+
+@pytest.mark.asyncio
+async def test_membership_is_read_once_per_user(nodes, db):
+    first, second = nodes
+    await subscribe(first, 1)
+    await subscribe(second, 1)
+
+    assert await first.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+    assert await first.chat_module.check_user_in_chat(chat_id=2, user_id=1)
+    assert await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+    assert not await second.chat_module.check_user_in_chat(chat_id=3, user_id=1)
+
+    assert db.membership_reads == 1
+    assert first.chat_module.membership_cache.get_stats().local_hits == 1
+    assert second.chat_module.membership_cache.get_stats().redis_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_no_stale_authorization_after_leave_on_other_node(nodes, db):
+    first, second = nodes
+    await subscribe(first, 1)
+    await subscribe(second, 1)
+    assert await first.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+    assert await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+
+    await first.leave(chat_id=1, user_id=1)
+
+    assert not await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+    assert not await first.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+    assert await second.chat_module.check_user_in_chat(chat_id=2, user_id=1)
+
+
+@pytest.mark.asyncio
+async def test_unsubscribed_node_checks_generation_in_redis(nodes, db):
+    first, second = nodes
+    await subscribe(first, 1)
+    assert await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+
+    # The second node misses the leave message, the bumped generation still invalidates the stored set
+    await first.leave(chat_id=1, user_id=1)
+
+    assert not await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+
+
+@pytest.mark.asyncio
+async def test_set_loaded_during_leave_is_not_kept(nodes, db):
+    first, second = nodes
+    await subscribe(second, 1)
+    cache = second.chat_module.membership_cache
+
+    async def load_then_leave():
+        chat_ids = [chat_id for chat_id, user_id in db.participants if user_id == 1]
+        await first.leave(chat_id=1, user_id=1)
+        return chat_ids
+
+    # The set read before the leave was committed answers the check in flight, but is neither kept nor reused
+    assert 1 in await cache.get_chat_ids(user_id=1, load=load_then_leave)
+    assert not await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+
+
+@pytest.mark.asyncio
+async def test_node_subscribed_to_other_users_does_not_keep_sets_it_hears_nothing_about(nodes, db):
+    first, second = nodes
+    await subscribe(first, 1)
+    await subscribe(second, 2)
+    assert await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+
+    await first.leave(chat_id=1, user_id=1)
+
+    assert not await second.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+
+
+@pytest.mark.asyncio
+async def test_losing_a_user_channel_drops_only_that_users_set(nodes, db):
+    first, _ = nodes
+    await subscribe(first, 1)
+    await subscribe(first, 2)
+    assert await first.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+    assert await first.chat_module.check_user_in_chat(chat_id=1, user_id=2)
+
+    await first.redis_module.unsubscribe(type=RedisChannelType.USER, key=2)
+
+    assert first.chat_module.membership_cache.get_stats().users == 1
+    assert await first.chat_module.check_user_in_chat(chat_id=1, user_id=1)
+    assert first.chat_module.membership_cache.get_stats().local_hits == 1
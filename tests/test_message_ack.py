@@ -0,0 +1,81 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import WebSocket
+from unittest.mock import AsyncMock, MagicMock
+
+from services.app.api.v1.websocket.handlers import NewMessageHandler
+from services.app.schemas import WsMessageType
+from services.backend.modules.message.schemas import BatchSentMessage, SentMessageBatch, SentMessage, MessageFull
+from services.backend.modules.user.schemas import UserBase
+
+USER = UserBase(id=1, name='first')
+TIMESTAMP = datetime(2026, 1, 1)
+
+
+class FakeMessageModule:
+    def __init__(self):
+        self.stored: dict[tuple[int, str], BatchSentMessage] = {}
+        self.send_message = AsyncMock(return_value=SentMessage(
+            message=MessageFull(id=100, chat_id=1, seq=100, user_id=USER.id, content='hi', timestamp=TIMESTAMP),
+            previous_chat_progress=-1,
+            chat_progress=100
+        ))
+
+    async def send_messages(self, user_id, messages) -> SentMessageBatch:
+        message = messages[0]
+        key = (message.chat_id, message.client_msg_id)
+        duplicate = key in self.stored
+        if not duplicate:
+            id = len(self.stored) + 1
+            self.stored[key] = BatchSentMessage(id=id, chat_id=message.chat_id, seq=id, user_id=user_id,
+                                                content=message.content, timestamp=TIMESTAMP,
+                                                client_msg_id=message.client_msg_id, duplicate=False)
+        stored = self.stored[key].model_copy(update={'duplicate': duplicate})
+        if duplicate:
+            return SentMessageBatch(messages=[stored], previous_chat_progress={}, chat_progress={})
+        return SentMessageBatch(messages=[stored], previous_chat_progress={message.chat_id: -1},
+                                chat_progress={message.chat_id: stored.id})
+
+
+@pytest.fixture
+def backend():
+    backend = MagicMock()
+    backend.message_module = FakeMessageModule()
+    backend.redis_module.publish = AsyncMock()
+    return backend
+
+
+def acks(websocket) -> list[dict]:
+    frames = [json.loads(call.args[0]) for call in websocket.send_text.await_args_list]
+    return [frame for frame in frames if frame['type'] == WsMessageType.MESSAGE_ACK.value]
+
+
+@pytest.mark.asyncio
+async def test_retransmit_is_acked_without_insert_or_broadcast(backend):
+    websocket = AsyncMock(spec=WebSocket)
+    message = {'type': 'message', 'chat_id': 1, 'content': 'hi', 'client_msg_id': 'abc'}
+
+    await NewMessageHandler()(backend=backend, user=USER, websocket=websocket, message=message)
+    published = backend.redis_module.publish.await_count
+    await NewMessageHandler()(backend=backend, user=USER, websocket=websocket, message=message)
+
+    first, second = acks(websocket)
+    assert (first['message_id'], first['duplicate']) == (1, False)
+    assert (second['message_id'], second['duplicate']) == (1, True)
+    assert second['client_msg_id'] == 'abc'
+    assert len(backend.message_module.stored) == 1
+    assert published == 3 and backend.redis_module.publish.await_count == published
+
+
+@pytest.mark.asyncio
+async def test_message_without_key_is_not_acked(backend):
+    websocket = AsyncMock(spec=WebSocket)
+
+    await NewMessageHandler()(backend=backend, user=USER, websocket=websocket,
+                              message={'type': 'message', 'chat_id': 1, 'content': 'hi'})
+
+    backend.message_module.send_message.assert_awaited_once()
+    assert acks(websocket) == []
+    assert backend.redis_module.publish.await_count == 3
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.app.api.v1 import message
+from services.app.exceptions import Forbidden
+from services.app.schemas import ChatTypeEnum
+from services.backend.modules.chat.schemas import ChatFull
+from services.backend.modules.message import MessageModule
+from services.backend.modules.message.archive import MessageArchive
+from services.backend.modules.message.schemas import MessageFull
+from services.backend.modules.user.schemas import UserBase
+
+USER = UserBase(id=1, name='first')
+
+
+def history(first: int, last: int) -> list[MessageFull]:
+    return [MessageFull(id=id, chat_id=1, seq=id, user_id=USER.id, content=f'message {id}, "quoted"',
+                        timestamp=datetime(2026, 1, 1)) for id in range(first, last + 1)]
+
+
+class FakeStreamResult:
+    def __init__(self, batches: list[list]):
+        self.batches = batches
+
+    async def partitions(self):
+        for batch in self.batches:
+            yield batch
+
+    async def scalars(self):
+        for batch in self.batches:
+            for value in batch:
+                yield value
+
+
+class FakeSession:
+    def __init__(self, blocks: list[bytes], hot: list[list[MessageFull]]):
+        self.blocks = blocks
+        self.hot = hot
+        self.isolation_level = None
+
+    async def connection(self, execution_options):
+        self.isolation_level = execution_options['isolation_level']
+
+    async def stream(self, query, params=None):
+        if 'message_archive' in str(query):
+            return FakeStreamResult([self.blocks])
+        return FakeStreamResult(self.hot)
+
+
+class FakeDb:
+    def __init__(self, session: FakeSession):
+        self.session = session
+
+    @asynccontextmanager
+    async def read_session_scope(self, *consistency_keys):
+        yield self.session
+
+
+@pytest.fixture
+def backend():
+    messages = history(1, 5)
+
+    async def export_messages(chat_id):
+        for start in range(0, len(messages), 2):
+            yield messages[start:start + 2]
+
+    backend = MagicMock()
+    backend.chat_module.get_chat = AsyncMock(return_value=ChatFull(id=1, name='chat', type=ChatTypeEnum.GROUP))
+    backend.chat_module.check_user_in_chat = AsyncMock(return_value=True)
+    backend.message_module.export_messages = export_messages
+    return backend
+
+
+async def body(response) -> list[str]:
+    return [chunk async for chunk in response.body_iterator]
+
+
+@pytest.mark.asyncio
+async def test_archived_messages_come_first_in_one_snapshot():
+    session = FakeSession(blocks=[MessageArchive._encode(history(1, 3)), MessageArchive._encode(history(4, 6))],
+                          hot=[history(7, 8), history(9, 9)])
+    message_module = MessageModule(db=FakeDb(session))
+
+    batches = [[m.id for m in messages] async for messages in message_module.export_messages(chat_id=1)]
+
+    assert batches == [[1, 2, 3], [4, 5, 6], [7, 8], [9]]
+    assert session.isolation_level == 'REPEATABLE READ'
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export_writes_a_chunk_per_batch(backend):
+    response = await message.export(backend=backend, user=USER, chat_id=1, format='ndjson')
+
+    chunks = await body(response)
+    assert response.media_type == 'application/x-ndjson'
+    assert len(chunks) == 3
+    assert [json.loads(line)['id'] for chunk in chunks for line in chunk.splitlines()] == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_csv_export_starts_with_header(backend):
+    response = await message.export(backend=backend, user=USER, chat_id=1, format='csv')
+
+    chunks = await body(response)
+    assert chunks[0] == 'id,chat_id,seq,user_id,content,timestamp\r\n'
+    rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+    assert [int(row['id']) for row in rows] == [1, 2, 3, 4, 5]
+    assert rows[0]['content'] == 'message 1, "quoted"'
+    assert response.headers['content-disposition'] == 'attachment; filename="chat-1.csv"'
+
+
+@pytest.mark.asyncio
+async def test_only_members_export(backend):
+    backend.chat_module.check_user_in_chat.return_value = False
+
+    with pytest.raises(Forbidden):
+        await message.export(backend=backend, user=USER, chat_id=1, format='ndjson')
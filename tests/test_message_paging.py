@@ -0,0 +1,109 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import MagicMock
+
+from services.backend.modules.message import MessageModule
+from services.backend.modules.message.archive import MessageArchive
+from services.backend.modules.message.module import MESSAGES_PAGE_QUERY, USER_MESSAGES_PAGE_QUERY
+from services.backend.modules.message.schemas import MessageFull
+
+CHAT_ID = 1
+MESSAGES = 30
+ARCHIVED = 18
+BLOCK_SIZE = 6
+MESSAGE_KEYS = ['id', 'chat_id', 'seq', 'user_id', 'content', 'timestamp']
+
+
+class FakeHistory:
+    # The chat with the oldest messages in archive blocks and the rest in the hot table, answering the queries
+    # of the page reads the way PostgreSQL would
+    def __init__(self):
+        self.messages = [
+            MessageFull(id=i, chat_id=CHAT_ID, seq=i, user_id=1 + i % 3 // 2, content=f'message {i}',
+                        timestamp=datetime(2020, 1, 1, second=i))
+            for i in range(1, MESSAGES + 1)
+        ]
+        self.hot = self.messages[ARCHIVED:]
+        self.blocks = [self.messages[start:start + BLOCK_SIZE] for start in range(0, ARCHIVED, BLOCK_SIZE)]
+        self.archive_reads = 0
+
+    @asynccontextmanager
+    async def read_session_scope(self, *consistency_keys):
+        yield self
+
+    async def execute(self, query, params=None):
+        result = MagicMock()
+        if query is MESSAGES_PAGE_QUERY or query is USER_MESSAGES_PAGE_QUERY:
+            rows = [message for message in reversed(self.hot)
+                    if query is MESSAGES_PAGE_QUERY or message.user_id == params['user_id']]
+            page = rows[params['offset']:params['offset'] + params['limit']]
+            result.keys.return_value = MESSAGE_KEYS
+            result.__iter__.return_value = [tuple(getattr(message, key) for key in MESSAGE_KEYS) for message in page]
+            return result
+        compiled = query.compile().params
+        if 'message_archive' in str(query):
+            self.archive_reads += 1
+            user_id = compiled.get('user_counts_1')
+            rows, running = [], 0
+            for block in reversed(self.blocks):
+                count = sum(user_id is None or str(message.user_id) == user_id for message in block)
+                running += count
+                if count > 0 and running > compiled['running_1'] and running - count < compiled['param_1']:
+                    rows.append(SimpleNamespace(payload=MessageArchive._encode(block), count=count, running=running))
+            result.all.return_value = rows
+            return result
+        user_id = compiled.get('user_id_1')
+        result.scalar_one.return_value = sum(user_id is None or message.user_id == user_id for message in self.hot)
+        return result
+
+    def expected(self, limit: int, offset: int, user_id: int | None = None) -> list[int]:
+        ids = [message.id for message in reversed(self.messages) if user_id is None or message.user_id == user_id]
+        return ids[offset:offset + limit]
+
+
+@pytest.fixture
+def history():
+    return FakeHistory()
+
+
+async def page(history: FakeHistory, limit: int, offset: int, user_id: int | None = None) -> list[int]:
+    messages = await MessageModule(db=history).get_messages(chat_id=CHAT_ID, user_id=user_id, limit=limit,
+                                                            offset=offset)
+    return [message.id for message in messages]
+
+
+@pytest.mark.asyncio
+async def test_page_of_hot_messages_does_not_read_the_archive(history):
+    assert await page(history, limit=10, offset=0) == list(range(30, 20, -1))
+    assert history.archive_reads == 0
+
+
+@pytest.mark.asyncio
+async def test_page_crossing_the_archive_boundary(history):
+    assert await page(history, limit=10, offset=5) == list(range(25, 15, -1))
+
+
+@pytest.mark.asyncio
+async def test_page_of_archived_messages_spans_blocks(history):
+    assert await page(history, limit=10, offset=15) == list(range(15, 5, -1))
+    assert await page(history, limit=10, offset=25) == list(range(5, 0, -1))
+    assert await page(history, limit=10, offset=30) == []
+
+
+@pytest.mark.asyncio
+async def test_pages_of_one_user_skip_the_others_in_both_tables(history):
+    assert await page(history, limit=5, offset=0, user_id=2) == history.expected(limit=5, offset=0, user_id=2)
+    assert await page(history, limit=5, offset=3, user_id=2) == history.expected(limit=5, offset=3, user_id=2)
+    assert await page(history, limit=5, offset=9, user_id=2) == history.expected(limit=5, offset=9, user_id=2)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('user_id', [None, 1, 2])
+async def test_every_page_matches_the_whole_history(history, user_id):
+    for limit in (1, 4, 7, 30):
+        for offset in range(0, MESSAGES + 1):
+            assert await page(history, limit=limit, offset=offset, user_id=user_id) == \
+                history.expected(limit=limit, offset=offset, user_id=user_id), (limit, offset)
@@ -0,0 +1,55 @@
+import pytest
+
+from services.cli.partition_messages import (get_rename_statements, copy_chunk_query, reconcile_queries,
+                                             CONSTRAINTS_QUERY)
+
+
+class FakeResult:
+    def __init__(self, names: list[str]):
+        self.names = names
+
+    def scalars(self):
+        return iter(self.names)
+
+
+class FakeSession:
+    def __init__(self, constraints: list[str], indexes: list[str]):
+        self.constraints = constraints
+        self.indexes = indexes
+
+    async def execute(self, query, params):
+        return FakeResult(self.constraints if query is CONSTRAINTS_QUERY else self.indexes)
+
+
+@pytest.mark.asyncio
+async def test_names_from_the_catalog_are_moved_to_the_new_table_name():
+    sess = FakeSession(constraints=['message_partitioned_pkey', 'uq_message_partitioned_chat_id_user_id_client_msg_id'],
+                       indexes=['ix_message_partitioned_content_tsv'])
+
+    statements = await get_rename_statements(sess, table='message_partitioned', old='message_partitioned',
+                                             new='message')
+
+    assert statements == [
+        'ALTER TABLE message_partitioned RENAME CONSTRAINT "message_partitioned_pkey" TO "message_pkey"',
+        'ALTER TABLE message_partitioned RENAME CONSTRAINT "uq_message_partitioned_chat_id_user_id_client_msg_id" '
+        'TO "uq_message_chat_id_user_id_client_msg_id"',
+        'ALTER INDEX "ix_message_partitioned_content_tsv" RENAME TO "ix_message_content_tsv"'
+    ]
+
+
+def test_copy_takes_the_columns_it_is_given():
+    query = str(copy_chunk_query(['id', 'chat_id', 'timestamp']))
+
+    assert 'INSERT INTO message_partitioned ("id", "chat_id", "timestamp")' in query
+    assert 'SELECT "id", "chat_id", "timestamp" FROM message' in query
+
+
+def test_reconciliation_matches_rows_by_key_and_compares_every_other_column():
+    queries = {name: ' '.join(str(query).split()) for name, query in reconcile_queries(['id', 'chat_id', 'content'])}
+
+    assert 'DELETE FROM message_partitioned p WHERE NOT EXISTS (SELECT FROM message m WHERE m.chat_id = p.chat_id ' \
+           'AND m.id = p.id)' in queries['extra']
+    assert 'INSERT INTO message_partitioned ("id", "chat_id", "content") SELECT m."id", m."chat_id", m."content" ' \
+           'FROM message m' in queries['missing']
+    assert 'SET ("content") = ROW(m."content")' in queries['changed']
+    assert 'ROW(p."content") IS DISTINCT FROM ROW(m."content")' in queries['changed']
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+
+import bcrypt
+import pytest
+
+from services.app.exceptions import ServiceUnavailable
+from services.backend.modules.authentication.hashing import PasswordHasher
+
+HASHED_PASSWORD = bcrypt.hashpw(b'password', bcrypt.gensalt(rounds=4)).decode()
+
+
+@pytest.mark.asyncio
+async def test_check_password():
+    hasher = PasswordHasher(workers=1, queue_size=1)
+
+    assert await hasher.check('password', HASHED_PASSWORD)
+    assert not await hasher.check('wrong', HASHED_PASSWORD)
+    assert hasher.get_stats().completed == 2
+
+
+@pytest.mark.asyncio
+async def test_saturated_pool_rejects():
+    hasher = PasswordHasher(workers=1, queue_size=1)
+    release = threading.Event()
+    blocked = [asyncio.create_task(hasher._run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(ServiceUnavailable):
+        await hasher.check('password', HASHED_PASSWORD)
+    # The event loop keeps running while the workers are busy
+    assert await asyncio.wait_for(asyncio.sleep(0, result=True), timeout=1)
+
+    release.set()
+    await asyncio.gather(*blocked)
+    assert await hasher.check('password', HASHED_PASSWORD)
+    stats = hasher.get_stats()
+    assert stats.rejected == 1
+    assert stats.max_pending == 2
+    assert stats.pending == 0
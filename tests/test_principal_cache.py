@@ -0,0 +1,113 @@
+from contextlib import asynccontextmanager
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from services.app.schemas import TokenType, TokenData
+from services.backend.exceptions import BackendServiceException
+from services.backend.modules.authentication import AuthenticationModule
+from services.backend.modules.authentication.principal_cache import PrincipalCache
+from services.backend.modules.authentication.revocation import get_token_digest
+from services.backend.modules.user.schemas import UserBase
+from services.db import Db
+
+
+class FakeRevocations:
+    def __init__(self):
+        self.in_sync = True
+        self.version = 0
+        self.revoked = set()
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    async def is_revoked(self, token: str) -> bool:
+        return token in self.revoked
+
+    async def revoke_many(self, tokens):
+        for token, expires_at in tokens:
+            self.revoked.add(token)
+            self.version += 1
+            for listener in self.listeners:
+                listener(get_token_digest(token))
+
+
+@pytest.fixture
+def db():
+    db = MagicMock(Db)
+    db.reads = 0
+
+    @asynccontextmanager
+    async def read_session_scope(*keys):
+        db.reads += 1
+        sess = MagicMock()
+
+        async def execute(query, params):
+            result = MagicMock()
+            result.keys.return_value = ['id', 'name']
+            result.__iter__.return_value = iter([(params['user_id'], 'first')])
+            return result
+
+        sess.execute = execute
+        yield sess
+
+    db.read_session_scope = read_session_scope
+    return db
+
+
+@pytest.fixture
+def auth_module(db):
+    return AuthenticationModule(db=db, revocations=FakeRevocations())
+
+
+@pytest.mark.asyncio
+async def test_repeated_requests_need_no_db(auth_module, db):
+    token = auth_module._create_token(data={'sub': '1'}, token_type=TokenType.ACCESS)
+
+    first = await auth_module.get_current_user(token)
+    second = await auth_module.get_current_user(token)
+
+    assert first == second == UserBase(id=1, name='first')
+    assert db.reads == 1
+    assert auth_module.principal_cache.get_stats().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_revoked_token_is_dropped(auth_module, db):
+    token = auth_module._create_token(data={'sub': '1'}, token_type=TokenType.ACCESS)
+    await auth_module.get_current_user(token)
+
+    await auth_module.logout(access_token=token, refresh_token=None)
+
+    with pytest.raises(BackendServiceException):
+        await auth_module.get_current_user(token)
+    assert auth_module.principal_cache.get_stats().invalidations == 1
+
+
+@pytest.mark.asyncio
+async def test_not_cached_when_revocations_changed_meanwhile(auth_module, db):
+    token = auth_module._create_token(data={'sub': '1'}, token_type=TokenType.ACCESS)
+    verify_token = auth_module._verify_token
+
+    async def verify_during_revocation(*args):
+        auth_module.revocations.version += 1
+        return await verify_token(*args)
+
+    auth_module._verify_token = verify_during_revocation
+    await auth_module.get_current_user(token)
+
+    assert auth_module.principal_cache.get_stats().principals == 0
+
+
+def test_entry_lives_until_token_expires():
+    cache = PrincipalCache(size=10, ttl=60)
+    user = UserBase(id=1, name='first')
+    with patch('services.backend.modules.authentication.principal_cache.time.time', return_value=1000.0):
+        cache.put(digest=b'short', token_data=TokenData(user_id=1), user=user, token_expires_at=1010)
+        cache.put(digest=b'long', token_data=TokenData(user_id=1), user=user, token_expires_at=5000)
+    with patch('services.backend.modules.authentication.principal_cache.time.time', return_value=1030.0):
+        assert cache.get(b'short') is None
+        assert cache.get(b'long').user == user
+    with patch('services.backend.modules.authentication.principal_cache.time.time', return_value=1061.0):
+        assert cache.get(b'long') is None
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock
+
+from services.app.exceptions import Forbidden
+from services.backend.modules.progress.coalescer import ReadProgressCoalescer
+from services.backend.modules.progress.schemas import ProgressUpdate
+from services.db import Db
+
+
+@pytest.fixture
+def coalescer():
+    coalescer = ReadProgressCoalescer(db=MagicMock(Db), flush_interval=0.001, max_batch=2)
+    coalescer.flushed = []
+
+    async def flush(rows):
+        coalescer.flushed.append(rows)
+        return {
+            (chat_id, user_id): ProgressUpdate(
+                chat_id=chat_id,
+                user_id=user_id,
+                last_read_message_id=last_read_message_id,
+                previous_chat_progress=-1,
+                chat_progress=last_read_message_id
+            )
+            for chat_id, user_id, last_read_message_id in rows if user_id != 99
+        }
+
+    coalescer._flush = flush
+    return coalescer
+
+
+@pytest.mark.asyncio
+async def test_updates_merge_to_maximum(coalescer):
+    results = await asyncio.gather(
+        coalescer.store(chat_id=1, user_id=1, last_read_message_id=10),
+        coalescer.store(chat_id=1, user_id=1, last_read_message_id=30),
+        coalescer.store(chat_id=1, user_id=1, last_read_message_id=20)
+    )
+
+    assert coalescer.flushed == [[(1, 1, 30)]]
+    assert [result.last_read_message_id for result in results] == [30, 30, 30]
+    assert coalescer.stats.updates == 3
+    assert coalescer.stats.coalesced == 2
+
+
+@pytest.mark.asyncio
+async def test_batches_are_split_and_ordered(coalescer):
+    await asyncio.gather(
+        coalescer.store(chat_id=2, user_id=1, last_read_message_id=5),
+        coalescer.store(chat_id=1, user_id=2, last_read_message_id=6),
+        coalescer.store(chat_id=1, user_id=1, last_read_message_id=7)
+    )
+
+    assert coalescer.flushed == [[(1, 1, 7), (1, 2, 6)], [(2, 1, 5)]]
+
+
+@pytest.mark.asyncio
+async def test_updates_during_flush_go_to_next_batch(coalescer):
+    first = asyncio.create_task(coalescer.store(chat_id=1, user_id=1, last_read_message_id=1))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(coalescer.store(chat_id=1, user_id=1, last_read_message_id=2))
+    await asyncio.gather(first, second)
+
+    assert coalescer.flushed == [[(1, 1, 1)], [(1, 1, 2)]]
+
+
+@pytest.mark.asyncio
+async def test_non_member_is_rejected(coalescer):
+    member, stranger = await asyncio.gather(
+        coalescer.store(chat_id=1, user_id=1, last_read_message_id=1),
+        coalescer.store(chat_id=1, user_id=99, last_read_message_id=1),
+        return_exceptions=True
+    )
+
+    assert member.last_read_message_id == 1
+    assert isinstance(stranger, Forbidden)
+
+
+@pytest.mark.asyncio
+async def test_flush_error_reaches_callers(coalescer):
+    async def broken_flush(rows):
+        raise ConnectionError('db is gone')
+
+    coalescer._flush = broken_flush
+    with pytest.raises(ConnectionError):
+        await coalescer.store(chat_id=1, user_id=1, last_read_message_id=1)
+    assert coalescer._pending == {}
+
+
+@pytest.mark.asyncio
+async def test_chat_progress_move_is_handed_to_one_caller_per_chat(coalescer):
+    coalescer.max_batch = 10
+    results = await asyncio.gather(
+        coalescer.store(chat_id=1, user_id=1, last_read_message_id=7),
+        coalescer.store(chat_id=1, user_id=2, last_read_message_id=7),
+        coalescer.store(chat_id=1, user_id=2, last_read_message_id=7),
+        coalescer.store(chat_id=2, user_id=1, last_read_message_id=5)
+    )
+
+    moved = [(result.chat_id, result.user_id) for result in results
+             if result.chat_progress > result.previous_chat_progress]
+    assert moved == [(1, 1), (2, 1)]
+    assert all(result.chat_progress == result.last_read_message_id for result in results)
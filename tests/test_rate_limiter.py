@@ -0,0 +1,87 @@
+import pytest
+import redis.asyncio as redis
+from unittest.mock import MagicMock, patch
+
+from services.app.schemas import WsMessageType
+from services.backend.modules.rate_limit import RateLimiter
+
+RATE, BURST = 2, 3
+
+
+class FakeScript:
+    # The token bucket of TOKEN_BUCKET_SCRIPT for one key, on a clock the test moves
+    def __init__(self):
+        self.now = 0.0
+        self.tokens: dict[str, tuple[float, float]] = {}
+        self.calls = 0
+        self.error: Exception | None = None
+
+    async def __call__(self, keys, args):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        rate, burst = args
+        tokens, ts = self.tokens.get(keys[0], (burst, self.now))
+        tokens = min(burst, tokens + (self.now - ts) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.tokens[keys[0]] = (tokens, self.now)
+        return [int(allowed), str(tokens)]
+
+
+@pytest.fixture
+def script():
+    return FakeScript()
+
+
+def limiter(script: FakeScript) -> RateLimiter:
+    redis_client = MagicMock()
+    redis_client.register_script.return_value = script
+    return RateLimiter(redis_client=redis_client, limits={WsMessageType.MESSAGE: (RATE, BURST)})
+
+
+@pytest.mark.asyncio
+async def test_limit_is_shared_by_instances(script):
+    first, second = limiter(script), limiter(script)
+
+    assert [await first.acquire(user_id=1, action=WsMessageType.MESSAGE) for _ in range(BURST)] == [0] * BURST
+    assert await second.acquire(user_id=1, action=WsMessageType.MESSAGE) == pytest.approx(1 / RATE)
+    assert await second.acquire(user_id=2, action=WsMessageType.MESSAGE) == 0
+    assert second.get_stats().redis_rejections == 1
+
+
+@pytest.mark.asyncio
+async def test_flood_is_rejected_without_redis_until_refill(script):
+    rate_limiter = limiter(script)
+    with patch('services.backend.modules.rate_limit.time.monotonic', return_value=0.0):
+        results = [await rate_limiter.acquire(user_id=1, action=WsMessageType.MESSAGE) for _ in range(100)]
+    assert results[:BURST] == [0] * BURST and all(results[BURST:])
+    assert script.calls == BURST
+
+    script.now = 0.5
+    with patch('services.backend.modules.rate_limit.time.monotonic', return_value=0.5):
+        assert await rate_limiter.acquire(user_id=1, action=WsMessageType.MESSAGE) == 0
+        assert await rate_limiter.acquire(user_id=1, action=WsMessageType.MESSAGE) > 0
+    assert script.calls == BURST + 1
+    assert rate_limiter.get_stats().local_rejections == 100 - BURST + 1
+
+
+@pytest.mark.asyncio
+async def test_instance_limits_alone_while_redis_is_down(script):
+    rate_limiter = limiter(script)
+    script.error = redis.ConnectionError('redis is gone')
+
+    with patch('services.backend.modules.rate_limit.time.monotonic', return_value=0.0):
+        results = [await rate_limiter.acquire(user_id=1, action=WsMessageType.MESSAGE) for _ in range(BURST + 1)]
+
+    assert results[:BURST] == [0] * BURST and results[BURST] > 0
+    assert rate_limiter.get_stats().redis_errors == BURST
+
+
+@pytest.mark.asyncio
+async def test_actions_without_limit_are_not_counted(script):
+    rate_limiter = limiter(script)
+
+    assert await rate_limiter.acquire(user_id=1, action=WsMessageType.USER_PROGRESS) == 0
+    assert script.calls == 0
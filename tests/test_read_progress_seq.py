@@ -0,0 +1,80 @@
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, delete, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from unittest.mock import patch
+
+from services.app.schemas import ChatTypeEnum
+from services.app.settings import settings
+from services.backend.modules.message.archive import MessageArchive
+from services.db import Db
+from services.db.models import User, Chat, ChatParticipant, Message, MessageArchiveBlock, ReadProgress
+
+# The seq lookup is done by the read_progress trigger, so this runs against the configured database
+ARCHIVE_SETTINGS = SimpleNamespace(MESSAGE_ARCHIVE_AFTER_DAYS=90, MESSAGE_ARCHIVE_BLOCK_SIZE=2,
+                                   MESSAGE_ARCHIVE_KEEP_LAST=2)
+
+
+@pytest_asyncio.fixture
+async def db():
+    db = Db(url=settings.get_db_url())
+    try:
+        async with db.engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+    except (OSError, SQLAlchemyError) as e:
+        await db.engine.dispose()
+        pytest.skip(f'Database is not available - {e!r}')
+    yield db
+    await db.engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def chat(db):
+    async with db.session_scope() as sess:
+        user = User(name='reader', email=f'{uuid.uuid4()}@test', password='-')
+        chat = Chat(name='archived', type=ChatTypeEnum.GROUP)
+        sess.add_all([user, chat])
+        await sess.flush()
+        sess.add(ChatParticipant(chat_id=chat.id, user_id=user.id))
+        sess.add_all([
+            Message(chat_id=chat.id, user_id=user.id, content=f'message {i}', timestamp=datetime(2020, 1, 1))
+            for i in range(5)
+        ])
+        chat_id, user_id = chat.id, user.id
+    yield chat_id, user_id
+    async with db.session_scope() as sess:
+        for model in (ReadProgress, MessageArchiveBlock, Message, ChatParticipant):
+            await sess.execute(delete(model).where(model.chat_id == chat_id))
+        await sess.execute(delete(Chat).where(Chat.id == chat_id))
+        await sess.execute(delete(User).where(User.id == user_id))
+
+
+@pytest.mark.asyncio
+async def test_progress_on_archived_messages_gets_their_seq(db, chat):
+    chat_id, user_id = chat
+    async with db.session_scope() as sess:
+        result = await sess.execute(select(Message.id, Message.seq).where(Message.chat_id == chat_id))
+        seqs = dict(result.all())
+    with patch('services.backend.modules.message.archive.settings', ARCHIVE_SETTINGS):
+        assert await MessageArchive(db).archive_chat(chat_id=chat_id, older_than=datetime(2021, 1, 1)) == 3
+
+    ids = sorted(seqs, key=seqs.get)
+    async with db.session_scope() as sess:
+        sess.add(ReadProgress(chat_id=chat_id, user_id=user_id, last_read_message_id=ids[1]))
+    progress_seqs = []
+    for message_id in (ids[1], ids[2], ids[4]):
+        async with db.session_scope() as sess:
+            await sess.execute(
+                update(ReadProgress)
+                .where(ReadProgress.chat_id == chat_id, ReadProgress.user_id == user_id)
+                .values(last_read_message_id=message_id)
+            )
+            progress_seqs.append(await sess.scalar(
+                select(ReadProgress.last_read_seq).where(ReadProgress.chat_id == chat_id)
+            ))
+
+    assert progress_seqs == [2, 3, 5]
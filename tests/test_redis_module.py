@@ -1,4 +1,5 @@
 import asyncio
+from datetime import datetime
 
 import pytest
 from unittest.mock import MagicMock, patch, AsyncMock
@@ -6,6 +7,8 @@ from unittest.mock import MagicMock, patch, AsyncMock
 from redis._parsers import Encoder
 from redis.asyncio.client import PubSub
 
+from services.backend.modules.message.history_cache import HistoryCache
+from services.backend.modules.message.schemas import MessageFull
 from services.backend.modules.redis import RedisModule
 from services.app.schemas import RedisChannelType, WsMessageType, ServerChatMessage, \
     ServerChatProgress, ServerNewUserMessage, ServerUserLeftMessage, ServerUserProgress, ServerWsMessage
@@ -218,4 +221,55 @@ async def test_publish(redis_module, mock_ws_module):
     message = ServerWsMessage(type=WsMessageType.MESSAGE, chat_id=chat_id)
     await redis_module.publish(type=channel_type, key=chat_id, message=message)
     channel = redis_module.get_channel(type=channel_type, key=chat_id)
-    redis_module.redis.publish.assert_awaited_once_with(channel, message.model_dump_json())
\ No newline at end of file
+    redis_module.redis.publish.assert_awaited_once_with(channel, message.model_dump_json())
+
+@pytest.mark.asyncio
+async def test_chat_messages_feed_history_cache(redis_module, mock_ws_module):
+    history_cache = HistoryCache(chats=10, size=10, ttl=60)
+    history_cache.set_enabled(True)
+    redis_module.set_websocket_module(mock_ws_module)
+    redis_module.add_listener(history_cache)
+    history_cache.seed(chat_id=1, messages=[
+        MessageFull(id=1, chat_id=1, seq=1, user_id=1, content='first', timestamp=datetime(2025, 1, 1))
+    ], last_seq=1)
+    chat_message = ServerChatMessage(
+        type=WsMessageType.MESSAGE,
+        chat_id=1,
+        user_id=2,
+        content='second',
+        message_id=2,
+        seq=2,
+        timestamp=datetime(2025, 1, 1)
+    )
+
+    with patch("services.backend.modules.redis.handlers.NewMessageHandler.__call__", new_callable=AsyncMock):
+        await redis_module._processor({
+            'channel': 'chat'.encode("utf-8"),
+            'data': chat_message.model_dump_json().encode("utf-8")
+        })
+    messages, count = history_cache.get_latest(chat_id=1, limit=2)
+    assert [message.content for message in messages] == ['second', 'first']
+    assert count == 2
+
+    with patch("services.backend.modules.redis.handlers.NewUserHandler.__call__", new_callable=AsyncMock):
+        await redis_module._processor({
+            'channel': 'chat'.encode("utf-8"),
+            'data': ServerNewUserMessage(
+                type=WsMessageType.NEW_USER, chat_id=1, user_id=3, message_id=3, content=''
+            ).model_dump_json().encode("utf-8")
+        })
+    assert history_cache.get_latest(chat_id=1, limit=1) is None
+
+
+@pytest.mark.asyncio
+async def test_losing_chat_channel_disables_history_cache(redis_module, mock_ws_module):
+    history_cache = HistoryCache(chats=10, size=10, ttl=60)
+    redis_module.add_listener(history_cache)
+    redis_module.pubsub.subscribe = AsyncMock()
+    redis_module.pubsub.unsubscribe = AsyncMock()
+    redis_module.run = AsyncMock()
+
+    await redis_module.subscribe(RedisChannelType.CHAT, 1)
+    assert history_cache.enabled
+    await redis_module.unsubscribe(RedisChannelType.CHAT, 1)
+    assert not history_cache.enabled
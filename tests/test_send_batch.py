@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.app.api.v1 import message
+from services.app.schemas import RedisChannelType, WsMessageType, ServerChatProgress
+from services.backend.modules.message import MessageModule
+from services.backend.modules.message.schemas import OutgoingMessage, BatchSentMessage, SentMessageBatch
+from services.backend.modules.redis import RedisModule
+from services.backend.modules.user.schemas import UserBase
+from services.db import Db
+
+USER = UserBase(id=1, name='bot')
+
+
+def sent_message(id: int, chat_id: int, client_msg_id: str, duplicate: bool = False) -> BatchSentMessage:
+    return BatchSentMessage(id=id, chat_id=chat_id, seq=id, user_id=USER.id, content=f'message {id}',
+                            timestamp=datetime(2026, 1, 1), client_msg_id=client_msg_id, duplicate=duplicate)
+
+
+@pytest.fixture
+def backend():
+    backend = MagicMock()
+    backend.message_module.send_messages = AsyncMock(return_value=SentMessageBatch(
+        messages=[
+            sent_message(1, chat_id=10, client_msg_id='a', duplicate=True),
+            sent_message(5, chat_id=10, client_msg_id='b'),
+            sent_message(6, chat_id=10, client_msg_id='c'),
+            sent_message(7, chat_id=20, client_msg_id='a')
+        ],
+        previous_chat_progress={10: 4, 20: 3},
+        chat_progress={10: 4, 20: 7}
+    ))
+    backend.redis_module.publish_many = AsyncMock()
+    return backend
+
+
+@pytest.mark.asyncio
+async def test_new_messages_are_published_in_one_call(backend):
+    outgoing = [OutgoingMessage(chat_id=m.chat_id, content=m.content, client_msg_id=m.client_msg_id)
+                for m in backend.message_module.send_messages.return_value.messages]
+
+    sent = await message.send_batch(messages=outgoing, backend=backend, user=USER)
+
+    assert [m.id for m in sent] == [1, 5, 6, 7]
+    backend.redis_module.publish_many.assert_awaited_once()
+    published = [(type, key, m.type, getattr(m, 'message_id', None) or m.last_read_message_id)
+                 for type, key, m in backend.redis_module.publish_many.await_args.args[0]]
+    # The duplicate was published by the send that stored it, chat 10 progress did not move
+    assert published == [
+        (RedisChannelType.CHAT, 10, WsMessageType.MESSAGE, 5),
+        (RedisChannelType.CHAT, 10, WsMessageType.MESSAGE, 6),
+        (RedisChannelType.CHAT, 20, WsMessageType.MESSAGE, 7),
+        (RedisChannelType.USER, USER.id, WsMessageType.USER_PROGRESS, 6),
+        (RedisChannelType.USER, USER.id, WsMessageType.USER_PROGRESS, 7),
+        (RedisChannelType.CHAT, 20, WsMessageType.CHAT_PROGRESS, 7)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_repeated_key_in_batch_is_rejected(backend):
+    outgoing = [OutgoingMessage(chat_id=10, content='first', client_msg_id='a'),
+                OutgoingMessage(chat_id=10, content='second', client_msg_id='a')]
+
+    with pytest.raises(HTTPException) as e:
+        await message.send_batch(messages=outgoing, backend=backend, user=USER)
+    assert e.value.status_code == 400
+    backend.message_module.send_messages.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retry_is_sent_again():
+    message_module = MessageModule(db=MagicMock(Db))
+    stored = SentMessageBatch(messages=[sent_message(1, chat_id=10, client_msg_id='a', duplicate=True)],
+                              previous_chat_progress={}, chat_progress={})
+    conflict = IntegrityError('INSERT', {}, Exception(
+        'duplicate key value violates unique constraint "uq_message_chat_id_user_id_client_msg_id"'))
+    message_module._send_messages = AsyncMock(side_effect=[conflict, stored])
+
+    outgoing = [OutgoingMessage(chat_id=10, content='message 1', client_msg_id='a')]
+    assert await message_module.send_messages(user_id=USER.id, messages=outgoing) == stored
+    assert message_module._send_messages.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_publish_many_uses_one_pipeline():
+    with patch('redis.asyncio.Redis'):
+        redis_module = RedisModule()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    redis_module.redis.pipeline.return_value.__aenter__.return_value = pipe
+    messages = [
+        (RedisChannelType.CHAT, 10, ServerChatProgress(
+            type=WsMessageType.CHAT_PROGRESS, chat_id=10, last_read_message_id=id))
+        for id in (5, 6)
+    ]
+
+    await redis_module.publish_many(messages)
+
+    channel = redis_module.get_channel(type=RedisChannelType.CHAT, key=10)
+    assert [call.args for call in pipe.publish.call_args_list] == [(channel, m.model_dump_json()) for _, _, m in messages]
+    pipe.execute.assert_awaited_once()
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import time
+
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from services.backend.modules.authentication.revocation import TokenRevocations, BloomFilter, get_token_digest, \
+    REVOKED_TOKEN_PREFIX, REVOCATION_CHANNEL
+
+
+class FakePubSub:
+    def __init__(self):
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        pass
+
+    async def get_message(self, ignore_subscribe_messages, timeout):
+        try:
+            message = await asyncio.wait_for(self.messages.get(), timeout)
+        except TimeoutError:
+            return None
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def aclose(self):
+        pass
+
+
+class FakePipeline:
+    def __init__(self):
+        self.commands = []
+        self.executed = []
+
+    def set(self, *args, **kwargs):
+        self.commands.append(('set', args, kwargs))
+
+    def publish(self, *args):
+        self.commands.append(('publish', args, {}))
+
+    async def execute(self):
+        self.executed.append(self.commands)
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+@pytest.fixture
+def redis_client():
+    client = MagicMock()
+    client.pubsub_instance = FakePubSub()
+    client.pubsub.return_value = client.pubsub_instance
+    client.keys = [REVOKED_TOKEN_PREFIX + get_token_digest('revoked before').hex()]
+    client.scans = 0
+    client.scan_released = asyncio.Event()
+    client.scan_released.set()
+
+    async def scan_iter(match, count):
+        client.scans += 1
+        for key in client.keys:
+            await client.scan_released.wait()
+            yield key.encode()
+
+    client.scan_iter = scan_iter
+    client.exists = AsyncMock(return_value=0)
+    client.pipeline_instance = FakePipeline()
+    client.pipeline.return_value = client.pipeline_instance
+    return client
+
+
+@pytest_asyncio.fixture
+async def revocations(redis_client):
+    revocations = TokenRevocations(redis_client=redis_client, capacity=1000, error_rate=0.001, rebuild_interval=60)
+    yield revocations
+    await revocations.stop()
+
+
+async def wait_for_sync(revocations: TokenRevocations):
+    await revocations.is_revoked('warm up')
+    for _ in range(100):
+        if revocations.in_sync:
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError('Token revocations did not sync')
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    digests = [get_token_digest(str(i)) for i in range(1000)]
+    for digest in digests:
+        bloom.add(digest)
+
+    assert all(digest in bloom for digest in digests)
+    false_positives = sum(get_token_digest(os.urandom(8).hex()) in bloom for _ in range(10_000))
+    assert false_positives < 300
+
+
+@pytest.mark.asyncio
+async def test_checks_go_to_redis_until_synced(revocations, redis_client):
+    redis_client.exists.return_value = 1
+
+    assert await revocations.is_revoked('some token')
+    redis_client.exists.assert_awaited_once_with(REVOKED_TOKEN_PREFIX + get_token_digest('some token').hex())
+
+
+@pytest.mark.asyncio
+async def test_synced_filter_answers_without_redis(revocations, redis_client):
+    await wait_for_sync(revocations)
+    redis_client.exists.reset_mock()
+
+    assert not await revocations.is_revoked('valid token')
+    redis_client.exists.assert_not_awaited()
+
+    redis_client.exists.return_value = 1
+    assert await revocations.is_revoked('revoked before')
+    redis_client.exists.assert_awaited_once()
+    assert revocations.get_stats().filter_negatives == 1
+
+
+@pytest.mark.asyncio
+async def test_revocations_of_other_instances_reach_filter(revocations, redis_client):
+    await wait_for_sync(revocations)
+    await redis_client.pubsub_instance.messages.put({
+        'type': 'message',
+        'data': get_token_digest('revoked elsewhere').hex().encode()
+    })
+    await asyncio.sleep(0.01)
+    redis_client.exists.reset_mock()
+
+    await revocations.is_revoked('revoked elsewhere')
+    redis_client.exists.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_revoke_expires_with_token(revocations, redis_client):
+    await wait_for_sync(revocations)
+    await revocations.revoke(token='token', expires_at=time.time() + 60)
+    await revocations.revoke(token='expired token', expires_at=time.time() - 1)
+
+    digest = get_token_digest('token').hex()
+    assert redis_client.pipeline_instance.executed == [[
+        ('set', (REVOKED_TOKEN_PREFIX + digest, 1), {'ex': 60}),
+        ('publish', (REVOCATION_CHANNEL, digest), {})
+    ]]
+    assert get_token_digest('token') in revocations._filter
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_revoked_in_one_round_trip(revocations, redis_client):
+    await revocations.revoke_many([('access', time.time() + 60), ('refresh', time.time() + 3600)])
+
+    assert len(redis_client.pipeline_instance.executed) == 1
+    assert [command for command, _, _ in redis_client.pipeline_instance.executed[0]] == \
+        ['set', 'publish', 'set', 'publish']
+    assert revocations.get_stats().revoked == 2
+
+
+@pytest.mark.asyncio
+async def test_lost_channel_falls_back_to_redis(revocations, redis_client):
+    await wait_for_sync(revocations)
+    await redis_client.pubsub_instance.messages.put(ConnectionError('redis is gone'))
+    await asyncio.sleep(0.01)
+
+    assert not revocations.in_sync
+    redis_client.exists.reset_mock()
+    await revocations.is_revoked('valid token')
+    redis_client.exists.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_revocations_of_other_instances_reach_filters_during_rebuild(redis_client):
+    revocations = TokenRevocations(redis_client=redis_client, capacity=1000, error_rate=0.001, rebuild_interval=0.01)
+    try:
+        await wait_for_sync(revocations)
+        redis_client.scan_released.clear()
+        while redis_client.scans < 2:
+            await asyncio.sleep(0.001)
+        await redis_client.pubsub_instance.messages.put({
+            'type': 'message',
+            'data': get_token_digest('revoked elsewhere').hex().encode()
+        })
+        await asyncio.sleep(0.01)
+        redis_client.exists.reset_mock()
+
+        await revocations.is_revoked('revoked elsewhere')
+        redis_client.exists.assert_awaited_once()
+
+        redis_client.scan_released.set()
+        while revocations.get_stats().rebuilds < 2:
+            await asyncio.sleep(0.001)
+        assert get_token_digest('revoked elsewhere') in revocations._filter
+    finally:
+        await revocations.stop()